@@ -0,0 +1,223 @@
+"""
+Streaming de la biblioteca de música (frontend/public/music) con peticiones Range.
+
+Cada pista se envía por trozos de AUDIO_CHUNK_KB leídos con aiofiles, sin cargar
+el fichero en memoria. Así muchos oyentes simultáneos no retienen cada uno la
+pista entera y un salto en el reproductor sólo descarga desde ese punto. (No se
+usa `http.response.zerocopysend`: uvicorn no la ofrece y el middleware HTTP de la
+app reenvía el cuerpo como mensajes normales.)
+
+- `Range: bytes=a-b` (también `a-` y `-n`): 206 con Content-Range; un rango fuera
+  del fichero, 416. Con varios rangos se responde la pista entera (200), que los
+  reproductores no piden y evita respuestas multipart.
+- ETag fuerte (tamaño y mtime) y Last-Modified: If-None-Match / If-Modified-Since
+  responden 304 sin cuerpo; If-Range que no coincide ignora el rango.
+- Cache-Control privado y de larga duración (las pistas requieren autenticación).
+"""
+import logging
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, Request
+from starlette.responses import Response
+
+from metrics import registry
+
+logger = logging.getLogger("audio_stream")
+
+MUSIC_DIR = os.getenv("MUSIC_DIR", os.path.join("frontend", "public", "music"))
+AUDIO_CHUNK_BYTES = int(os.getenv("AUDIO_CHUNK_KB", 64)) * 1024
+AUDIO_CACHE_MAX_AGE_S = int(os.getenv("AUDIO_CACHE_MAX_AGE_S", 7 * 24 * 3600))
+
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".m4a": "audio/mp4",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+}
+
+audio_bytes_sent = registry.counter(
+    "audio_bytes_sent_total", "Bytes de audio enviados, por código de estado (200 o 206)"
+)
+audio_responses = registry.counter(
+    "audio_responses_total", "Respuestas del streaming de audio por código de estado"
+)
+
+
+class AudioFile(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    media_type: str
+    etag: str
+    last_modified: str
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """
+    Rango (inicio, fin inclusivo) de una cabecera `Range: bytes=...`.
+    None si no hay cabecera, no es válida o pide varios rangos (se envía el fichero
+    entero); RangeNotSatisfiable si el rango queda fuera del fichero.
+    """
+    if not header:
+        return None
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # Sufijo: los últimos n bytes
+            length = int(last)
+            if length <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match: comparación débil (W/ se ignora), admite lista y "*" """
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _if_range_matches(header: str, audio: AudioFile) -> bool:
+    """If-Range exige comparación fuerte: un ETag débil nunca coincide"""
+    header = header.strip()
+    if header.startswith('"') or header.startswith("W/"):
+        return header == audio.etag
+    try:
+        return int(audio.mtime) == parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class AudioFileResponse(Response):
+    """Envía los bytes [start, end] del fichero por trozos, sin leerlo entero"""
+
+    def __init__(self, audio: AudioFile, status_code: int, headers: dict, start: int = 0, end: int = -1,
+                 send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=audio.media_type)
+        self.audio = audio
+        self.start = start
+        self.length = end - start + 1 if send_body else 0
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.length <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        sent = 0
+        try:
+            async with aiofiles.open(self.audio.path, "rb") as f:
+                await f.seek(self.start)
+                while sent < self.length:
+                    chunk = await f.read(min(AUDIO_CHUNK_BYTES, self.length - sent))
+                    if not chunk:
+                        # El fichero se ha truncado mientras se enviaba
+                        logger.warning(f"Pista truncada durante el envío: {self.audio.path}")
+                        break
+                    sent += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": sent < self.length})
+            if sent < self.length:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            audio_bytes_sent.inc(sent, status=str(self.status_code))
+
+
+class AudioLibrary:
+    def __init__(self, root: str = None):
+        self.root = os.path.realpath(root or MUSIC_DIR)
+
+    def resolve(self, relative_path: str) -> str:
+        """Ruta absoluta de una pista; 404 si sale de la biblioteca o no es un formato de audio"""
+        path = os.path.realpath(os.path.join(self.root, relative_path.lstrip("/")))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise HTTPException(status_code=404, detail="Pista no encontrada")
+        if os.path.splitext(path)[1].lower() not in AUDIO_MEDIA_TYPES:
+            raise HTTPException(status_code=404, detail="Pista no encontrada")
+        return path
+
+    async def stat(self, relative_path: str) -> AudioFile:
+        path = self.resolve(relative_path)
+        try:
+            st = await aiofiles.os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise HTTPException(status_code=404, detail="Pista no encontrada")
+        if not stat.S_ISREG(st.st_mode):
+            raise HTTPException(status_code=404, detail="Pista no encontrada")
+        return AudioFile(
+            path=path,
+            size=st.st_size,
+            mtime=st.st_mtime,
+            media_type=AUDIO_MEDIA_TYPES[os.path.splitext(path)[1].lower()],
+            etag=f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+            last_modified=formatdate(st.st_mtime, usegmt=True)
+        )
+
+    async def response(self, request: Request, relative_path: str) -> Response:
+        audio = await self.stat(relative_path)
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": audio.etag,
+            "last-modified": audio.last_modified,
+            "cache-control": f"private, max-age={AUDIO_CACHE_MAX_AGE_S}",
+        }
+
+        # Peticiones condicionales: If-None-Match tiene prioridad sobre If-Modified-Since
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if (if_none_match and etag_matches(if_none_match, audio.etag)) or \
+                (not if_none_match and if_modified_since and _not_modified_since(if_modified_since, audio.mtime)):
+            audio_responses.inc(status="304")
+            return Response(status_code=304, headers=headers)
+
+        send_body = request.method != "HEAD"
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and if_range and not _if_range_matches(if_range, audio):
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, audio.size)
+        except RangeNotSatisfiable:
+            audio_responses.inc(status="416")
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{audio.size}"})
+
+        if byte_range is None:
+            audio_responses.inc(status="200")
+            return AudioFileResponse(audio, 200, headers, 0, audio.size - 1, send_body)
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{audio.size}"
+        audio_responses.inc(status="206")
+        return AudioFileResponse(audio, 206, headers, start, end, send_body)
+
+
+music_library = AudioLibrary()
@@ -0,0 +1,132 @@
+"""
+Buffer write-behind para los eventos de auditoría de login.
+
+Los handlers de login registran el evento en memoria sin esperar a MongoDB; una
+tarea en segundo plano los escribe con insert_many(ordered=False) cuando se
+acumulan `flush_size` eventos o pasan `flush_interval` segundos. La memoria está
+acotada a `max_events`; al llenarse se aplica la política de desbordamiento:
+  - drop_oldest: descarta el evento más antiguo (por defecto)
+  - drop_newest: descarta el evento nuevo
+Al apagar la aplicación se vacía el buffer. Los listeners registrados con
+add_listener reciben cada lote después de escribirlo.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+
+logger = logging.getLogger("audit_buffer")
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+
+
+class AuditBuffer:
+    def __init__(self, flush_size: int = None, flush_interval: float = None,
+                 max_events: int = None, overflow_policy: str = None):
+        self.flush_size = flush_size or int(os.getenv("AUDIT_FLUSH_SIZE", 100))
+        self.flush_interval = flush_interval or float(os.getenv("AUDIT_FLUSH_INTERVAL_S", 1.0))
+        self.max_events = max_events or int(os.getenv("AUDIT_MAX_EVENTS", 10000))
+        self.overflow_policy = overflow_policy or os.getenv("AUDIT_OVERFLOW_POLICY", "drop_oldest")
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            logger.warning(f"Política de desbordamiento desconocida '{self.overflow_policy}', se usa 'drop_oldest'")
+            self.overflow_policy = "drop_oldest"
+
+        self._events = deque()
+        self._collection = None
+        self._flush_task = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._listeners = []
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def add_listener(self, callback):
+        """Registra `async callback(batch)`, llamado con cada lote escrito correctamente"""
+        self._listeners.append(callback)
+
+    def record(self, event: dict) -> bool:
+        """Encola un evento sin esperar a la base de datos; devuelve False si se descartó"""
+        if len(self._events) >= self.max_events:
+            self.dropped += 1
+            if self.overflow_policy == "drop_newest":
+                return False
+            self._events.popleft()
+
+        self._events.append(event)
+        self.recorded += 1
+
+        if len(self._events) >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    def start(self, collection):
+        """Arranca la tarea de escritura en segundo plano sobre la colección indicada"""
+        self._collection = collection
+        if self._flush_task is None:
+            self._closing = False
+            self._flush_task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Escribe todos los eventos pendientes en lotes de flush_size"""
+        while self._events and self._collection is not None:
+            batch = [self._events.popleft() for _ in range(min(self.flush_size, len(self._events)))]
+            try:
+                # insert_many añade _id a los documentos; los listeners reciben copias sin él
+                await self._collection.insert_many([dict(event) for event in batch], ordered=False)
+                self.flushed += len(batch)
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Error al escribir {len(batch)} eventos de auditoría: {str(e)}")
+                # Devolver el lote al principio de la cola (respetando el límite) y reintentar más tarde
+                room = self.max_events - len(self._events)
+                if room < len(batch):
+                    self.dropped += len(batch) - room
+                    batch = batch[len(batch) - room:] if room > 0 else []
+                self._events.extendleft(reversed(batch))
+                break
+            for callback in self._listeners:
+                try:
+                    await callback(batch)
+                except Exception as e:
+                    logger.error(f"Error en listener de auditoría: {str(e)}")
+
+    async def close(self):
+        """Detiene la tarea en segundo plano y vacía el buffer"""
+        if self._flush_task is not None:
+            # Sin cancelar: un insert_many en curso termina (o devuelve su lote a la
+            # cola) antes de que la tarea salga del bucle
+            self._closing = True
+            self._wakeup.set()
+            await self._flush_task
+            self._flush_task = None
+        await self.flush()
+        if self._events:
+            logger.warning(f"Quedaron {len(self._events)} eventos de auditoría sin escribir al cerrar")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._events),
+            "max_events": self.max_events,
+            "flush_size": self.flush_size,
+            "flush_interval_s": self.flush_interval,
+            "overflow_policy": self.overflow_policy,
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes
+        }
+
+
+# Instancia global del buffer de auditoría
+audit_buffer = AuditBuffer()
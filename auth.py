@@ -18,6 +18,7 @@ class UserRole(str, Enum):
     NORMAL = "normal"
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -30,11 +31,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return decode_access_token(token)
+
+async def get_stream_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    access_token: Optional[str] = None
+):
+    """
+    Como get_current_user, pero el token también puede ir en `?access_token=`:
+    un elemento <audio> no puede enviar la cabecera Authorization.
+    """
+    return decode_access_token(token or access_token)
+
+def decode_access_token(token: Optional[str]):
     credentials_exception = HTTPException(
         status_code=401,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -0,0 +1,179 @@
+"""
+Streaming de audio: oyentes simultáneos descargando pistas enteras o saltando.
+
+Arranca `uvicorn main:app` (las pistas no necesitan MongoDB) y lanza --listeners
+clientes a la vez contra GET /api/music/... en tres fases:
+
+    full     cada oyente descarga la pista completa (primera reproducción)
+    seek     cada oyente pide --seeks rangos de --range-kb en posiciones
+             aleatorias (saltos en la barra de progreso)
+    revalidate  peticiones condicionales con el ETag ya conocido (304 sin cuerpo)
+
+Informa de la latencia hasta el primer byte y total (p50/p95), los bytes recibidos
+y el pico de memoria privada (USS) del servidor durante cada fase, muestreado en
+/proc: con lectura por trozos no debe crecer con el número de oyentes ni con el
+tamaño de las pistas.
+
+Uso:
+    python bench_audio_stream.py --listeners 50
+    python bench_audio_stream.py --listeners 200 --seeks 4 --range-kb 256 --json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+
+import httpx
+
+from audio_stream import AUDIO_MEDIA_TYPES, MUSIC_DIR
+from bench_utils import latency_summary, print_report
+from serve import process_memory
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger("bench_audio_stream")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+SECRET_KEY = "bench-audio-secret"
+
+
+def list_tracks(root: str) -> list:
+    """(ruta relativa, tamaño) de cada pista de la biblioteca"""
+    tracks = []
+    for directory, _, files in os.walk(root):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in AUDIO_MEDIA_TYPES:
+                path = os.path.join(directory, name)
+                tracks.append((os.path.relpath(path, root).replace(os.sep, "/"), os.path.getsize(path)))
+    return tracks
+
+
+async def timed_get(client: httpx.AsyncClient, url: str, headers: dict) -> tuple:
+    """(status, ms hasta el primer byte, ms totales, bytes recibidos)"""
+    start = time.perf_counter()
+    first_byte_ms, received = None, 0
+    async with client.stream("GET", url, headers=headers) as response:
+        async for chunk in response.aiter_raw():
+            if first_byte_ms is None:
+                first_byte_ms = (time.perf_counter() - start) * 1000
+            received += len(chunk)
+    total_ms = (time.perf_counter() - start) * 1000
+    return response.status_code, first_byte_ms if first_byte_ms is not None else total_ms, total_ms, received
+
+
+async def sample_memory(pid: int, stop: asyncio.Event, peak: dict):
+    while not stop.is_set():
+        peak["uss_kb"] = max(peak.get("uss_kb", 0), process_memory(pid).get("uss_kb", 0))
+        await asyncio.sleep(0.02)
+
+
+async def run_phase(client, name: str, requests: list, pid: int) -> dict:
+    baseline = process_memory(pid).get("uss_kb", 0)
+    stop, peak = asyncio.Event(), {}
+    sampler = asyncio.create_task(sample_memory(pid, stop, peak))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_get(client, url, headers) for url, headers in requests))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    statuses = {}
+    for status, *_ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ttfb = latency_summary([r[1] for r in results])
+    total = latency_summary([r[2] for r in results])
+    received = sum(r[3] for r in results)
+    return {
+        "phase": name,
+        "requests": len(results),
+        "ttfb_p50_ms": ttfb["p50_ms"],
+        "ttfb_p95_ms": ttfb["p95_ms"],
+        "total_p50_ms": total["p50_ms"],
+        "total_p95_ms": total["p95_ms"],
+        "received_mb": round(received / 1024 / 1024, 1),
+        "mb_per_s": round(received / 1024 / 1024 / elapsed, 1),
+        "server_uss_delta_mb": round((peak.get("uss_kb", baseline) - baseline) / 1024, 1),
+        "statuses": statuses
+    }
+
+
+async def wait_live(client: httpx.AsyncClient, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            # /health responde (503 incluido) en cuanto la app acepta peticiones; no hace falta MongoDB
+            await client.get("/health")
+            return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise SystemExit(f"El servidor no respondió en {timeout}s")
+
+
+async def main(args):
+    tracks = list_tracks(args.music_dir)
+    if not tracks:
+        raise SystemExit(f"No hay pistas en {args.music_dir}")
+    env = dict(os.environ, SECRET_KEY=SECRET_KEY, MUSIC_DIR=args.music_dir, LOG_FILE="", LOG_LEVEL="WARNING",
+               FACE_INDEX_PATH="", FACE_WORKERS="1")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port), "--no-access-log"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        os.environ["SECRET_KEY"] = SECRET_KEY
+        from auth import create_access_token
+        token = create_access_token({"sub": "bench_audio", "role": "normal"})
+        auth = {"Authorization": f"Bearer {token}"}
+        limits = httpx.Limits(max_connections=args.listeners, max_keepalive_connections=args.listeners)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout, limits=limits) as client:
+            await wait_live(client, args.ready_timeout)
+            rng = random.Random(args.seed)
+            picks = [tracks[i % len(tracks)] for i in range(args.listeners)]
+
+            full = [(f"/api/music/{path}", auth) for path, _ in picks]
+            seek = []
+            range_bytes = args.range_kb * 1024
+            for path, size in picks:
+                for _ in range(args.seeks):
+                    offset = rng.randrange(0, max(size - range_bytes, 1))
+                    seek.append((f"/api/music/{path}", {**auth, "Range": f"bytes={offset}-{offset + range_bytes - 1}"}))
+            etags = {path: (await client.head(f"/api/music/{path}", headers=auth)).headers.get("etag") for path, _ in tracks}
+            revalidate = [(f"/api/music/{path}", {**auth, "If-None-Match": etags[path]}) for path, _ in picks]
+
+            rows = [
+                await run_phase(client, "full", full, server.pid),
+                await run_phase(client, "seek", seek, server.pid),
+                await run_phase(client, "revalidate", revalidate, server.pid),
+            ]
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    if not args.json:
+        rows = [{**row, "statuses": json.dumps(row["statuses"])} for row in rows]
+    print_report(f"Streaming de audio: {args.listeners} oyentes simultáneos, {len(tracks)} pistas", rows, as_json=args.json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--music-dir", default=MUSIC_DIR)
+    parser.add_argument("--listeners", type=int, default=50)
+    parser.add_argument("--seeks", type=int, default=3, help="Saltos por oyente en la fase seek")
+    parser.add_argument("--range-kb", type=int, default=256, help="Tamaño de cada rango pedido en un salto")
+    parser.add_argument("--port", type=int, default=8791)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--ready-timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
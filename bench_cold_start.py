@@ -0,0 +1,88 @@
+"""
+Medición del arranque en frío del servidor.
+
+Lanza `uvicorn main:app` en un proceso nuevo y sondea cada pocos milisegundos:
+
+    live_s      primera respuesta HTTP de /health (el proceso acepta peticiones)
+    health_s    /health responde 200 (MongoDB conectada)
+    ready_s     /ready responde 200 (MongoDB, modelos precargados e índice facial)
+
+Los tiempos se cuentan desde el lanzamiento del proceso. Además se incluye el
+desglose que el propio servidor publica en /ready (`cold_start`: import de
+main.py, fase live y momento en que cada componente quedó listo).
+
+Uso:
+    python bench_cold_start.py --runs 3
+    python bench_cold_start.py --runs 5 --env FACE_WORKERS=2 --json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench_utils import print_report
+
+
+def wait_for(client, path: str, deadline: float, ok_only: bool, poll_s: float):
+    """Segundos hasta que path responde (o responde 200 si ok_only); None si vence el plazo"""
+    while time.perf_counter() < deadline:
+        try:
+            response = client.get(path)
+            if not ok_only or response.status_code == 200:
+                return response
+        except httpx.TransportError:
+            pass
+        time.sleep(poll_s)
+    return None
+
+
+def run_once(args, port: int) -> dict:
+    env = dict(os.environ)
+    for item in args.env:
+        key, value = item.split("=", 1)
+        env[key] = value
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    row = {"live_s": None, "health_s": None, "ready_s": None}
+    try:
+        deadline = start + args.timeout
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2.0) as client:
+            for key, path, ok_only in (("live_s", "/health", False), ("health_s", "/health", True), ("ready_s", "/ready", True)):
+                response = wait_for(client, path, deadline, ok_only, args.poll_ms / 1000)
+                if response is None:
+                    break
+                row[key] = round(time.perf_counter() - start, 3)
+            if row["ready_s"] is not None:
+                row.update({f"server_{k}": v for k, v in client.get("/ready").json()["cold_start"].items()})
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return row
+
+
+def main(args):
+    rows = []
+    for run in range(args.runs):
+        rows.append({"run": run + 1, **run_once(args, args.port)})
+    print_report(f"Arranque en frío de uvicorn main:app ({' '.join(args.env) or 'configuración por defecto'})", rows, as_json=args.json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=180.0, help="Plazo máximo por arranque")
+    parser.add_argument("--poll-ms", type=float, default=20.0)
+    parser.add_argument("--env", nargs="*", default=[], help="Variables extra para el servidor, p. ej. FACE_WORKERS=2")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+    main(args)
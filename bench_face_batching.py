@@ -0,0 +1,88 @@
+"""
+Informe de latencia/rendimiento del planificador de micro-lotes.
+
+Lanza ráfagas de logins simultáneos contra FaceBatchScheduler para una matriz de
+tamaños de lote y ventanas de espera, y muestra throughput y percentiles de
+latencia para elegir FACE_BATCH_MAX_SIZE y FACE_BATCH_MAX_WAIT_MS.
+
+Uso:
+    python bench_face_batching.py --image foto.jpg --concurrency 32 --rounds 5
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from bench_utils import load_image_bytes, latency_summary, print_report
+from face_batcher import FaceBatchScheduler
+from face_pipeline import process_login_image
+from face_worker import FaceWorkerPool
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+
+
+async def run_config(pool, contents, batch_size, wait_ms, concurrency, rounds):
+    scheduler = FaceBatchScheduler(process_login_image, pool=pool, max_batch_size=batch_size, max_wait_ms=wait_ms)
+    latencies = []
+    errors = 0
+
+    async def one_request():
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            await scheduler.submit(contents)
+        except Exception:
+            # Una imagen sin rostro detectado cuenta como error pero su coste de CPU es real
+            errors += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(one_request() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    summary = latency_summary(latencies)
+    return {
+        "batch_size": batch_size,
+        "wait_ms": wait_ms,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"],
+        "avg_batch": scheduler.stats()["avg_batch_size"]
+    }
+
+
+async def main(args):
+    contents = load_image_bytes(args.image)
+    pool = FaceWorkerPool(max_workers=args.workers, max_queue=args.concurrency * args.rounds)
+    pool.start()
+    try:
+        # Calentar los procesos antes de medir
+        await pool.warm_up()
+        rows = []
+        for batch_size in args.batch_sizes:
+            for wait_ms in (args.wait_ms if batch_size > 1 else [0]):
+                rows.append(await run_config(pool, contents, batch_size, wait_ms, args.concurrency, args.rounds))
+        print_report("Micro-lotes de reconocimiento facial", rows, as_json=args.json)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Imagen con un rostro (por defecto se genera una sintética)")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos del pool (por defecto FACE_WORKERS o núcleos)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Peticiones simultáneas por ráfaga")
+    parser.add_argument("--rounds", type=int, default=5, help="Número de ráfagas por configuración")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""
+Benchmark de la detección reducida frente al comportamiento anterior.
+
+Para cada resolución compara:
+  - legacy: HOG a resolución completa con upsample=2 y reintento con upsample=3
+  - scaled: detect_faces_scaled (copia reducida, upsample adaptativo, cajas remapeadas)
+
+Informa la latencia media/p95 de cada método y el recall de scaled respecto a
+legacy (rostros de legacy que scaled también encuentra con IoU >= 0.5).
+
+Uso:
+    python bench_face_detection.py --images carpeta_con_fotos/ --sizes 640x480 1280x720 1920x1080
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench_utils import synthetic_face_image, latency_summary, print_report
+from face_pipeline import detect_faces, detect_faces_scaled, detection_plan
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+
+
+def iou(a, b):
+    top, right, bottom, left = max(a[0], b[0]), min(a[1], b[1]), min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union else 0.0
+
+
+def load_images(directory):
+    if not directory:
+        return [Image.open(io.BytesIO(synthetic_face_image((1920, 1080)))).convert('RGB')]
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            images.append(Image.open(os.path.join(directory, name)).convert('RGB'))
+    return images
+
+
+def main(args):
+    images = load_images(args.images)
+    rows = []
+    for size_arg in args.sizes:
+        size = tuple(int(v) for v in size_arg.lower().split("x"))
+        legacy_ms, scaled_ms = [], []
+        legacy_faces = matched = 0
+
+        for original in images:
+            image = original.resize(size, Image.BILINEAR)
+
+            start = time.perf_counter()
+            legacy = detect_faces(np.array(image), upsample=2, retry_upsample=3)
+            legacy_ms.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            scaled = detect_faces_scaled(image, retry=True)
+            scaled_ms.append((time.perf_counter() - start) * 1000)
+
+            legacy_faces += len(legacy)
+            matched += sum(1 for box in legacy if any(iou(box, other) >= 0.5 for other in scaled))
+
+        scale, upsample = detection_plan(size)
+        legacy_summary, scaled_summary = latency_summary(legacy_ms), latency_summary(scaled_ms)
+        rows.append({
+            "resolution": size_arg,
+            "plan": f"x{scale:.2f} up{upsample}",
+            "legacy_mean_ms": legacy_summary["mean_ms"],
+            "legacy_p95_ms": legacy_summary["p95_ms"],
+            "scaled_mean_ms": scaled_summary["mean_ms"],
+            "scaled_p95_ms": scaled_summary["p95_ms"],
+            "speedup": round(legacy_summary["mean_ms"] / scaled_summary["mean_ms"], 2) if scaled_summary["mean_ms"] else None,
+            "legacy_faces": legacy_faces,
+            "recall_vs_legacy": round(matched / legacy_faces, 3) if legacy_faces else None
+        })
+
+    print_report(f"Detección reducida vs. legacy ({len(images)} imágenes)", rows, as_json=args.json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Carpeta con fotos de rostros (por defecto una imagen sintética)")
+    parser.add_argument("--sizes", nargs="+", default=["320x240", "640x480", "1280x720", "1920x1080"])
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    main(parser.parse_args())
@@ -0,0 +1,168 @@
+"""
+Micro-benchmark de cada etapa que atraviesa una imagen subida.
+
+Aísla los pasos del pipeline (los mismos que hacía main.py en línea) y mide cada
+uno por separado sobre una matriz de tamaños y formatos:
+
+    open         Image.open (sólo lee la cabecera)
+    load         decodificación de los píxeles
+    convert      convert('RGB')
+    brightness   ImageEnhance.Brightness(...).enhance(1.2)
+    contrast     ImageEnhance.Contrast(...).enhance(1.3)
+    np_array     np.array(imagen)
+    hog_up1..3   face_recognition.face_locations con upsample 1, 2 y 3
+    encodings    face_recognition.face_encodings del primer rostro
+
+Cada etapa recibe ya preparada la salida de la anterior, de modo que sólo se
+cronometra ella. Se informa de la latencia (media, p50, p95) y de la memoria
+pico de una ejecución aislada: `peak_py_kb` con tracemalloc (incluye los
+buffers de numpy) y `peak_rss_kb` como crecimiento del pico de RSS (VmHWM,
+sólo en Linux; cubre también la memoria de PIL y dlib).
+
+Si face_recognition no está instalado se miden sólo las etapas de PIL/numpy.
+
+Uso:
+    python bench_image_stages.py --sizes 640x480 1280x720 1920x1080 --formats JPEG PNG --repeat 20
+    python bench_image_stages.py --image foto.jpg --upsamples 1 2 --json
+"""
+import argparse
+import io
+import logging
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from bench_utils import latency_summary, measure_peak_memory, print_report, synthetic_face_image
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger("bench_image_stages")
+
+
+def source_image(path: str, size: tuple, fmt: str) -> bytes:
+    """La foto indicada redimensionada a size, o un rostro sintético, codificada en fmt"""
+    if not path:
+        return synthetic_face_image(size, fmt)
+    image = Image.open(path).convert('RGB').resize(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _memory_child(contents: bytes, upsamples: list, stage: str, results):
+    """Proceso nuevo por medición: el heap no está "caliente" y el pico de RSS es fiable"""
+    stages = {name: (fn, arg) for name, fn, arg in build_stages(contents, upsamples, _import_face_recognition())}
+    fn, arg = stages[stage]
+    results.put(measure_peak_memory(fn, arg))
+
+
+def measure_memory(contents: bytes, upsamples: list, stage: str) -> dict:
+    """Memoria pico de una ejecución aislada de la etapa"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_memory_child, args=(contents, upsamples, stage, results))
+    process.start()
+    try:
+        return results.get(timeout=600)
+    finally:
+        process.join()
+
+
+def measure_time(fn, arg, repeat: int) -> dict:
+    fn(arg)  # calentamiento
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        samples.append((time.perf_counter() - start) * 1000)
+    summary = latency_summary(samples)
+    return {"mean_ms": summary["mean_ms"], "p50_ms": summary["p50_ms"], "p95_ms": summary["p95_ms"]}
+
+
+def build_stages(contents: bytes, upsamples: list, face_recognition) -> list:
+    """(nombre, función, entrada) de cada etapa; la entrada es la salida de la etapa previa"""
+    def load(data):
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    opened = load(contents)
+    rgb = opened.convert('RGB')
+    brightened = ImageEnhance.Brightness(rgb).enhance(1.2)
+    enhanced = ImageEnhance.Contrast(brightened).enhance(1.3)
+    np_image = np.array(enhanced)
+
+    stages = [
+        ("open", lambda data: Image.open(io.BytesIO(data)), contents),
+        ("load", load, contents),
+        ("convert", lambda image: image.convert('RGB'), opened),
+        ("brightness", lambda image: ImageEnhance.Brightness(image).enhance(1.2), rgb),
+        ("contrast", lambda image: ImageEnhance.Contrast(image).enhance(1.3), brightened),
+        ("np_array", np.array, enhanced),
+    ]
+    if face_recognition is None:
+        return stages
+
+    for upsample in upsamples:
+        stages.append((
+            f"hog_up{upsample}",
+            lambda array, upsample=upsample: face_recognition.face_locations(array, model='hog', number_of_times_to_upsample=upsample),
+            np_image
+        ))
+
+    # Codificar el primer rostro detectado o, si no hay, una caja centrada del tamaño típico
+    locations = face_recognition.face_locations(np_image, model='hog', number_of_times_to_upsample=1)
+    if not locations:
+        height, width = np_image.shape[:2]
+        side = int(min(width, height) * 0.5)
+        top, left = (height - side) // 2, (width - side) // 2
+        locations = [(top, left + side, top + side, left)]
+    stages.append(("encodings", lambda array: face_recognition.face_encodings(array, locations[:1]), np_image))
+    return stages
+
+
+def _import_face_recognition():
+    try:
+        import face_recognition
+        return face_recognition
+    except ImportError:
+        return None
+
+
+def main(args):
+    face_recognition = _import_face_recognition()
+    if face_recognition is None:
+        logger.warning("face_recognition no está instalado: se omiten las etapas hog_* y encodings")
+
+    rows = []
+    for size_arg in args.sizes:
+        size = tuple(int(v) for v in size_arg.lower().split("x"))
+        for fmt in args.formats:
+            contents = source_image(args.image, size, fmt)
+            for name, fn, arg in build_stages(contents, args.upsamples, face_recognition):
+                rows.append({
+                    "size": size_arg,
+                    "format": fmt,
+                    "input_kb": round(len(contents) / 1024, 1),
+                    "stage": name,
+                    **measure_time(fn, arg, args.repeat),
+                    **measure_memory(contents, args.upsamples, name)
+                })
+    print_report(f"Etapas del pipeline de imagen ({args.repeat} repeticiones)", rows, as_json=args.json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Foto real a redimensionar (por defecto, rostro sintético)")
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x720", "1920x1080"])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG"], choices=["JPEG", "PNG"])
+    parser.add_argument("--upsamples", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    main(parser.parse_args())
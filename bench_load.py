@@ -0,0 +1,318 @@
+"""
+Prueba de carga de extremo a extremo contra la app FastAPI.
+
+Registra usuarios con imágenes faciales sintéticas (o fotos reales con --images),
+hace login facial con cada uno y recorre /api/albums (también revalidando con su
+ETag) y /users, con la concurrencia indicada. Por cada endpoint informa de throughput, percentiles de latencia,
+tasa de error y códigos de respuesta, en tabla o en JSON.
+
+Destinos:
+    --in-memory          la app en proceso (ASGI, sin red) contra una MongoDB en
+                         memoria (requiere `pip install mongomock-motor`)
+    --mongo-url URL      la app en proceso contra una MongoDB local, en la base
+                         --db-name (se borra al terminar salvo con --keep-data)
+    --url URL            un servidor ya arrancado; /api/albums necesita --token
+                         de administrador
+
+Para seguir la evolución entre commits, --output guarda el informe (con el commit
+actual) y --compare lo contrasta con uno anterior: si algún endpoint empeora su
+p95 o su throughput más de --max-regression, o su tasa de error crece más de
+--max-error-increase, el script termina con código 1.
+
+Nota: el detector HOG no siempre reconoce los rostros sintéticos; en ese caso
+/register y /login/face responden 400 y aparecen como errores. Para medir el
+camino completo conviene pasar fotos reales con --images.
+
+Uso:
+    python bench_load.py --in-memory --users 40 --concurrency 8 --output base.json
+    python bench_load.py --in-memory --users 40 --concurrency 8 --compare base.json
+    python bench_load.py --url http://localhost:8000 --token <jwt> --json
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+from bench_utils import latency_summary, print_report, synthetic_face_image
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger("bench_load")
+
+PASSWORD = "contraseña-de-carga"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+def git_commit() -> dict:
+    """Commit actual y si hay cambios sin confirmar, para asociar el informe al código medido"""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": sha, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def reencode(contents: bytes, quality: int = 90) -> bytes:
+    """Otra "foto" de la misma persona: mismos píxeles, bytes distintos (no acierta en la caché)"""
+    buffer = io.BytesIO()
+    Image.open(io.BytesIO(contents)).convert('RGB').save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def face_images(args) -> list:
+    """Una imagen por usuario: fotos de --images en ciclo o rostros sintéticos distintos"""
+    if args.images:
+        paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+        if not paths:
+            raise SystemExit(f"No hay imágenes JPEG/PNG en {args.images}")
+        return [paths[i % len(paths)].read_bytes() for i in range(args.users)]
+    size = tuple(args.image_size)
+    return [synthetic_face_image(size, seed=i) for i in range(args.users)]
+
+
+async def run_phase(client, name: str, requests: list, concurrency: int, expected: int) -> dict:
+    """Lanza las peticiones con la concurrencia indicada y resume latencias y códigos"""
+    latencies = []
+    statuses = {}
+    responses = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(send):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await send(client)
+                code = str(response.status_code)
+            except Exception as e:
+                response, code = None, type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[code] = statuses.get(code, 0) + 1
+            responses.append(response)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(send) for send in requests))
+    elapsed = time.perf_counter() - start
+
+    errors = sum(count for code, count in statuses.items() if code != str(expected))
+    summary = latency_summary(latencies)
+    row = {
+        "endpoint": name,
+        "requests": len(requests),
+        "concurrency": concurrency,
+        "throughput_rps": round(len(requests) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(errors / len(requests), 4) if requests else 0.0,
+        "mean_ms": summary.get("mean_ms"),
+        "p50_ms": summary.get("p50_ms"),
+        "p95_ms": summary.get("p95_ms"),
+        "p99_ms": summary.get("p99_ms"),
+        "statuses": statuses
+    }
+    return row, responses
+
+
+async def run_scenario(client, args, admin_token: str, user_token: str) -> list:
+    run_id = uuid.uuid4().hex[:8]
+    usernames = [f"carga_{run_id}_{i}" for i in range(args.users)]
+    images = face_images(args)
+    rows = []
+
+    def register(i):
+        return lambda c: c.post("/register", data={
+            "username": usernames[i],
+            "email": f"{usernames[i]}@carga.local",
+            "password": PASSWORD,
+            "role": "normal"
+        }, files={"face_image": (f"{usernames[i]}.jpg", images[i], "image/jpeg")})
+
+    row, _ = await run_phase(client, "POST /register", [register(i) for i in range(args.users)], args.concurrency, 201)
+    rows.append(row)
+
+    login_images = [reencode(image) for image in images]
+
+    def login(i):
+        return lambda c: c.post("/login/face", data={"username": usernames[i], "password": PASSWORD},
+                                files={"face_image": (f"{usernames[i]}.jpg", login_images[i], "image/jpeg")})
+
+    row, responses = await run_phase(client, "POST /login/face", [login(i) for i in range(args.users)], args.concurrency, 200)
+    rows.append(row)
+    # Preferir un token real de login para las rutas de usuario
+    for response in responses:
+        if response is not None and response.status_code == 200:
+            user_token = response.json().get("access_token") or user_token
+            break
+
+    if admin_token:
+        for i in range(args.albums):
+            await client.post("/api/albums", json={"title": f"Álbum de carga {run_id} {i}", "artist": "Carga", "year": 2024},
+                              headers={"Authorization": f"Bearer {admin_token}"})
+    if user_token:
+        headers = {"Authorization": f"Bearer {user_token}"}
+        row, responses = await run_phase(client, "GET /api/albums",
+                                         [lambda c: c.get("/api/albums", headers=headers) for _ in range(args.requests)],
+                                         args.concurrency, 200)
+        rows.append(row)
+        # Revalidación con el ETag recibido: 304 sin cuerpo
+        etag = next((r.headers.get("etag") for r in responses if r is not None and r.headers.get("etag")), None)
+        if etag:
+            conditional = {**headers, "If-None-Match": etag}
+            row, _ = await run_phase(client, "GET /api/albums (304)",
+                                     [lambda c: c.get("/api/albums", headers=conditional) for _ in range(args.requests)],
+                                     args.concurrency, 304)
+            rows.append(row)
+    else:
+        logger.warning("Sin token: se omite /api/albums (use --token con --url)")
+
+    row, _ = await run_phase(client, "GET /users", [lambda c: c.get("/users") for _ in range(args.requests)],
+                             args.concurrency, 200)
+    rows.append(row)
+    return rows
+
+
+async def run_in_process(args, scenario=None) -> list:
+    """Arranca la app en este proceso contra una MongoDB local o en memoria y ejecuta el escenario"""
+    scenario = scenario or run_scenario
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    # Configuración aislada: sin ficheros de log ni índice persistido, blobs en un directorio temporal
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("FACE_INDEX_PATH", "")
+    os.environ.setdefault("SECRET_KEY", "bench-load-secret")
+    os.environ["FACE_IMAGE_STORE_DIR"] = os.path.join(workdir, "face_images")
+
+    if args.in_memory:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("--in-memory requiere mongomock-motor: pip install mongomock-motor")
+        client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongo_url, serverSelectionTimeoutMS=5000)
+
+    # Los logs de la app a stderr para no mezclarlos con el informe
+    from log_config import setup_logging
+    setup_logging(stream=sys.stderr)
+    import main as app_main
+    from auth import UserRole, create_access_token
+    from database import mongo_connection
+
+    from readiness import readiness
+
+    mongo_connection.use_client(client, args.db_name)
+    await app_main.startup_event()
+    try:
+        # La base de datos y los modelos se inicializan en segundo plano
+        if not await readiness.wait(timeout=args.ready_timeout):
+            raise SystemExit(f"La app no estuvo lista en {args.ready_timeout}s: {readiness.report()}")
+        admin_token = create_access_token({"sub": "admin123", "role": UserRole.ADMIN})
+        user_token = create_access_token({"sub": "carga", "role": UserRole.NORMAL})
+        # Los errores del servidor cuentan como respuestas 500, no abortan la prueba
+        transport = httpx.ASGITransport(app=app_main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench-load", timeout=args.timeout) as http:
+            return await scenario(http, args, admin_token, user_token)
+    finally:
+        if not args.in_memory and not args.keep_data:
+            await client.drop_database(args.db_name)
+        await app_main.shutdown_event()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def run_remote(args) -> list:
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as http:
+        return await run_scenario(http, args, args.token, args.token)
+
+
+def compare(rows: list, baseline: dict, max_regression: float, max_error_increase: float) -> list:
+    """Endpoints que empeoran respecto al informe de referencia"""
+    previous = {row["endpoint"]: row for row in baseline.get("results", [])}
+    regressions = []
+    for row in rows:
+        before = previous.get(row["endpoint"])
+        if before is None:
+            continue
+        if before.get("p95_ms") and row["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{row['endpoint']}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+        if before.get("throughput_rps") and row["throughput_rps"] < before["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{row['endpoint']}: throughput {before['throughput_rps']} -> {row['throughput_rps']} req/s")
+        if row["error_rate"] > before.get("error_rate", 0) + max_error_increase:
+            regressions.append(f"{row['endpoint']}: tasa de error {before.get('error_rate', 0)} -> {row['error_rate']}")
+    return regressions
+
+
+async def main(args):
+    rows = await (run_remote(args) if args.url else run_in_process(args))
+
+    report = {
+        "benchmark": "bench_load",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **git_commit(),
+        "config": {
+            "target": args.url or ("in-memory" if args.in_memory else args.mongo_url),
+            "users": args.users,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "images": args.images or f"synthetic {args.image_size[0]}x{args.image_size[1]}"
+        },
+        "results": rows
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(f"Prueba de carga ({report['config']['target']}, concurrencia {args.concurrency})",
+                     [{**row, "statuses": json.dumps(row["statuses"])} for row in rows])
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(rows, baseline, args.max_regression, args.max_error_increase)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--in-memory", action="store_true", help="MongoDB en memoria (mongomock-motor)")
+    target.add_argument("--mongo-url", help="MongoDB local, p. ej. mongodb://localhost:27017")
+    target.add_argument("--url", help="Servidor ya arrancado, p. ej. http://localhost:8000")
+    parser.add_argument("--db-name", default="face_login_loadtest")
+    parser.add_argument("--keep-data", action="store_true", help="No borrar la base de datos de prueba")
+    parser.add_argument("--token", help="JWT de administrador para --url")
+    parser.add_argument("--users", type=int, default=20, help="Usuarios registrados (y logins faciales)")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones a /api/albums y a /users")
+    parser.add_argument("--albums", type=int, default=20, help="Álbumes creados antes de medir /api/albums")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--images", help="Directorio con fotos reales (JPEG/PNG) en lugar de rostros sintéticos")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[640, 480], metavar=("ANCHO", "ALTO"))
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="Espera máxima a que la app en proceso esté lista")
+    parser.add_argument("--output", help="Guardar el informe JSON en este fichero")
+    parser.add_argument("--compare", help="Informe JSON de referencia para detectar regresiones")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Empeoramiento relativo tolerado en p95 y throughput")
+    parser.add_argument("--max-error-increase", type=float, default=0.01, help="Aumento absoluto tolerado en la tasa de error")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,152 @@
+"""
+Benchmark de latencia por petición con el logging desactivado, síncrono y en cola.
+
+Monta una app FastAPI mínima con el middleware de request_id y un handler que
+emite las mismas líneas de log que /login/face (INFO y DEBUG), y la recorre con
+httpx sobre ASGI, sin red. Modos:
+
+    off    logging desactivado (referencia)
+    sync   configuración anterior: StreamHandler + FileHandler en el hilo de la petición
+    queue  log_config.setup_logging(): QueueHandler + hilo escritor
+
+Con --slow-disk-ms se simula un disco lento añadiendo una espera a cada escritura
+en fichero, que es donde el modo síncrono bloquea el event loop.
+
+Uso:
+    python bench_logging.py --requests 2000 --concurrency 32 --slow-disk-ms 1
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import log_config
+from bench_utils import latency_summary, print_report
+
+LINES_INFO = 3
+LINES_DEBUG = 4
+
+
+class SlowFileHandler(logging.FileHandler):
+    """FileHandler que espera slow_ms en cada escritura (simula un disco lento)"""
+
+    def __init__(self, filename, slow_ms: float):
+        super().__init__(filename)
+        self.slow_s = slow_ms / 1000
+
+    def emit(self, record):
+        if self.slow_s:
+            time.sleep(self.slow_s)
+        super().emit(record)
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    logger = logging.getLogger("main")
+
+    @app.middleware("http")
+    async def request_id_middleware(request, call_next):
+        token = log_config.request_id_var.set(request.headers.get("X-Request-ID") or log_config.new_request_id())
+        try:
+            return await call_next(request)
+        finally:
+            log_config.request_id_var.reset(token)
+
+    @app.post("/login")
+    async def login():
+        for i in range(LINES_INFO):
+            logger.info(f"Paso {i} del login de usuario_{i}")
+        for i in range(LINES_DEBUG):
+            logger.debug(f"Imagen recibida: foto.jpg, tamaño: {48213 + i} bytes, forma: (480, 640, 3)")
+        await asyncio.sleep(0)
+        return {"message": "Login exitoso"}
+
+    return app
+
+
+def configure(mode: str, log_path: str, slow_ms: float, level: str):
+    """Deja el logger raíz en el estado del modo indicado"""
+    log_config.shutdown_logging()
+    logging.disable(logging.NOTSET)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(level)
+
+    devnull = open(os.devnull, "w")
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+    elif mode == "sync":
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        for handler in (logging.StreamHandler(devnull), SlowFileHandler(log_path, slow_ms)):
+            handler.setFormatter(formatter)
+            root.addHandler(handler)
+    elif mode == "queue":
+        listener = log_config.setup_logging(log_file="", level=level, stream=devnull)
+        # Sustituir el fichero por la versión lenta para comparar en igualdad de condiciones
+        file_handler = SlowFileHandler(log_path, slow_ms)
+        file_handler.setFormatter(log_config.JsonFormatter())
+        listener.handlers = listener.handlers + (file_handler,)
+
+
+async def run_case(app, requests, concurrency) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/login")
+                latencies.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    summary = latency_summary(latencies)
+    return {
+        "req_per_s": round(requests / elapsed, 1),
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"]
+    }
+
+
+async def main(args):
+    app = build_app()
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            configure(mode, os.path.join(tmp, f"{mode}.log"), args.slow_disk_ms, args.level)
+            # Calentamiento
+            await run_case(app, min(100, args.requests), args.concurrency)
+            result = await run_case(app, args.requests, args.concurrency)
+            result["dropped"] = log_config.logging_stats()["dropped_queue_full"] if mode == "queue" else 0
+            rows.append({"mode": mode, "level": args.level, **result})
+        configure("off", "", 0, args.level)
+        log_config.shutdown_logging()
+
+    print_report(
+        f"Latencia con logging ({args.requests} peticiones, concurrencia {args.concurrency}, disco +{args.slow_disk_ms} ms)",
+        rows, as_json=args.json
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--modes", nargs="+", default=["off", "sync", "queue"], choices=["off", "sync", "queue"])
+    parser.add_argument("--level", default="INFO", help="Nivel del logger raíz (DEBUG incluye las líneas de depuración)")
+    parser.add_argument("--slow-disk-ms", type=float, default=0.0, help="Espera añadida a cada escritura en fichero")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
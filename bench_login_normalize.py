@@ -0,0 +1,114 @@
+"""
+Normalización de la imagen del login: tres pasadas frente a una.
+
+Compara la preparación de la imagen que recibe la detección en /login/face:
+
+    three_pass     decodificación completa + convert('RGB') + ImageEnhance.Brightness
+                   + ImageEnhance.Contrast (el camino anterior)
+    lut            decodificación completa + una pasada con la tabla de
+                   face_pipeline.normalize_image
+    draft_lut      decodificación reducida de JPEG (draft) + la misma tabla; es el
+                   camino actual de process_login_image
+
+Para cada variante se informa de la latencia (media, p50, p95), de la memoria pico
+de una ejecución aislada en un proceso nuevo (`peak_rss_kb` cubre los buffers de
+PIL) y de la diferencia máxima en niveles de gris frente a three_pass cuando el
+tamaño decodificado coincide.
+
+Uso:
+    python bench_login_normalize.py --sizes 640x480 1280x720 1920x1080 2592x1944 --repeat 20
+    python bench_login_normalize.py --image foto.jpg --sizes 1920x1080 --json
+"""
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from bench_image_stages import source_image
+from bench_utils import latency_summary, measure_peak_memory, print_report
+from face_pipeline import decode_login_image, enhance_image, normalize_image, open_image
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger("bench_login_normalize")
+
+
+def three_pass(contents: bytes):
+    return enhance_image(open_image(contents).convert('RGB'))
+
+
+def lut(contents: bytes):
+    return normalize_image(decode_login_image(contents, draft=False)[0])
+
+
+def draft_lut(contents: bytes):
+    return normalize_image(decode_login_image(contents, draft=True)[0])
+
+
+VARIANTS = {"three_pass": three_pass, "lut": lut, "draft_lut": draft_lut}
+
+
+def _memory_child(variant: str, contents: bytes, results):
+    """Proceso nuevo por medición: el heap no está "caliente" y el pico de RSS es fiable"""
+    VARIANTS[variant](contents)  # carga los plugins de PIL para no contarlos
+    results.put(measure_peak_memory(VARIANTS[variant], contents))
+
+
+def measure_memory(variant: str, contents: bytes) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_memory_child, args=(variant, contents, results))
+    process.start()
+    try:
+        return results.get(timeout=600)
+    finally:
+        process.join()
+
+
+def measure_time(fn, contents: bytes, repeat: int) -> dict:
+    fn(contents)  # calentamiento
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(contents)
+        samples.append((time.perf_counter() - start) * 1000)
+    summary = latency_summary(samples)
+    return {"mean_ms": summary["mean_ms"], "p50_ms": summary["p50_ms"], "p95_ms": summary["p95_ms"]}
+
+
+def main(args):
+    rows = []
+    for size_arg in args.sizes:
+        size = tuple(int(v) for v in size_arg.lower().split("x"))
+        for fmt in args.formats:
+            contents = source_image(args.image, size, fmt)
+            reference = np.asarray(three_pass(contents), dtype=np.int16)
+            for name, fn in VARIANTS.items():
+                output = np.asarray(fn(contents), dtype=np.int16)
+                max_diff = int(np.abs(output - reference).max()) if output.shape == reference.shape else "-"
+                rows.append({
+                    "size": size_arg,
+                    "format": fmt,
+                    "variant": name,
+                    "decoded": f"{output.shape[1]}x{output.shape[0]}",
+                    **measure_time(fn, contents, args.repeat),
+                    **measure_memory(name, contents),
+                    "max_diff": max_diff
+                })
+    print_report(f"Normalización de la imagen del login ({args.repeat} repeticiones)", rows, as_json=args.json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="Foto real a redimensionar (por defecto, rostro sintético)")
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x720", "1920x1080", "2592x1944"])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "PNG"], choices=["JPEG", "PNG"])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    main(parser.parse_args())
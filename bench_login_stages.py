@@ -0,0 +1,141 @@
+"""
+Latencia de /login/face por etapas frente al flujo secuencial anterior.
+
+Arranca la app en proceso (como bench_load.py) y mide cuatro casos con los dos
+flujos:
+
+    success         contraseña y rostro correctos
+    bad_password    contraseña incorrecta con una imagen válida
+    bad_image       contraseña correcta con una imagen sin rostro
+    no_face_user    usuario sin rostro registrado
+
+    staged          POST /login/face: usuario, después contraseña y rostro a la
+                    vez (la primera que falla cancela a la otra) y token al final
+    sequential      el flujo anterior, montado sólo para la medición: bcrypt,
+                    token, pipeline facial y, al final, la comprobación de que el
+                    usuario tiene rostro registrado
+
+La caché de resultados se desactiva (FACE_CACHE_TTL_S=0) para que cada petición
+pase por el pipeline. Con rostros sintéticos el detector HOG puede no encontrar
+la cara y "success" terminaría en 400; conviene pasar una foto real con --image.
+
+Uso:
+    python bench_login_stages.py --in-memory --image foto.jpg --requests 20
+    python bench_login_stages.py --mongo-url mongodb://localhost:27017 --concurrency 4 --json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import uuid
+
+from fastapi import Depends, HTTPException
+from PIL import Image
+
+from bench_load import PASSWORD, reencode, run_in_process, run_phase
+from bench_utils import load_image_bytes, print_report
+
+SEQUENTIAL_PATH = "/bench/login/face/sequential"
+
+
+def blank_image(shade: int, size=(640, 480)) -> bytes:
+    """JPEG válido sin ningún rostro"""
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (shade, shade, shade)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def mount_sequential_login(app_main):
+    """Registra el flujo de login anterior (todo en serie y el token antes de validar la imagen)"""
+    from auth import UserRole, create_access_token
+    from upload_ingest import FaceUploadForm, face_upload
+    import numpy as np
+
+    async def sequential_face_login(form: FaceUploadForm = Depends(face_upload("login_sequential"))):
+        username, password = form.field("username"), form.field("password")
+        user = await app_main.get_user(username)
+        if not user or not await app_main.verify_password(password, user.get("password")):
+            raise HTTPException(status_code=401, detail="Nombre de usuario o contraseña incorrectos")
+        await app_main.complete_authentication(user, password)
+        access_token = create_access_token(data={"sub": user["username"], "role": user.get("role", UserRole.NORMAL)})
+        face_encoding = await app_main.encode_login_face(form.image)
+        if "face_encoding" not in user:
+            raise HTTPException(status_code=400, detail="Usuario no tiene rostro registrado")
+        if np.linalg.norm(np.asarray(user["face_encoding"]) - face_encoding) > app_main.FACE_MATCH_TOLERANCE:
+            raise HTTPException(status_code=401, detail="El rostro no coincide con el usuario autenticado")
+        return {"username": user["username"], "access_token": access_token}
+
+    app_main.app.post(SEQUENTIAL_PATH, dependencies=[Depends(app_main.require_face_models)])(sequential_face_login)
+
+
+def make_scenario(image: bytes):
+    async def scenario(client, args, admin_token: str, user_token: str) -> list:
+        import main as app_main
+        mount_sequential_login(app_main)
+
+        run_id = uuid.uuid4().hex[:8]
+        face_user, faceless_user = f"etapas_{run_id}", f"etapas_{run_id}_sin_rostro"
+        response = await client.post("/register", data={
+            "username": face_user, "email": f"{face_user}@carga.local", "password": PASSWORD
+        }, files={"face_image": ("registro.jpg", image, "image/jpeg")})
+        if response.status_code != 201:
+            raise SystemExit(f"No se pudo registrar el usuario de prueba ({response.status_code}): {response.text}")
+        # Alta por la API de administración: sin imagen facial
+        await client.post("/api/users", json={"username": faceless_user, "email": f"{faceless_user}@carga.local", "password": PASSWORD},
+                          headers={"Authorization": f"Bearer {admin_token}"})
+
+        # Bytes distintos en cada petición para que ninguna coincida con otra en curso
+        login_images = [reencode(image, quality=70 + i % 25) for i in range(args.requests)]
+        blank_images = [blank_image(60 + i % 120) for i in range(args.requests)]
+        cases = {
+            "success": (face_user, PASSWORD, login_images, 200),
+            "bad_password": (face_user, PASSWORD + "x", login_images, 401),
+            "bad_image": (face_user, PASSWORD, blank_images, 400),
+            "no_face_user": (faceless_user, PASSWORD, login_images, 400),
+        }
+
+        rows = []
+        for flow, path in (("sequential", SEQUENTIAL_PATH), ("staged", "/login/face")):
+            for case, (username, password, images, expected) in cases.items():
+                def login(i, username=username, password=password, images=images):
+                    return lambda c: c.post(path, data={"username": username, "password": password},
+                                            files={"face_image": ("login.jpg", images[i], "image/jpeg")})
+
+                row, _ = await run_phase(client, case, [login(i) for i in range(args.requests)], args.concurrency, expected)
+                rows.append({
+                    "flow": flow, "case": case,
+                    **{key: row[key] for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms")},
+                    "statuses": row["statuses"]
+                })
+        return rows
+    return scenario
+
+
+async def main(args):
+    # Cada petición debe ejecutar el pipeline: sin caché de resultados
+    os.environ["FACE_CACHE_TTL_S"] = "0"
+    image = load_image_bytes(args.image, tuple(args.image_size))
+    rows = await run_in_process(args, make_scenario(image))
+    if args.json:
+        print_report("Etapas de /login/face", rows, as_json=True)
+    else:
+        print_report(f"Etapas de /login/face ({args.requests} peticiones por caso, concurrencia {args.concurrency})",
+                     [{**row, "statuses": json.dumps(row["statuses"])} for row in rows])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--in-memory", action="store_true", help="MongoDB en memoria (mongomock-motor)")
+    target.add_argument("--mongo-url", help="MongoDB local, p. ej. mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="face_login_loadtest")
+    parser.add_argument("--keep-data", action="store_true", help="No borrar la base de datos de prueba")
+    parser.add_argument("--image", help="Foto real con un rostro (por defecto, rostro sintético)")
+    parser.add_argument("--image-size", type=int, nargs=2, default=[640, 480], metavar=("ANCHO", "ALTO"))
+    parser.add_argument("--requests", type=int, default=10, help="Peticiones por caso y flujo")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--ready-timeout", type=float, default=300.0, help="Espera máxima a que la app en proceso esté lista")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+"""
+Benchmark de logins concurrentes según el tamaño del pool de bcrypt y el coste.
+
+Para cada combinación lanza `--logins` verificaciones simultáneas y mide el
+throughput, la latencia por login y el retraso máximo del event loop (un ticker
+que debería despertar cada 5 ms). La fila "inline" reproduce el comportamiento
+anterior: verificación síncrona dentro del event loop.
+
+Uso:
+    python bench_password.py --pool-sizes 1 2 4 8 --rounds 10 12 --logins 64
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from bench_utils import latency_summary, print_report
+from password_service import PasswordService
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+
+PASSWORD = "contraseña-de-prueba"
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval=0.005):
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst * 1000
+
+
+async def run_case(service, hashed, logins, inline=False):
+    latencies = []
+
+    async def login():
+        start = time.perf_counter()
+        if inline:
+            service._context.verify(PASSWORD, hashed)
+        else:
+            await service.verify(PASSWORD, hashed)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    max_lag = await lag_task
+
+    summary = latency_summary(latencies)
+    return {
+        "logins_per_s": round(logins / elapsed, 2),
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "max_loop_lag_ms": round(max_lag, 2)
+    }
+
+
+async def main(args):
+    rows = []
+    for rounds in args.rounds:
+        for pool_size in ["inline"] + args.pool_sizes:
+            service = PasswordService(rounds=rounds, max_workers=1 if pool_size == "inline" else pool_size)
+            hashed = await service.hash(PASSWORD)
+            try:
+                result = await run_case(service, hashed, args.logins, inline=pool_size == "inline")
+            finally:
+                service.shutdown()
+            rows.append({"rounds": rounds, "pool": pool_size, **result})
+    print_report(f"Verificación bcrypt con {args.logins} logins concurrentes", rows, as_json=args.json)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 12])
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""
+Tamaño de los documentos de `usuarios` y latencia de listado, con y sin imagen.
+
+Mide sobre la base de datos configurada en MONGO_URL:
+  - tamaño BSON medio y total de los documentos completos y sin face_image
+  - latencia de leer toda la colección con find() completo y con la proyección
+    que usan los endpoints de listado
+
+Ejecutado antes y después de `python database.py migrate` muestra el efecto de
+mover las imágenes al almacén de blobs.
+
+Uso:
+    python bench_user_documents.py --repeat 5
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from bench_utils import latency_summary, print_report
+from database import mongo_connection, get_database
+from user_cache import USER_PROJECTION
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+
+
+async def document_sizes(db):
+    pipeline = [
+        {"$project": {
+            "full": {"$bsonSize": "$$ROOT"},
+            "image": {"$ifNull": [{"$binarySize": "$face_image"}, 0]}
+        }},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "full_avg": {"$avg": "$full"},
+            "full_total": {"$sum": "$full"},
+            "image_total": {"$sum": "$image"}
+        }}
+    ]
+    result = await db.usuarios.aggregate(pipeline).to_list(length=1)
+    return result[0] if result else {"count": 0, "full_avg": 0, "full_total": 0, "image_total": 0}
+
+
+async def list_latency(db, projection, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await db.usuarios.find({}, projection).to_list(length=None)
+        samples.append((time.perf_counter() - start) * 1000)
+    return latency_summary(samples)
+
+
+async def main(args):
+    try:
+        db = await get_database()
+        sizes = await document_sizes(db)
+        count = sizes["count"] or 1
+        without_image_total = sizes["full_total"] - sizes["image_total"]
+        full = await list_latency(db, None, args.repeat)
+        projected = await list_latency(db, USER_PROJECTION, args.repeat)
+        rows = [
+            {
+                "query": "find() completo",
+                "documents": sizes["count"],
+                "avg_doc_bytes": round(sizes["full_avg"] or 0),
+                "total_kb": round(sizes["full_total"] / 1024, 1),
+                "list_p50_ms": full["p50_ms"],
+                "list_p95_ms": full["p95_ms"]
+            },
+            {
+                "query": "sin face_image",
+                "documents": sizes["count"],
+                "avg_doc_bytes": round(without_image_total / count),
+                "total_kb": round(without_image_total / 1024, 1),
+                "list_p50_ms": projected["p50_ms"],
+                "list_p95_ms": projected["p95_ms"]
+            }
+        ]
+        print_report("Documentos de usuarios: tamaño y latencia de listado", rows, as_json=args.json)
+    finally:
+        await mongo_connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Lecturas de la colección por consulta")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,143 @@
+"""
+Utilidades compartidas por los scripts de benchmark (bench_*.py).
+"""
+import gc
+import io
+import json
+import random
+import statistics
+import tracemalloc
+
+from PIL import Image, ImageDraw
+
+
+def synthetic_face_image(size=(640, 480), fmt='JPEG', seed: int = None) -> bytes:
+    """
+    Genera una imagen con un rostro esquemático (óvalo, ojos, cejas y boca).
+
+    Sirve para medir el coste de CPU del pipeline; el detector HOG no siempre la
+    reconoce como rostro, así que para medir recall conviene pasar fotos reales.
+
+    Con seed se varían ligeramente el fondo, el tono de piel y la posición, de modo
+    que cada semilla produce una "persona" distinta (y bytes distintos para la caché).
+    """
+    width, height = size
+    rng = random.Random(seed)
+    jitter = (lambda spread: rng.randint(-spread, spread)) if seed is not None else (lambda spread: 0)
+    image = Image.new('RGB', size, (120 + jitter(30), 140 + jitter(30), 160 + jitter(30)))
+    draw = ImageDraw.Draw(image)
+
+    face_w, face_h = int(min(width, height) * 0.45), int(min(width, height) * 0.6)
+    left = (width - face_w) // 2 + jitter(width // 20)
+    top = (height - face_h) // 2 + jitter(height // 20)
+    draw.ellipse([left, top, left + face_w, top + face_h], fill=(224 + jitter(20), 188 + jitter(20), 160 + jitter(20)))
+
+    eye_y = top + face_h * 0.38
+    for eye_x in (left + face_w * 0.3, left + face_w * 0.7):
+        r = face_w * 0.07
+        draw.ellipse([eye_x - r * 1.6, eye_y - r, eye_x + r * 1.6, eye_y + r], fill=(255, 255, 255))
+        draw.ellipse([eye_x - r * 0.6, eye_y - r * 0.6, eye_x + r * 0.6, eye_y + r * 0.6], fill=(40, 30, 20))
+        draw.line([eye_x - r * 2, eye_y - r * 2.2, eye_x + r * 2, eye_y - r * 2.4], fill=(60, 40, 30), width=max(1, int(r * 0.6)))
+
+    nose_x, nose_y = left + face_w * 0.5, top + face_h * 0.58
+    draw.line([nose_x, eye_y + face_h * 0.05, nose_x - face_w * 0.05, nose_y, nose_x + face_w * 0.04, nose_y], fill=(170, 130, 110), width=2)
+    draw.arc([left + face_w * 0.3, top + face_h * 0.62, left + face_w * 0.7, top + face_h * 0.8], 20, 160, fill=(150, 60, 60), width=3)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def load_image_bytes(path: str = None, size=(640, 480), fmt='JPEG') -> bytes:
+    """Lee la imagen indicada o genera una sintética si no se pasa ruta"""
+    if path:
+        with open(path, 'rb') as f:
+            return f.read()
+    return synthetic_face_image(size, fmt)
+
+
+def latency_summary(samples_ms: list) -> dict:
+    """Resumen de latencias en milisegundos: media y percentiles p50/p95/p99"""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "max_ms": round(ordered[-1], 3)
+    }
+
+
+def _read_status_kb(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_hwm() -> bool:
+    """Reinicia el pico de RSS del proceso (Linux >= 4.0); False si no es posible"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _release_free_memory():
+    """Devuelve al sistema la memoria liberada al preparar las entradas (glibc), para que la medición no la reutilice"""
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def measure_peak_memory(fn, arg) -> dict:
+    """
+    Memoria pico de una llamada fn(arg): `peak_py_kb` con tracemalloc (incluye los
+    buffers de numpy) y `peak_rss_kb` como crecimiento del pico de RSS (VmHWM, sólo
+    en Linux; cubre también la memoria de PIL y dlib). Para que el pico de RSS sea
+    fiable conviene llamarla en un proceso nuevo.
+    """
+    gc.collect()
+    _release_free_memory()
+    rss_reset = _reset_hwm()
+    rss_before = _read_status_kb("VmRSS")
+    tracemalloc.start()
+    result = fn(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_peak = _read_status_kb("VmHWM")
+    del result
+    return {
+        "peak_py_kb": round(peak / 1024, 1),
+        "peak_rss_kb": rss_peak - rss_before if rss_reset and rss_before is not None and rss_peak is not None else None
+    }
+
+
+def print_report(title: str, rows: list, as_json: bool = False):
+    """Imprime los resultados como tabla legible o como JSON"""
+    if as_json:
+        print(json.dumps({"benchmark": title, "results": rows}, indent=2, ensure_ascii=False))
+        return
+    print(f"\n=== {title} ===")
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
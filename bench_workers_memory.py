@@ -0,0 +1,154 @@
+"""
+Memoria por worker: lanzador pre-fork frente a procesos independientes.
+
+Arranca el servidor de dos maneras con el mismo número de workers HTTP y de
+procesos de reconocimiento facial por worker:
+
+    prefork       python serve.py --workers N: modelos cargados en el maestro y
+                  compartidos copy-on-write por workers y procesos faciales
+    independent   N procesos `uvicorn main:app` en puertos distintos, cada uno
+                  con su pool facial por spawn (cada proceso carga sus modelos)
+
+Espera a que cada worker tenga los modelos precargados (componente face_models de
+/ready, no hace falta MongoDB) y mide cada proceso en /proc/<pid>/smaps_rollup,
+sumando la de sus procesos hijos: RSS (cuenta entera la memoria compartida), PSS
+(la reparte entre los procesos que la comparten; la suma es la memoria real) y
+USS (privada).
+
+Uso:
+    python bench_workers_memory.py --workers 4 --face-workers 1
+    python bench_workers_memory.py --workers 2 --env MONGO_URL=mongodb://localhost:27017 --json
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench_utils import print_report
+from serve import process_memory, tree_memory
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger("bench_workers_memory")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def server_env(args) -> dict:
+    env = dict(os.environ, LOG_FILE="", LOG_LEVEL="WARNING", FACE_INDEX_PATH="", FACE_WORKERS=str(args.face_workers))
+    for item in args.env:
+        key, value = item.split("=", 1)
+        env[key] = value
+    return env
+
+
+def wait_face_models(ports: list, expected: int, timeout: float) -> set:
+    """PIDs de los workers que ya informan face_models listo; se sondea con conexiones nuevas para repartirlas"""
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while len(seen) < expected and time.monotonic() < deadline:
+        for port in ports:
+            try:
+                report = httpx.get(f"http://127.0.0.1:{port}/ready", timeout=2.0).json()
+            except (httpx.TransportError, ValueError):
+                continue
+            if report.get("components", {}).get("face_models"):
+                seen.add(report["pid"])
+        time.sleep(0.05)
+    return seen
+
+
+def stop(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def row(mode: str, name: str, pid: int, memory: dict) -> dict:
+    return {
+        "mode": mode,
+        "process": name,
+        "pid": pid,
+        "rss_mb": round(memory.get("rss_kb", 0) / 1024, 1),
+        "pss_mb": round(memory.get("pss_kb", 0) / 1024, 1),
+        "uss_mb": round(memory.get("uss_kb", 0) / 1024, 1),
+        "children": memory.get("face_processes", 0)
+    }
+
+
+def total_row(mode: str, rows: list) -> dict:
+    return {
+        "mode": mode, "process": "total", "pid": None,
+        **{key: round(sum(r[key] for r in rows), 1) for key in ("rss_mb", "pss_mb", "uss_mb")},
+        "children": sum(r["children"] for r in rows)
+    }
+
+
+def measure_prefork(args) -> list:
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", str(args.workers), "--face-workers", str(args.face_workers)],
+        env=server_env(args), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        pids = wait_face_models([args.port], args.workers, args.timeout)
+        if len(pids) < args.workers:
+            logger.warning(f"prefork: sólo {len(pids)} de {args.workers} workers listos")
+        time.sleep(args.settle)
+        rows = [row("prefork", "master", process.pid, process_memory(process.pid))]
+        rows += [row("prefork", f"worker {i + 1}", pid, tree_memory(pid)) for i, pid in enumerate(sorted(pids))]
+        return rows + [total_row("prefork", rows)]
+    finally:
+        stop([process])
+
+
+def measure_independent(args) -> list:
+    env = server_env(args)
+    env["FACE_WORKER_START_METHOD"] = "spawn"
+    ports = [args.port + 1 + i for i in range(args.workers)]
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--no-access-log"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for port in ports
+    ]
+    try:
+        pids = wait_face_models(ports, args.workers, args.timeout)
+        if len(pids) < args.workers:
+            logger.warning(f"independent: sólo {len(pids)} de {args.workers} procesos listos")
+        time.sleep(args.settle)
+        rows = [row("independent", f"process {i + 1}", p.pid, tree_memory(p.pid)) for i, p in enumerate(processes)]
+        return rows + [total_row("independent", rows)]
+    finally:
+        stop(processes)
+
+
+def main(args):
+    rows = measure_prefork(args) + measure_independent(args)
+    print_report(
+        f"Memoria con {args.workers} workers HTTP y {args.face_workers} procesos faciales por worker",
+        rows, as_json=args.json
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--face-workers", type=int, default=1)
+    parser.add_argument("--port", type=int, default=8790, help="Puerto del lanzador; los procesos independientes usan los siguientes")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Plazo para que todos los workers carguen los modelos")
+    parser.add_argument("--settle", type=float, default=2.0, help="Segundos de espera antes de medir")
+    parser.add_argument("--env", nargs="*", default=[], help="Variables extra para los servidores, p. ej. MONGO_URL=...")
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    main(parser.parse_args())
@@ -0,0 +1,65 @@
+"""
+Almacén de imágenes faciales direccionado por contenido.
+
+Las imágenes se guardan fuera de MongoDB como ficheros cuyo nombre es el SHA-256
+de su contenido (<raíz>/ab/cd/abcd...), escritos con aiofiles. Los documentos de
+`usuarios` sólo guardan la referencia (`face_image_ref`), así que las consultas
+de listado no transfieren ni cargan en memoria los bytes de las imágenes.
+"""
+import hashlib
+import logging
+import os
+import uuid
+
+import aiofiles
+import aiofiles.os
+
+logger = logging.getLogger("blob_store")
+
+FACE_IMAGE_STORE_DIR = os.getenv("FACE_IMAGE_STORE_DIR", "face_images")
+
+
+class ContentAddressedStore:
+    def __init__(self, root: str = None):
+        self.root = root or FACE_IMAGE_STORE_DIR
+
+    @staticmethod
+    def make_ref(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, ref: str) -> str:
+        if len(ref) != 64 or any(c not in "0123456789abcdef" for c in ref):
+            raise ValueError(f"Referencia de blob inválida: {ref}")
+        return os.path.join(self.root, ref[:2], ref[2:4], ref)
+
+    async def put(self, data: bytes) -> str:
+        """Guarda el blob (si no existía) y devuelve su referencia"""
+        ref = self.make_ref(data)
+        path = self.path_for(ref)
+        if await aiofiles.os.path.exists(path):
+            return ref
+
+        await aiofiles.os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: fichero temporal y rename, para no dejar blobs a medias
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(tmp_path, path)
+        return ref
+
+    async def get(self, ref: str) -> bytes:
+        async with aiofiles.open(self.path_for(ref), "rb") as f:
+            return await f.read()
+
+    async def exists(self, ref: str) -> bool:
+        return await aiofiles.os.path.exists(self.path_for(ref))
+
+    async def delete(self, ref: str):
+        try:
+            await aiofiles.os.remove(self.path_for(ref))
+        except FileNotFoundError:
+            pass
+
+
+# Instancia global del almacén de imágenes faciales
+face_image_store = ContentAddressedStore()
@@ -1,27 +1,28 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 import asyncio
 import os
+import socket
+import time
+import uuid
 from dotenv import load_dotenv
 import logging
 from typing import Optional
-from datetime import datetime, timedelta
-
-# Configurar logging para que sea más visible
-import sys
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("database.log")
-    ]
-)
+from datetime import datetime, timedelta, timezone
+from metrics import MongoCommandMetrics, span
+
+# La configuración de handlers la hace log_config.setup_logging() en el punto de entrada
 logger = logging.getLogger("database")
-logger.setLevel(logging.INFO)
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Tamaño del pool de conexiones de cada proceso: con serve.py --workers N hay N
+# clientes, así que el total de conexiones a MongoDB es N * MONGO_MAX_POOL_SIZE
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 10))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 1))
+
 class MongoDBConnection:
     _instance = None
     _client: Optional[AsyncIOMotorClient] = None
@@ -70,15 +71,18 @@ class MongoDBConnection:
                     serverSelectionTimeoutMS=5000,
                     connectTimeoutMS=5000,
                     socketTimeoutMS=10000,
-                    maxPoolSize=10,
-                    minPoolSize=1,
+                    maxPoolSize=MONGO_MAX_POOL_SIZE,
+                    minPoolSize=MONGO_MIN_POOL_SIZE,
                     maxIdleTimeMS=30000,
                     retryWrites=True,
-                    retryReads=True
+                    retryReads=True,
+                    # Duración de cada comando en mongo_command_duration_seconds (/metrics)
+                    event_listeners=[MongoCommandMetrics()]
                 )
 
                 # Verificar conexión con ping
-                await self._client.admin.command('ping')
+                with span("connect", endpoint="database"):
+                    await self._client.admin.command('ping')
                 
                 # Establecer base de datos
                 self._db = self._client.face_login_db
@@ -98,12 +102,26 @@ class MongoDBConnection:
                 # Esperar antes de reintentar
                 await asyncio.sleep(self._retry_delay * self._connection_attempts)
     
+    def use_client(self, client, db_name: str = "face_login_db"):
+        """Usa un cliente ya creado en lugar de MONGO_URL (pruebas de carga contra una base local o en memoria)"""
+        self._client = client
+        self._db = client[db_name]
+        self._is_connected = True
+        return self._db
+
     async def get_db(self):
         """Obtiene la instancia de la base de datos, conectando si es necesario"""
         if not self._is_connected:
             await self.connect()
         return self._db
     
+    def _reset_after_fork(self):
+        """En un proceso hijo de fork se descarta el cliente heredado: sus sockets pertenecen al padre"""
+        self._client = None
+        self._db = None
+        self._is_connected = False
+        self._last_connection_check = None
+
     async def close(self):
         """Cierra la conexión a MongoDB"""
         if self._client and self._is_connected:
@@ -120,7 +138,8 @@ class MongoDBConnection:
             
             # Verificar conexión con ping y medir tiempo de respuesta
             start_time = datetime.now()
-            await self._client.admin.command('ping')
+            with span("ping", endpoint="database"):
+                await self._client.admin.command('ping')
             response_time = (datetime.now() - start_time).total_seconds() * 1000
             
             # Actualizar timestamp de última verificación
@@ -149,6 +168,8 @@ class MongoDBConnection:
 
 # Instancia global de la conexión
 mongo_connection = MongoDBConnection()
+# Cada worker de serve.py crea su propio cliente de Motor
+os.register_at_fork(after_in_child=mongo_connection._reset_after_fork)
 
 # Función para obtener la base de datos
 async def get_database():
@@ -159,4 +180,329 @@ async def get_database():
         (datetime.now() - mongo_connection._last_connection_check).total_seconds() > mongo_connection._connection_check_interval):
         # Verificar conexión en segundo plano para no bloquear
         asyncio.create_task(mongo_connection.check_connection())
-    return db
\ No newline at end of file
+    return db
+
+# ---------------------------------------------------------------------------
+# Migraciones de esquema e índices
+# ---------------------------------------------------------------------------
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+# Con varios workers sólo uno aplica las migraciones: los demás esperan a que
+# suelte el lease (o a que caduque, si su proceso murió a medias)
+MIGRATIONS_LOCK_COLLECTION = "schema_migrations_lock"
+MIGRATIONS_LOCK_TTL_S = float(os.getenv("MIGRATIONS_LOCK_TTL_S", 600))
+MIGRATIONS_LOCK_WAIT_S = float(os.getenv("MIGRATIONS_LOCK_WAIT_S", 900))
+
+
+async def _migration_usuarios_username_unique(db):
+    await db.usuarios.create_index("username", unique=True, name="username_unique")
+
+
+async def _migration_usuarios_email_unique(db):
+    # Índice parcial: sólo los documentos que tienen email participan en la unicidad
+    await db.usuarios.create_index(
+        "email",
+        unique=True,
+        name="email_unique",
+        partialFilterExpression={"email": {"$type": "string"}}
+    )
+
+
+async def _migration_logs_username_timestamp(db):
+    await db.logs.create_index([("username", 1), ("timestamp", -1)], name="username_timestamp")
+
+
+async def _migration_externalize_face_images(db):
+    """Mueve usuarios.face_image al almacén de blobs y deja sólo la referencia"""
+    from blob_store import face_image_store
+
+    moved = 0
+    cursor = db.usuarios.find({"face_image": {"$exists": True}}, {"face_image": 1}).batch_size(50)
+    async for doc in cursor:
+        image = doc.get("face_image")
+        update = {"$unset": {"face_image": ""}}
+        if image:
+            update["$set"] = {"face_image_ref": await face_image_store.put(bytes(image))}
+        await db.usuarios.update_one({"_id": doc["_id"]}, update)
+        moved += 1
+    logger.info(f"Imágenes faciales movidas al almacén de blobs: {moved}")
+
+
+async def _migration_logs_timestamp_id(db):
+    # Orden de la paginación por cursor de /logs
+    await db.logs.create_index([("timestamp", -1), ("_id", -1)], name="timestamp_id")
+
+
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 90))
+
+
+async def _copy_logs(source, target, query: dict, skip_existing: bool = False) -> int:
+    """
+    Copia por lotes los documentos de `source` que cumplen `query` a `target`.
+    Con skip_existing se omiten los `_id` que ya están en el destino (reanudar una copia).
+    """
+    copied = 0
+    batch = []
+
+    async def write(docs):
+        if skip_existing:
+            existing = {doc["_id"] async for doc in target.find({"_id": {"$in": [d["_id"] for d in docs]}}, {"_id": 1})}
+            docs = [doc for doc in docs if doc["_id"] not in existing]
+        if docs:
+            await target.insert_many(docs, ordered=False)
+        return len(docs)
+
+    async for doc in source.find(query).batch_size(1000):
+        batch.append(doc)
+        if len(batch) >= 1000:
+            copied += await write(batch)
+            batch = []
+    if batch:
+        copied += await write(batch)
+    return copied
+
+
+async def _migration_logs_timeseries(db):
+    """
+    Convierte `logs` en una colección time-series (timestamp como tiempo y
+    username como metadato) con borrado automático tras LOG_RETENTION_DAYS.
+    Requiere MongoDB 5.0 o superior.
+
+    Los logs se copian primero a una colección auxiliar que sólo sustituye a
+    `logs` cuando la copia ha terminado; si un intento falla a medias, el
+    siguiente descarta esa copia parcial y empieza de nuevo. Los eventos escritos
+    durante la copia se pasan después del cambio (por `_id`, que lleva la hora de
+    inserción).
+    """
+    staging_name = "logs_timeseries"
+    legacy_name = "logs_legacy"
+    dated = {"timestamp": {"$type": "date"}}
+    collections = {c["name"]: c async for c in await db.list_collections()}
+
+    if collections.get("logs", {}).get("type") == "timeseries":
+        # Un intento anterior ya hizo el cambio pero no terminó de pasar los logs antiguos
+        if legacy_name in collections:
+            copied = await _copy_logs(db[legacy_name], db.logs, dated, skip_existing=True)
+            await db[legacy_name].drop()
+            logger.info(f"Copia de {legacy_name} a logs completada: {copied} documentos pendientes copiados")
+        return
+
+    if staging_name in collections:
+        logger.warning(f"Se descarta la copia parcial {staging_name} de un intento anterior")
+        await db[staging_name].drop()
+
+    await db.create_collection(
+        staging_name,
+        timeseries={"timeField": "timestamp", "metaField": "username", "granularity": "seconds"},
+        expireAfterSeconds=LOG_RETENTION_DAYS * 86400
+    )
+    staging = db[staging_name]
+    await staging.create_index([("username", 1), ("timestamp", -1)], name="username_timestamp")
+    try:
+        await staging.create_index([("timestamp", -1), ("_id", -1)], name="timestamp_id")
+    except Exception as e:
+        # Los índices secundarios sobre campos de medida requieren MongoDB 6.0+
+        logger.warning(f"No se pudo crear el índice (timestamp, _id) en logs: {str(e)}")
+
+    if "logs" not in collections:
+        await staging.rename("logs")
+        return
+
+    # Copiar los logs existentes (los que no tienen timestamp no caben en una time-series)
+    if legacy_name in collections:
+        # Un intento anterior renombró logs pero no llegó a sustituirla: se copian
+        # también sus documentos antes de que el cambio la reemplace
+        recovered = await _copy_logs(db[legacy_name], staging, dated)
+        logger.info(f"Recuperados {recovered} documentos de {legacy_name}")
+    cutoff = ObjectId.from_datetime(datetime.now(timezone.utc))
+    copied = await _copy_logs(db.logs, staging, {**dated, "_id": {"$not": {"$gte": cutoff}}})
+
+    await db.logs.rename(legacy_name, dropTarget=True)
+    await staging.rename("logs")
+    legacy = db[legacy_name]
+    copied += await _copy_logs(legacy, db.logs, {**dated, "_id": {"$gte": cutoff}})
+
+    expected = await legacy.count_documents(dated)
+    if copied == expected:
+        await legacy.drop()
+        logger.info(f"logs convertida a time-series: {copied} documentos copiados")
+    else:
+        logger.warning(f"logs convertida a time-series, pero se copiaron {copied} de {expected}; se conserva {legacy_name}")
+
+
+async def _migration_login_rollups_indexes(db):
+    # Los buckets caducan según su granularidad (campo expires_at)
+    await db.login_rollups.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+    await db.login_rollups_users.create_index("expires_at", expireAfterSeconds=0, name="expires_at_ttl")
+    await db.login_rollups_users.create_index(
+        [("granularity", 1), ("bucket", 1), ("count", -1)], name="granularity_bucket_count"
+    )
+
+
+async def _migration_music_catalog_indexes(db):
+    # Álbumes de la ingesta por carpeta (los creados a mano no tienen slug) y pistas por ruta
+    await db.albums.create_index(
+        "slug", unique=True, name="slug_unique", partialFilterExpression={"slug": {"$type": "string"}}
+    )
+    await db.tracks.create_index("path", unique=True, name="path_unique")
+    await db.tracks.create_index(
+        [("album_id", 1), ("disc_number", 1), ("track_number", 1)], name="album_disc_track"
+    )
+
+
+async def _migration_usuarios_face_image_ref(db):
+    # release_face_image cuenta los usuarios que comparten un blob antes de borrarlo
+    await db.usuarios.create_index(
+        "face_image_ref", name="face_image_ref", partialFilterExpression={"face_image_ref": {"$type": "string"}}
+    )
+
+
+async def _migration_usuarios_google_id(db):
+    # Los logins de Google que chocan con un email ya registrado buscan la cuenta por google_id
+    await db.usuarios.create_index(
+        "google_id", name="google_id", partialFilterExpression={"google_id": {"$type": "string"}}
+    )
+
+
+# Lista ordenada de migraciones: (versión, descripción, función). Cada paso debe
+# ser idempotente; una vez aplicado se registra en MIGRATIONS_COLLECTION.
+MIGRATIONS = [
+    (1, "Índice único en usuarios.username", _migration_usuarios_username_unique),
+    (2, "Índice único parcial en usuarios.email", _migration_usuarios_email_unique),
+    (3, "Índice compuesto en logs (username, timestamp)", _migration_logs_username_timestamp),
+    (4, "Mover usuarios.face_image al almacén de blobs", _migration_externalize_face_images),
+    (5, "Índice en logs (timestamp, _id) para paginación", _migration_logs_timestamp_id),
+    (6, "Convertir logs en colección time-series con retención TTL", _migration_logs_timeseries),
+    (7, "Índices de los rollups de logins", _migration_login_rollups_indexes),
+    (8, "Índices del catálogo de música (albums.slug, tracks)", _migration_music_catalog_indexes),
+    (9, "Índice en usuarios.face_image_ref", _migration_usuarios_face_image_ref),
+    (10, "Índice en usuarios.google_id", _migration_usuarios_google_id),
+]
+
+
+async def applied_migrations(db) -> set:
+    """Versiones ya aplicadas según la colección de metadatos"""
+    return {doc["_id"] async for doc in db[MIGRATIONS_COLLECTION].find({}, {"_id": 1})}
+
+
+async def _acquire_migration_lock(db, owner: str) -> bool:
+    """Toma (o renueva) el lease de migraciones; False si lo tiene otro proceso"""
+    now = datetime.now()
+    try:
+        await db[MIGRATIONS_LOCK_COLLECTION].update_one(
+            {"_id": "migrations", "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=MIGRATIONS_LOCK_TTL_S)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # El documento existe, no ha caducado y es de otro proceso
+        return False
+    return True
+
+
+async def _release_migration_lock(db, owner: str):
+    await db[MIGRATIONS_LOCK_COLLECTION].delete_one({"_id": "migrations", "owner": owner})
+
+
+async def run_migrations(db=None) -> list:
+    """
+    Aplica en orden las migraciones pendientes y devuelve las versiones aplicadas.
+
+    Si un paso falla (por ejemplo, un índice único con datos duplicados) se
+    registra el error y se detiene la ejecución sin marcarlo como aplicado, para
+    reintentarlo en el siguiente arranque. Los pasos se ejecutan bajo un lease en
+    MIGRATIONS_LOCK_COLLECTION: si otro worker lo tiene, se espera a que termine
+    y se comprueba de nuevo qué falta.
+    """
+    db = db if db is not None else await get_database()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + MIGRATIONS_LOCK_WAIT_S
+    while True:
+        done = await applied_migrations(db)
+        if all(version in done for version, _, _ in MIGRATIONS):
+            logger.info("Esquema al día: no hay migraciones pendientes")
+            return []
+        if await _acquire_migration_lock(db, owner):
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Otro proceso tiene el lease de migraciones desde hace más de {MIGRATIONS_LOCK_WAIT_S}s")
+        logger.info("Otro worker está aplicando las migraciones; esperando...")
+        await asyncio.sleep(1)
+
+    applied = []
+    try:
+        # Releer con el lease tomado: otro worker puede haber terminado entretanto
+        done = await applied_migrations(db)
+        for version, description, migration in MIGRATIONS:
+            if version in done:
+                continue
+            if not await _acquire_migration_lock(db, owner):
+                logger.error("Se perdió el lease de migraciones; se detiene la ejecución")
+                break
+            logger.info(f"Aplicando migración {version}: {description}")
+            try:
+                with span(f"migration_{version}", endpoint="database"):
+                    await migration(db)
+            except Exception as e:
+                logger.error(f"Error en la migración {version} ({description}): {str(e)}")
+                break
+            await db[MIGRATIONS_COLLECTION].update_one(
+                {"_id": version},
+                {"$set": {"description": description, "applied_at": datetime.now()}},
+                upsert=True
+            )
+            applied.append(version)
+    finally:
+        await _release_migration_lock(db, owner)
+    if applied:
+        logger.info(f"Migraciones aplicadas: {applied}")
+    else:
+        logger.info("Esquema al día: no hay migraciones pendientes")
+    return applied
+
+
+async def index_usage_stats(db=None, collections=("usuarios", "logs", "albums", "tracks")) -> dict:
+    """Uso de cada índice ($indexStats): número de operaciones y desde cuándo se cuentan"""
+    db = db if db is not None else await get_database()
+    stats = {}
+    for collection in collections:
+        stats[collection] = [
+            {
+                "name": index["name"],
+                "key": dict(index["key"]),
+                "ops": index["accesses"]["ops"],
+                "since": index["accesses"]["since"].isoformat()
+            }
+            async for index in db[collection].aggregate([{"$indexStats": {}}])
+        ]
+    return stats
+
+
+async def _main(command: str):
+    try:
+        db = await get_database()
+        if command == "migrate":
+            await run_migrations(db)
+        elif command == "status":
+            done = await applied_migrations(db)
+            for version, description, _ in MIGRATIONS:
+                print(f"{version:>3}  {'aplicada ' if version in done else 'pendiente'}  {description}")
+        elif command == "index-stats":
+            for collection, indexes in (await index_usage_stats(db)).items():
+                print(f"\n{collection}")
+                for index in indexes:
+                    print(f"  {index['name']:<24} ops={index['ops']:<10} desde {index['since']}  {index['key']}")
+    finally:
+        await mongo_connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from log_config import setup_logging
+
+    setup_logging(log_file=os.getenv("LOG_FILE", "database.log"))
+
+    parser = argparse.ArgumentParser(description="Migraciones de esquema de face_login_db")
+    parser.add_argument("command", choices=["migrate", "status", "index-stats"],
+                        help="migrate: aplica las pendientes; status: lista las migraciones; index-stats: uso de índices")
+    asyncio.run(_main(parser.parse_args().command))
@@ -0,0 +1,101 @@
+"""
+Planificador de micro-lotes para el pool de reconocimiento facial.
+
+Agrupa las imágenes que llegan dentro de una ventana corta (max_wait_ms) o hasta
+completar max_batch_size y reparte cada lote en un sub-lote por proceso del pool
+(cada sub-lote es una tarea que se ejecuta en serie dentro de su proceso), de modo
+que todos los procesos trabajan a la vez. Después entrega los resultados a cada
+handler que espera. Así se amortiza el coste fijo por tarea (serialización, IPC y
+planificación) en ráfagas de logins simultáneos sin dejar procesos ociosos.
+"""
+import asyncio
+import logging
+import os
+
+from face_pipeline import FaceImageError, process_batch
+from face_worker import face_pool
+
+logger = logging.getLogger("face_batcher")
+
+
+class FaceBatchScheduler:
+    def __init__(self, pipeline, pool=None, max_batch_size: int = None, max_wait_ms: float = None):
+        self._pipeline = pipeline
+        self._pool = pool or face_pool
+        self.max_batch_size = max_batch_size or int(os.getenv("FACE_BATCH_MAX_SIZE", 8))
+        self.max_wait_ms = max_wait_ms if max_wait_ms is not None else float(os.getenv("FACE_BATCH_MAX_WAIT_MS", 10))
+        self._pending = []
+        self._flush_handle = None
+        # Referencias a los sub-lotes en curso: una tarea sin referencias puede recogerla el GC
+        self._tasks = set()
+        self._batches = 0
+        self._items = 0
+
+    async def submit(self, contents: bytes):
+        """Encola una imagen y espera el resultado de su lote"""
+        if self.max_batch_size <= 1:
+            return await self._pool.submit(self._pipeline, contents)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((contents, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+
+        # Las peticiones canceladas mientras esperaban el lote (p. ej. un login cuya
+        # contraseña ya falló) no llegan al pool
+        batch = [(contents, future) for contents, future in self._pending if not future.cancelled()]
+        self._pending = []
+        if not batch:
+            return
+        self._batches += 1
+        self._items += len(batch)
+        # Un sub-lote por proceso: enviar el lote entero como una tarea lo serializaría en un solo proceso
+        parts = min(len(batch), max(1, self._pool.max_workers))
+        for i in range(parts):
+            task = asyncio.ensure_future(self._run_batch(batch[i::parts]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list):
+        try:
+            results = await self._pool.submit(process_batch, self._pipeline, [contents for contents, _ in batch])
+        except Exception as e:
+            # Error del pool (saturación, proceso caído): afecta a todo el lote
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), outcome in zip(batch, results):
+            if future.done():
+                continue
+            if outcome["ok"]:
+                future.set_result(outcome["result"])
+            elif outcome["image_error"]:
+                future.set_exception(FaceImageError(outcome["error"]))
+            else:
+                future.set_exception(RuntimeError(outcome["error"]))
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "pending": len(self._pending),
+            "in_flight_batches": len(self._tasks),
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0
+        }
@@ -0,0 +1,155 @@
+"""
+Caché por contenido de los resultados del pipeline facial.
+
+Los usuarios reintentan /login/face con el mismo frame y el frontend reenvía la
+petición tras un error de red. La clave es un hash del contenido subido junto
+con el pipeline y sus parámetros, así que un reintento idéntico devuelve las
+ubicaciones y la codificación sin volver a decodificar ni ejecutar HOG.
+
+También se cachean los errores de validación ("no se detectó ningún rostro") y
+las peticiones idénticas simultáneas comparten una sola ejecución.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from face_pipeline import FaceImageError, pipeline_params
+
+logger = logging.getLogger("face_cache")
+
+
+class FaceResultCache:
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries or int(os.getenv("FACE_CACHE_MAX_ENTRIES", 1024))
+        self.max_bytes = max_bytes or int(float(os.getenv("FACE_CACHE_MAX_MB", 64)) * 1024 * 1024)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("FACE_CACHE_TTL_S", 300))
+        self._entries = OrderedDict()  # clave -> (expira, tamaño, resultado, error)
+        self._in_flight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared = 0
+
+    @staticmethod
+    def make_key(pipeline, contents: bytes, content_digest: str = None) -> str:
+        """content_digest es el hash ya calculado al recibir la subida (upload_ingest); si no, se calcula aquí"""
+        if content_digest is None:
+            content_digest = hashlib.blake2b(contents, digest_size=20).hexdigest()
+        digest = hashlib.blake2b(content_digest.encode(), digest_size=20)
+        digest.update(repr((pipeline.__name__, pipeline_params())).encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _entry_size(result, error) -> int:
+        if result is None:
+            return 200 + len(error or "")
+        size = 1500  # codificación (128 floats), ubicaciones y estructura del dict
+        if isinstance(result.get("face_image"), (bytes, bytearray)):
+            size += len(result["face_image"])
+        return size
+
+    def get(self, key: str):
+        """Devuelve (resultado, error) o None si no está en caché o ha expirado"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, result, error = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return result, error
+
+    def put(self, key: str, result=None, error: str = None):
+        size = self._entry_size(result, error)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, size, result, error)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size, _, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    async def get_or_run(self, pipeline, contents: bytes, runner, content_digest: str = None):
+        """Devuelve el resultado cacheado o ejecuta runner(contents) y lo guarda"""
+        key = self.make_key(pipeline, contents, content_digest)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            result, error = cached
+            if error is not None:
+                raise FaceImageError(error)
+            return result
+
+        # Una petición idéntica ya se está procesando: esperar su resultado
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Se canceló la petición que ejecutaba el pipeline (p. ej. un /login/face con la
+                # contraseña incorrecta), no ésta: se repite como propietaria
+                if pending.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.get_or_run(pipeline, contents, runner, content_digest)
+                raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await runner(contents)
+        except FaceImageError as e:
+            self.put(key, error=str(e))
+            future.set_exception(e)
+            raise
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, result=result)
+            future.set_result(result)
+            return result
+        finally:
+            self._in_flight.pop(key, None)
+            # Evita el aviso "exception was never retrieved" si nadie más esperaba
+            if future.done() and not future.cancelled():
+                future.exception()
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_mb": round(self._bytes / 1024 / 1024, 3),
+            "max_memory_mb": round(self.max_bytes / 1024 / 1024, 3),
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_in_flight": self.shared,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+# Instancia global de la caché
+face_cache = FaceResultCache()
@@ -0,0 +1,451 @@
+"""
+Índice en memoria de las codificaciones faciales de `usuarios` para identificación 1:N.
+
+Todas las codificaciones se guardan en una matriz float32 contigua (una fila por
+usuario) junto con sus normas al cuadrado, de modo que la distancia euclídea a
+todos los usuarios se calcula con un único producto matriz-vector:
+
+    ||m - q||² = ||m||² - 2·m·q + ||q||²
+
+La matriz se carga al arrancar y se actualiza incrementalmente en registro,
+actualización y borrado de usuarios. Se persiste en un fichero local
+(FACE_INDEX_PATH) para que un reinicio sólo tenga que reconciliar los `_id`
+con MongoDB en lugar de volver a descargar todas las codificaciones. Con varios
+workers (serve.py) comparten el fichero: cada uno escribe en un temporal propio y
+sólo uno a la vez lo sustituye (lock con flock); los demás omiten el guardado.
+
+Hay dos implementaciones intercambiables (FACE_INDEX_BACKEND):
+  - exact: búsqueda exacta por fuerza bruta (FaceEmbeddingIndex)
+  - ivf: índice aproximado por listas invertidas sobre k-means (IVFFaceIndex),
+    pensado para más de ~1M de usuarios
+"""
+import fcntl
+import logging
+import os
+import uuid
+
+import numpy as np
+from bson import ObjectId
+
+logger = logging.getLogger("face_index")
+
+ENCODING_DIM = 128
+# Más estricto que el 0.6 de compare_faces: en 1:N cada usuario extra es una oportunidad de falso positivo
+IDENTIFY_THRESHOLD = float(os.getenv("FACE_IDENTIFY_THRESHOLD", 0.5))
+# Un rostro nuevo a menos de esta distancia de un usuario existente se considera registro duplicado
+DUPLICATE_THRESHOLD = float(os.getenv("FACE_DUPLICATE_THRESHOLD", IDENTIFY_THRESHOLD))
+# "flag" marca el usuario nuevo con duplicate_of; "reject" rechaza el registro con 409
+DUPLICATE_POLICY = os.getenv("FACE_DUPLICATE_POLICY", "flag")
+INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "exact")
+INDEX_PATH = os.getenv("FACE_INDEX_PATH", "face_index.npz")
+IVF_NPROBE = int(os.getenv("FACE_IVF_NPROBE", 16))
+IVF_MIN_TRAIN = int(os.getenv("FACE_IVF_MIN_TRAIN", 1000))
+# Usuarios que entran en el índice
+INDEXED_QUERY = {"face_encoding": {"$exists": True, "$ne": None}}
+
+
+class FaceEmbeddingIndex:
+    def __init__(self, dim: int = ENCODING_DIM, initial_capacity: int = 1024):
+        self._dim = dim
+        self._initial_capacity = initial_capacity
+        self.clear()
+
+    def clear(self):
+        self._matrix = np.zeros((self._initial_capacity, self._dim), dtype=np.float32)
+        self._sq_norms = np.zeros(self._initial_capacity, dtype=np.float32)
+        self._ids = []
+        self._usernames = []
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._rows
+
+    def _grow(self):
+        capacity = self._matrix.shape[0] * 2
+        matrix = np.zeros((capacity, self._dim), dtype=np.float32)
+        matrix[:len(self)] = self._matrix[:len(self)]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[:len(self)] = self._sq_norms[:len(self)]
+        self._matrix, self._sq_norms = matrix, sq_norms
+
+    def upsert(self, user_id, username: str, encoding):
+        """Inserta o reemplaza la codificación de un usuario"""
+        self._upsert_row(user_id, username, encoding)
+
+    def _upsert_row(self, user_id, username: str, encoding):
+        user_id = str(user_id)
+        vector = np.asarray(encoding, dtype=np.float32)
+        if vector.shape != (self._dim,):
+            logger.warning(f"Codificación con forma inválida para {username}: {vector.shape}")
+            return
+
+        row = self._rows.get(user_id)
+        if row is None:
+            if len(self) == self._matrix.shape[0]:
+                self._grow()
+            row = len(self)
+            self._rows[user_id] = row
+            self._ids.append(user_id)
+            self._usernames.append(username)
+        else:
+            self._usernames[row] = username
+
+        self._matrix[row] = vector
+        self._sq_norms[row] = vector @ vector
+
+    def remove(self, user_id):
+        """Elimina un usuario moviendo la última fila a su hueco (O(1))"""
+        user_id = str(user_id)
+        row = self._rows.pop(user_id, None)
+        if row is None:
+            return
+        last = len(self) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            self._ids[row] = self._ids[last]
+            self._usernames[row] = self._usernames[last]
+            self._rows[self._ids[row]] = row
+        self._ids.pop()
+        self._usernames.pop()
+
+    def search(self, encoding, k: int = 1) -> list:
+        """Devuelve los k usuarios más cercanos como [(user_id, username, distancia)]"""
+        n = len(self)
+        if n == 0:
+            return []
+        query = np.asarray(encoding, dtype=np.float32)
+        sq_dists = self._sq_norms[:n] - 2.0 * (self._matrix[:n] @ query) + query @ query
+        np.maximum(sq_dists, 0.0, out=sq_dists)
+
+        k = min(k, n)
+        if k == 1:
+            nearest = [int(np.argmin(sq_dists))]
+        else:
+            candidates = np.argpartition(sq_dists, k - 1)[:k]
+            nearest = candidates[np.argsort(sq_dists[candidates])]
+        return [(self._ids[i], self._usernames[i], float(np.sqrt(sq_dists[i]))) for i in nearest]
+
+    def identify(self, encoding, threshold: float = None):
+        """Usuario más cercano si su distancia no supera el umbral; None en otro caso"""
+        threshold = IDENTIFY_THRESHOLD if threshold is None else threshold
+        matches = self.search(encoding, k=1)
+        if matches and matches[0][2] <= threshold:
+            return matches[0]
+        return None
+
+    def find_duplicate(self, encoding, threshold: float = None):
+        """Usuario ya registrado con un rostro casi idéntico, o None"""
+        return self.identify(encoding, DUPLICATE_THRESHOLD if threshold is None else threshold)
+
+    def _state(self) -> dict:
+        n = len(self)
+        return {
+            "matrix": self._matrix[:n],
+            "ids": np.array(self._ids, dtype=str),
+            "usernames": np.array([u or "" for u in self._usernames], dtype=str)
+        }
+
+    def _restore(self, state):
+        matrix = np.asarray(state["matrix"], dtype=np.float32)
+        n = len(matrix)
+        self.clear()
+        if n > self._matrix.shape[0]:
+            self._matrix = np.zeros((n, self._dim), dtype=np.float32)
+            self._sq_norms = np.zeros(n, dtype=np.float32)
+        self._matrix[:n] = matrix
+        self._sq_norms[:n] = np.einsum('ij,ij->i', matrix, matrix)
+        self._ids = [str(user_id) for user_id in state["ids"]]
+        self._usernames = [str(username) or None for username in state["usernames"]]
+        self._rows = {user_id: row for row, user_id in enumerate(self._ids)}
+
+    def save(self, path: str = None):
+        """Guarda el índice en un fichero .npz local"""
+        path = INDEX_PATH if path is None else path
+        if not path:
+            return
+        with open(f"{path}.lock", "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info(f"Otro worker está guardando el índice facial en {path}; se omite")
+                return
+            tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npz"
+            try:
+                np.savez(tmp_path, backend=type(self).__name__, **self._state())
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        logger.info(f"Índice facial guardado en {path}: {len(self)} usuarios")
+
+    def load_file(self, path: str = None) -> bool:
+        """Carga el índice desde fichero; devuelve False si no existe o no es compatible"""
+        path = INDEX_PATH if path is None else path
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as state:
+                if str(state["backend"]) != type(self).__name__:
+                    logger.warning(f"El fichero {path} pertenece a otro backend ({state['backend']}); se reconstruye")
+                    return False
+                self._restore(state)
+        except Exception as e:
+            logger.warning(f"No se pudo leer el índice facial {path}: {str(e)}")
+            return False
+        logger.info(f"Índice facial leído de {path}: {len(self)} usuarios")
+        return True
+
+    async def load(self, collection, path: str = None):
+        """
+        Carga el índice: desde el fichero local si existe (reconciliando sólo los
+        `_id` con MongoDB) o descargando todas las codificaciones en otro caso.
+        """
+        if self.load_file(path):
+            await self.reconcile(collection)
+        else:
+            self.clear()
+            cursor = collection.find(INDEXED_QUERY, {"username": 1, "face_encoding": 1}).batch_size(5000)
+            async for doc in cursor:
+                # Carga masiva sin mantener estructuras auxiliares; _after_load las construye al final
+                self._upsert_row(doc["_id"], doc.get("username"), doc["face_encoding"])
+        self._after_load()
+        logger.info(f"Índice facial cargado: {len(self)} usuarios")
+        try:
+            self.save(path)
+        except Exception as e:
+            # El índice en memoria ya es válido: un fallo al persistirlo no invalida la carga
+            logger.warning(f"No se pudo guardar el índice facial: {str(e)}")
+
+    def _after_load(self):
+        pass
+
+    async def reconcile(self, collection) -> tuple:
+        """
+        Iguala los usuarios del índice con los de MongoDB comparando sólo los `_id`:
+        quita los borrados y lee los que faltan. Devuelve (añadidos, eliminados).
+        """
+        db_ids = set()
+        async for doc in collection.find(INDEXED_QUERY, {"_id": 1}).batch_size(20000):
+            db_ids.add(str(doc["_id"]))
+        stale = set(self._ids) - db_ids
+        missing = [ObjectId(user_id) for user_id in db_ids - set(self._ids)]
+        for user_id in stale:
+            self.remove(user_id)
+        for start in range(0, len(missing), 1000):
+            await self.refresh(collection, {"_id": {"$in": missing[start:start + 1000]}})
+        if missing or stale:
+            logger.info(f"Índice facial reconciliado: {len(missing)} añadidos, {len(stale)} eliminados")
+        return len(missing), len(stale)
+
+    async def refresh(self, collection, query: dict):
+        """Vuelve a leer de la base de datos los usuarios que cumplen `query` tras una actualización"""
+        cursor = collection.find(query, {"username": 1, "face_encoding": 1})
+        async for doc in cursor:
+            if doc.get("face_encoding"):
+                self.upsert(doc["_id"], doc.get("username"), doc["face_encoding"])
+            else:
+                self.remove(doc["_id"])
+
+    def stats(self) -> dict:
+        return {
+            "backend": "exact",
+            "users": len(self),
+            "capacity": self._matrix.shape[0],
+            "memory_mb": round((self._matrix.nbytes + self._sq_norms.nbytes) / 1024 / 1024, 2),
+            "threshold": IDENTIFY_THRESHOLD
+        }
+
+
+class IVFFaceIndex(FaceEmbeddingIndex):
+    """
+    Índice aproximado de listas invertidas (IVF) en numpy puro.
+
+    Las codificaciones se agrupan con k-means en `nlist` centroides; cada fila
+    pertenece a la lista de su centroide más cercano. Una búsqueda sólo calcula
+    distancias exactas sobre las filas de las `nprobe` listas más cercanas a la
+    consulta. Mientras haya menos de `min_train` usuarios se comporta como el
+    índice exacto.
+    """
+
+    def __init__(self, dim: int = ENCODING_DIM, initial_capacity: int = 1024,
+                 nprobe: int = None, min_train: int = None):
+        self.nprobe = nprobe or IVF_NPROBE
+        self.min_train = min_train or IVF_MIN_TRAIN
+        super().__init__(dim, initial_capacity)
+
+    def clear(self):
+        super().clear()
+        self._centroids = None
+        self._trained_size = 0
+        self._lists = []
+        self._assign = []
+        self._pos = []
+
+    # --- Gestión de listas invertidas (fila -> lista, posición dentro de la lista) ---
+
+    def _nearest_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        c_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), 65536):
+            chunk = vectors[start:start + 65536]
+            assignments[start:start + 65536] = np.argmin(c_norms - 2.0 * (chunk @ self._centroids.T), axis=1)
+        return assignments
+
+    def _list_add(self, row: int, list_id: int):
+        lst = self._lists[list_id]
+        if row == len(self._assign):
+            self._assign.append(list_id)
+            self._pos.append(len(lst))
+        else:
+            self._assign[row] = list_id
+            self._pos[row] = len(lst)
+        lst.append(row)
+
+    def _list_discard(self, row: int):
+        lst = self._lists[self._assign[row]]
+        tail = lst.pop()
+        if tail != row:
+            lst[self._pos[row]] = tail
+            self._pos[tail] = self._pos[row]
+
+    def _list_move(self, old_row: int, new_row: int):
+        list_id, pos = self._assign[old_row], self._pos[old_row]
+        self._lists[list_id][pos] = new_row
+        self._assign[new_row] = list_id
+        self._pos[new_row] = pos
+
+    def train(self, nlist: int = None, iterations: int = 10, sample_size: int = 50000, seed: int = 0):
+        """Entrena los centroides con k-means sobre una muestra y reasigna todas las filas"""
+        n = len(self)
+        if n == 0:
+            return
+        data = self._matrix[:n]
+        nlist = min(n, nlist or max(1, min(4096, int(np.sqrt(n)))))
+        rng = np.random.default_rng(seed)
+        sample = data[rng.choice(n, size=min(n, sample_size), replace=False)]
+
+        self._centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = self._nearest_centroids(sample)
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(self._centroids)
+            np.add.at(sums, labels, sample)
+            empty = counts == 0
+            self._centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Las listas vacías se re-siembran con puntos aleatorios de la muestra
+            if empty.any():
+                self._centroids[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+
+        assignments = self._nearest_centroids(data)
+        self._lists = [[] for _ in range(nlist)]
+        self._assign, self._pos = [], []
+        for row, list_id in enumerate(assignments.tolist()):
+            self._list_add(row, list_id)
+        self._trained_size = n
+        logger.info(f"Índice IVF entrenado: {n} usuarios en {nlist} listas")
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def upsert(self, user_id, username: str, encoding):
+        existing_row = self._rows.get(str(user_id))
+        super().upsert(user_id, username, encoding)
+        row = self._rows.get(str(user_id))
+        if row is None:
+            return
+        if not self.is_trained:
+            # El entrenamiento inicial es barato con pocos usuarios
+            if len(self) >= self.min_train:
+                self.train()
+            return
+        if existing_row is not None:
+            self._list_discard(row)
+        list_id = int(self._nearest_centroids(self._matrix[row:row + 1])[0])
+        self._list_add(row, list_id)
+
+    def remove(self, user_id):
+        row = self._rows.get(str(user_id))
+        if row is not None and self.is_trained:
+            last = len(self) - 1
+            self._list_discard(row)
+            if row != last:
+                self._list_move(last, row)
+            self._assign.pop()
+            self._pos.pop()
+        super().remove(user_id)
+
+    def search(self, encoding, k: int = 1, nprobe: int = None) -> list:
+        if not self.is_trained:
+            return super().search(encoding, k)
+        query = np.asarray(encoding, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+
+        c_dists = np.einsum('ij,ij->i', self._centroids, self._centroids) - 2.0 * (self._centroids @ query)
+        probes = np.argpartition(c_dists, nprobe - 1)[:nprobe]
+        rows = [row for list_id in probes for row in self._lists[list_id]]
+        if not rows:
+            return []
+        rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+        sq_dists = self._sq_norms[rows] - 2.0 * (self._matrix[rows] @ query) + query @ query
+        np.maximum(sq_dists, 0.0, out=sq_dists)
+        k = min(k, len(rows))
+        best = np.argpartition(sq_dists, k - 1)[:k]
+        best = best[np.argsort(sq_dists[best])]
+        return [(self._ids[rows[i]], self._usernames[rows[i]], float(np.sqrt(sq_dists[i]))) for i in best]
+
+    def _state(self) -> dict:
+        state = super()._state()
+        if self.is_trained:
+            state["centroids"] = self._centroids
+            state["assign"] = np.array(self._assign, dtype=np.int64)
+        return state
+
+    def _restore(self, state):
+        super()._restore(state)
+        if "centroids" not in state:
+            return
+        # super()._restore restauró las filas en el mismo orden en que se guardaron
+        self._centroids = state["centroids"]
+        self._lists = [[] for _ in range(len(self._centroids))]
+        self._assign, self._pos = [], []
+        for row, list_id in enumerate(state["assign"].tolist()):
+            self._list_add(row, list_id)
+        self._trained_size = len(self)
+
+    def _after_load(self):
+        # Reentrenar si no hay centroides o el índice ha crecido mucho desde el último entrenamiento
+        if len(self) >= self.min_train and (not self.is_trained or len(self) > 4 * self._trained_size):
+            self.train()
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        sizes = [len(lst) for lst in self._lists]
+        stats.update({
+            "backend": "ivf",
+            "trained": self.is_trained,
+            "nlist": len(self._lists),
+            "nprobe": self.nprobe,
+            "trained_size": self._trained_size,
+            "max_list_size": max(sizes) if sizes else 0
+        })
+        return stats
+
+
+def create_face_index(backend: str = None) -> FaceEmbeddingIndex:
+    """Crea el índice configurado en FACE_INDEX_BACKEND ("exact" o "ivf")"""
+    backend = backend or INDEX_BACKEND
+    if backend == "ivf":
+        return IVFFaceIndex()
+    if backend != "exact":
+        logger.warning(f"Backend de índice facial desconocido '{backend}', se usa 'exact'")
+    return FaceEmbeddingIndex()
+
+
+# Instancia global del índice
+face_index = create_face_index()
@@ -0,0 +1,291 @@
+"""
+Etapas de procesamiento de imágenes faciales.
+
+Todas las funciones de este módulo son trabajo puro de CPU (PIL, numpy y dlib)
+y se ejecutan dentro de los procesos del pool de face_worker, nunca en el
+event loop de FastAPI.
+"""
+import contextlib
+import io
+import logging
+import math
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+logger = logging.getLogger("face_pipeline")
+
+ALLOWED_FORMATS = ['JPEG', 'PNG']
+MIN_IMAGE_SIZE = 50
+
+NO_FACE_REGISTER_MSG = "No se detectó ningún rostro en la imagen. Por favor, use una imagen clara de su rostro"
+NO_FACE_LOGIN_MSG = "No se detectó ningún rostro en la imagen. Por favor, asegúrese de tener buena iluminación y que su rostro esté claramente visible"
+MANY_FACES_MSG = "Se detectó más de un rostro en la imagen. Por favor, use una imagen con un solo rostro"
+
+# El detector HOG de dlib usa una ventana de 80x80 píxeles: los rostros más pequeños
+# sólo se detectan con upsampling y los más grandes se pueden reducir sin perder recall
+HOG_WINDOW_PX = 80
+# Tamaño mínimo esperado de un rostro como fracción del lado corto de la imagen
+MIN_FACE_FRACTION = float(os.getenv("FACE_DETECT_MIN_FACE_FRACTION", 0.2))
+MAX_UPSAMPLE = int(os.getenv("FACE_DETECT_MAX_UPSAMPLE", 2))
+# Margen alrededor del rostro al recortar la región que se codifica
+CROP_MARGIN = 0.3
+# dlib codifica cada rostro sobre un recorte alineado de 150x150 píxeles con un 25% de
+# margen por lado, así que el rostro ocupa unos 100 píxeles: en el login los JPEG se
+# decodifican reducidos (DCT a 1/2, 1/4 o 1/8) mientras el rostro más pequeño
+# esperado siga ocupando al menos ese tamaño
+ENCODE_MIN_FACE_PX = 100
+LOGIN_DRAFT_DECODE = os.getenv("FACE_LOGIN_DRAFT_DECODE", "true").lower() == "true"
+BRIGHTNESS_FACTOR = 1.2
+CONTRAST_FACTOR = 1.3
+
+
+class FaceImageError(Exception):
+    """Error de validación de la imagen; su mensaje se devuelve al cliente con un 400"""
+
+
+@contextlib.contextmanager
+def timed(timings: dict, stage: str):
+    """Acumula en timings[stage] los segundos que tarda el bloque (no hace nada si timings es None)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def open_image(contents: bytes) -> Image.Image:
+    """Abre la imagen y valida formato y dimensiones mínimas"""
+    image = Image.open(io.BytesIO(contents))
+    logger.debug(f"Formato de imagen: {image.format}, modo: {image.mode}, tamaño: {image.size}")
+
+    if image.format not in ALLOWED_FORMATS:
+        raise FaceImageError("Por favor, use una imagen en formato JPEG o PNG")
+
+    if image.size[0] < MIN_IMAGE_SIZE or image.size[1] < MIN_IMAGE_SIZE:
+        raise FaceImageError("La imagen es demasiado pequeña. Debe ser al menos 50x50 píxeles")
+
+    return image
+
+
+def enhance_image(image: Image.Image) -> Image.Image:
+    """Ajusta brillo (+20%) y contraste (+30%) para mejorar la detección"""
+    image = ImageEnhance.Brightness(image).enhance(BRIGHTNESS_FACTOR)
+    image = ImageEnhance.Contrast(image).enhance(CONTRAST_FACTOR)
+    return image
+
+
+def decode_login_image(contents: bytes, draft: bool = None) -> tuple:
+    """
+    Decodifica la imagen del login en RGB y devuelve (imagen, escala), donde escala
+    es el factor para volver a coordenadas de la imagen original.
+
+    Los JPEG se decodifican con draft() al tamaño mínimo que conserva un rostro de
+    ENCODE_MIN_FACE_PX píxeles: libjpeg escala en la DCT y convierte a RGB al decodificar,
+    así que ni se genera la imagen completa ni hace falta otra pasada de convert().
+    """
+    draft = LOGIN_DRAFT_DECODE if draft is None else draft
+    image = open_image(contents)
+    original_width = image.size[0]
+    expected_face_px = min(image.size) * MIN_FACE_FRACTION
+    if draft and image.format == 'JPEG' and expected_face_px > ENCODE_MIN_FACE_PX:
+        reduction = ENCODE_MIN_FACE_PX / expected_face_px
+        image.draft('RGB', (math.ceil(image.size[0] * reduction), math.ceil(image.size[1] * reduction)))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.load()
+    return image, original_width / image.size[0]
+
+
+def enhancement_lut(image: Image.Image) -> list:
+    """
+    Tabla de 768 entradas (256 por banda) equivalente a enhance_image.
+
+    El brillo es una función de cada nivel; el contraste mezcla con la luminancia
+    media de la imagen ya aclarada, que se obtiene del histograma (una lectura, sin
+    copias) aplicando la tabla de brillo a cada banda. Las operaciones replican a
+    Image.blend (float32 y truncado), así que el resultado coincide con las dos
+    pasadas de ImageEnhance salvo redondeos de la media.
+    """
+    levels = np.arange(256, dtype=np.float32)
+    bright = np.clip(levels * np.float32(BRIGHTNESS_FACTOR), 0, 255).astype(np.uint8)
+    histogram = np.asarray(image.histogram(), dtype=np.float64).reshape(3, 256)
+    band_means = histogram @ bright / histogram.sum(axis=1)
+    # Pesos de la conversión a "L" de PIL (ITU-R 601-2)
+    mean = int(float(band_means @ np.array([0.299, 0.587, 0.114])) + 0.5)
+    contrast = mean + np.float32(CONTRAST_FACTOR) * (bright.astype(np.float32) - np.float32(mean))
+    return np.tile(np.clip(contrast, 0, 255).astype(np.uint8), 3).tolist()
+
+
+def normalize_image(image: Image.Image) -> Image.Image:
+    """Brillo y contraste de enhance_image en una sola pasada (Image.point con la tabla precalculada)"""
+    return image.point(enhancement_lut(image))
+
+
+def scale_locations(face_locations: list, scale: float) -> list:
+    """Pasa cajas (top, right, bottom, left) a coordenadas de la imagen original"""
+    if scale == 1.0:
+        return face_locations
+    return [tuple(int(round(v * scale)) for v in location) for location in face_locations]
+
+
+def detect_faces(np_image: np.ndarray, upsample: int = 1, retry_upsample: int = None, timings: dict = None) -> list:
+    """Detecta rostros con HOG; si no encuentra ninguno y hay retry_upsample, reintenta"""
+    import face_recognition
+
+    with timed(timings, "detect"):
+        face_locations = face_recognition.face_locations(np_image, model='hog', number_of_times_to_upsample=upsample)
+    if not face_locations and retry_upsample is not None:
+        logger.debug("Intento adicional con diferentes parámetros...")
+        with timed(timings, "detect_retry"):
+            face_locations = face_recognition.face_locations(np_image, model='hog', number_of_times_to_upsample=retry_upsample)
+    return face_locations
+
+
+def detection_plan(size: tuple, min_face_fraction: float = None) -> tuple:
+    """
+    Calcula (escala, upsample) para que el rostro más pequeño esperado ocupe
+    aproximadamente la ventana del detector HOG.
+
+    Las imágenes grandes se reducen (escala < 1, sin upsample) y las pequeñas se
+    analizan a tamaño completo con el upsample mínimo necesario.
+    """
+    min_face_fraction = min_face_fraction or MIN_FACE_FRACTION
+    expected_face_px = min(size) * min_face_fraction
+    if expected_face_px >= HOG_WINDOW_PX:
+        return HOG_WINDOW_PX / expected_face_px, 0
+    upsample = math.ceil(math.log2(HOG_WINDOW_PX / expected_face_px))
+    return 1.0, min(upsample, MAX_UPSAMPLE)
+
+
+def detect_faces_scaled(image: Image.Image, retry: bool = False, min_face_fraction: float = None, timings: dict = None) -> list:
+    """
+    Detecta rostros sobre una copia reducida de la imagen y devuelve las cajas
+    (top, right, bottom, left) en coordenadas de la imagen original.
+
+    Con retry=True, si no encuentra ningún rostro repite con un nivel más de
+    upsample sobre la misma copia reducida.
+    """
+    scale, upsample = detection_plan(image.size, min_face_fraction)
+    with timed(timings, "resize"):
+        if scale < 1.0:
+            small_size = (max(1, round(image.size[0] * scale)), max(1, round(image.size[1] * scale)))
+            small = image.resize(small_size, Image.BILINEAR, reducing_gap=2.0)
+        else:
+            small = image
+        np_small = np.asarray(small)
+
+    face_locations = detect_faces(np_small, upsample=upsample, retry_upsample=upsample + 1 if retry else None, timings=timings)
+    if scale >= 1.0:
+        return face_locations
+
+    width, height = image.size
+    return [
+        (
+            max(0, int(top / scale)),
+            min(width, int(math.ceil(right / scale))),
+            min(height, int(math.ceil(bottom / scale))),
+            max(0, int(left / scale))
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def encode_face_region(image: Image.Image, face_locations: list, no_face_msg: str, timings: dict = None) -> np.ndarray:
+    """
+    Igual que encode_single_face, pero sólo convierte a numpy el recorte del rostro
+    (con margen) en lugar de la imagen completa.
+    """
+    if not face_locations:
+        raise FaceImageError(no_face_msg)
+    if len(face_locations) > 1:
+        raise FaceImageError(MANY_FACES_MSG)
+
+    top, right, bottom, left = face_locations[0]
+    margin_x = int((right - left) * CROP_MARGIN)
+    margin_y = int((bottom - top) * CROP_MARGIN)
+    crop_left, crop_top = max(0, left - margin_x), max(0, top - margin_y)
+    crop_right = min(image.size[0], right + margin_x)
+    crop_bottom = min(image.size[1], bottom + margin_y)
+
+    np_crop = np.asarray(image.crop((crop_left, crop_top, crop_right, crop_bottom)))
+    relative_location = (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)
+    with timed(timings, "encode"):
+        return encode_single_face(np_crop, [relative_location], no_face_msg)
+
+
+def encode_single_face(np_image: np.ndarray, face_locations: list, no_face_msg: str) -> np.ndarray:
+    """Exige exactamente un rostro y devuelve su codificación de 128 dimensiones"""
+    import face_recognition
+
+    if not face_locations:
+        raise FaceImageError(no_face_msg)
+    if len(face_locations) > 1:
+        raise FaceImageError(MANY_FACES_MSG)
+
+    return face_recognition.face_encodings(np_image, face_locations)[0]
+
+
+def process_registration_image(contents: bytes) -> dict:
+    """Pipeline de registro: valida, codifica el rostro y re-codifica la imagen como JPEG"""
+    timings = {}
+    with timed(timings, "decode"):
+        image = open_image(contents).convert('RGB')
+
+    face_locations = detect_faces_scaled(image, timings=timings)
+    face_encoding = encode_face_region(image, face_locations, NO_FACE_REGISTER_MSG, timings)
+
+    with timed(timings, "jpeg_encode"):
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='JPEG')
+
+    return {
+        "face_locations": face_locations,
+        "face_encoding": face_encoding.tolist(),
+        "face_image": img_byte_arr.getvalue(),
+        "timings": timings
+    }
+
+
+def process_login_image(contents: bytes) -> dict:
+    """Pipeline de login: decodifica reducido, normaliza en una pasada y codifica el rostro"""
+    timings = {}
+    with timed(timings, "decode"):
+        image, scale = decode_login_image(contents)
+    with timed(timings, "enhance"):
+        image = normalize_image(image)
+
+    face_locations = detect_faces_scaled(image, retry=True, timings=timings)
+    face_encoding = encode_face_region(image, face_locations, NO_FACE_LOGIN_MSG, timings)
+
+    return {
+        "face_locations": scale_locations(face_locations, scale),
+        "face_encoding": face_encoding.tolist(),
+        "timings": timings,
+        "detect_retried": "detect_retry" in timings
+    }
+
+
+def pipeline_params() -> tuple:
+    """Parámetros que influyen en el resultado de los pipelines (forman parte de la clave de caché)"""
+    return (MIN_FACE_FRACTION, MAX_UPSAMPLE, HOG_WINDOW_PX, CROP_MARGIN, LOGIN_DRAFT_DECODE, ENCODE_MIN_FACE_PX)
+
+
+def process_batch(pipeline, items: list) -> list:
+    """
+    Ejecuta un pipeline sobre varias imágenes dentro de una sola tarea del pool.
+
+    Cada resultado es independiente: un error en una imagen no afecta al resto.
+    """
+    results = []
+    for contents in items:
+        try:
+            results.append({"ok": True, "result": pipeline(contents)})
+        except FaceImageError as e:
+            results.append({"ok": False, "image_error": True, "error": str(e)})
+        except Exception as e:
+            results.append({"ok": False, "image_error": False, "error": f"{type(e).__name__}: {e}"})
+    return results
@@ -0,0 +1,152 @@
+"""
+Pool de procesos para el trabajo de CPU del reconocimiento facial.
+
+La detección HOG y la codificación con dlib tardan cientos de milisegundos por
+imagen. Ejecutarlas dentro de un handler `async def` bloquea el único event loop
+de uvicorn, así que se delegan a un ProcessPoolExecutor acotado cuyos procesos
+precargan los modelos de dlib al arrancar.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("face_worker")
+
+
+class FacePoolSaturated(Exception):
+    """Se superó la cola máxima del pool; el handler debe responder 503"""
+
+
+def _init_worker():
+    """Inicializador de cada proceso: carga los modelos de dlib y hace una inferencia de prueba"""
+    import numpy as np
+    import face_recognition
+
+    dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+    face_recognition.face_locations(dummy)
+    face_recognition.face_encodings(dummy, [(0, 63, 63, 0)])
+
+
+def _ping():
+    return os.getpid()
+
+
+class FaceWorkerPool:
+    def __init__(self, max_workers: int = None, max_queue: int = None, start_method: str = None):
+        self._max_workers = max_workers or int(os.getenv("FACE_WORKERS", os.cpu_count() or 1))
+        self._max_queue = max_queue if max_queue is not None else int(os.getenv("FACE_QUEUE_MAX", self._max_workers * 4))
+        self._start_method = start_method or os.getenv("FACE_WORKER_START_METHOD", "spawn")
+        self._executor = None
+        # Recreación del pool tras BrokenProcessPool: sólo la primera llamada que
+        # falla con una instancia la sustituye
+        self._executor_lock = threading.Lock()
+        self._generation = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_time = 0.0
+        self._started_at = None
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self._max_workers,
+            mp_context=multiprocessing.get_context(self._start_method),
+            initializer=_init_worker
+        )
+
+    def start(self):
+        """Crea el pool y lanza un ping por proceso para que todos precarguen los modelos"""
+        if self._executor is not None:
+            return
+        logger.info(f"Iniciando pool de reconocimiento facial: {self._max_workers} procesos, cola máxima {self._max_queue}")
+        self._executor = self._create_executor()
+        self._started_at = time.monotonic()
+        for _ in range(self._max_workers):
+            self._executor.submit(_ping)
+
+    async def warm_up(self):
+        """Espera a que todos los procesos hayan arrancado y cargado los modelos"""
+        if self._executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self._max_workers)))
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            logger.info("Cerrando pool de reconocimiento facial")
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    async def submit(self, fn, *args, **kwargs):
+        """Ejecuta fn(*args, **kwargs) en un proceso del pool sin bloquear el event loop"""
+        if self._executor is None:
+            self.start()
+
+        if self._in_flight >= self._max_workers + self._max_queue:
+            self._rejected += 1
+            raise FacePoolSaturated("El pool de reconocimiento facial está saturado")
+
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        start_time = time.monotonic()
+        executor = self._executor
+        try:
+            result = await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            self._failed += 1
+            self._replace_broken(executor)
+            raise
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            self._busy_time += time.monotonic() - start_time
+        self._completed += 1
+        return result
+
+    def _replace_broken(self, broken):
+        """Sustituye `broken` por un pool nuevo si sigue siendo el actual"""
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            logger.error("Un proceso del pool terminó inesperadamente; recreando el pool")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            self._generation += 1
+
+    def stats(self) -> dict:
+        """Profundidad de cola y utilización de los procesos"""
+        busy = min(self._in_flight, self._max_workers)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        finished = self._completed + self._failed
+        return {
+            "running": self._executor is not None,
+            "workers": self._max_workers,
+            "max_queue": self._max_queue,
+            "in_flight": self._in_flight,
+            "busy_workers": busy,
+            "queue_depth": max(0, self._in_flight - self._max_workers),
+            "utilization": round(busy / self._max_workers, 3),
+            "avg_utilization": round(min(1.0, self._busy_time / (uptime * self._max_workers)), 3) if uptime else 0.0,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "restarts": self._generation,
+            "avg_task_ms": round(self._busy_time / finished * 1000, 2) if finished else 0.0
+        }
+
+
+# Instancia global del pool
+face_pool = FaceWorkerPool()
@@ -0,0 +1,149 @@
+"""
+Verificación local de ID tokens de Google con las claves públicas cacheadas.
+
+`id_token.verify_oauth2_token` hace una petición HTTP síncrona a Google para
+obtener los certificados dentro del handler async. Aquí el JWKS se descarga en
+segundo plano, se guarda en memoria durante el max-age de su Cache-Control y la
+firma y los claims se verifican localmente con python-jose, sin red en el
+camino crítico. Sólo si llega un token con un `kid` desconocido (rotación de
+claves) se fuerza una recarga, como mucho una vez por minuto.
+
+GOOGLE_JWKS_URL permite apuntar a un servidor de claves local en pruebas.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import urllib.request
+
+from jose import jwt, JWTError
+
+logger = logging.getLogger("google_tokens")
+
+DEFAULT_JWKS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+DEFAULT_MAX_AGE = 3600
+MIN_REFRESH_INTERVAL = 60
+
+
+class GoogleTokenError(ValueError):
+    """Token de Google no válido (firma, audiencia, emisor o caducidad)"""
+
+
+def _max_age(cache_control: str) -> int:
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else DEFAULT_MAX_AGE
+
+
+class GoogleTokenVerifier:
+    def __init__(self, client_id: str = None, jwks_url: str = None):
+        # Si no se pasan, se leen del entorno al usarse: la instancia global se crea
+        # antes de que main.py cargue el .env
+        self._client_id = client_id
+        self._jwks_url = jwks_url
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task = None
+        self.fetches = 0
+        self.fetch_errors = 0
+
+    @property
+    def client_id(self) -> str:
+        return self._client_id or os.getenv("GOOGLE_CLIENT_ID")
+
+    @property
+    def jwks_url(self) -> str:
+        return self._jwks_url or os.getenv("GOOGLE_JWKS_URL", DEFAULT_JWKS_URL)
+
+    def _download(self) -> tuple:
+        with urllib.request.urlopen(self.jwks_url, timeout=10) as response:
+            body = json.loads(response.read())
+            return body, response.headers.get("Cache-Control", "")
+
+    async def refresh(self, force: bool = False):
+        """Descarga el JWKS en un hilo (sin bloquear el event loop) si ha caducado"""
+        async with self._refresh_lock:
+            now = time.monotonic()
+            if not force and self._keys and now < self._expires_at:
+                return
+            if force and now - self._last_fetch < MIN_REFRESH_INTERVAL:
+                return
+            self._last_fetch = now
+            try:
+                body, cache_control = await asyncio.to_thread(self._download)
+            except Exception as e:
+                self.fetch_errors += 1
+                logger.error(f"Error al descargar las claves de Google desde {self.jwks_url}: {str(e)}")
+                return
+            self._keys = {key["kid"]: key for key in body.get("keys", []) if "kid" in key}
+            max_age = _max_age(cache_control)
+            self._expires_at = time.monotonic() + max_age
+            self.fetches += 1
+            logger.info(f"Claves de Google actualizadas: {len(self._keys)} claves, max-age {max_age}s")
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh()
+            # Renovar un poco antes de que caduque la caché; reintentar pronto si falló
+            remaining = self._expires_at - time.monotonic()
+            await asyncio.sleep(max(MIN_REFRESH_INTERVAL, remaining * 0.9) if self._keys else MIN_REFRESH_INTERVAL)
+
+    def start(self):
+        """Arranca la renovación periódica del JWKS en segundo plano"""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def verify(self, token: str) -> dict:
+        """Verifica firma, audiencia, emisor y caducidad; devuelve los claims"""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError as e:
+            raise GoogleTokenError(f"Token de Google mal formado: {str(e)}")
+
+        if not self._keys:
+            await self.refresh()
+        elif kid not in self._keys:
+            # Posible rotación de claves
+            await self.refresh(force=True)
+
+        key = self._keys.get(kid)
+        if key is None:
+            raise GoogleTokenError("Token firmado con una clave de Google desconocida")
+
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[key.get("alg", "RS256")],
+                audience=self.client_id,
+                issuer=GOOGLE_ISSUERS,
+                options={"verify_at_hash": False}
+            )
+        except JWTError as e:
+            raise GoogleTokenError(f"Token de Google no válido: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            "jwks_url": self.jwks_url,
+            "keys": len(self._keys),
+            "expires_in_s": round(max(0.0, self._expires_at - time.monotonic()), 1),
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors
+        }
+
+
+# Instancia global del verificador
+google_verifier = GoogleTokenVerifier()
@@ -0,0 +1,188 @@
+"""
+Configuración de logging sin escrituras bloqueantes en el camino de la petición.
+
+Los loggers de la aplicación sólo encolan el registro (QueueHandler); un hilo
+de fondo (QueueListener) lo formatea y lo escribe en consola y en fichero. Cada
+línea es un objeto JSON con el request_id de la petición en curso, los niveles
+se pueden ajustar por módulo y las líneas DEBUG se pueden muestrear.
+
+Variables de entorno:
+    LOG_LEVEL=INFO                          nivel por defecto
+    LOG_LEVELS=face_pipeline=DEBUG,database=WARNING   niveles por módulo
+    LOG_FORMAT=json                         "json" o "text"
+    LOG_FILE=app.log                        fichero de salida ("" para sólo consola)
+    LOG_DEBUG_SAMPLE_RATE=1.0               fracción de líneas DEBUG que se conservan
+    LOG_QUEUE_MAX=10000                     registros encolados como máximo (el resto se descarta)
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", 10000))
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# Identificador de la petición en curso; lo fija el middleware de main.py
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+_listener = None
+_queue_handler = None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """Copia el request_id del contexto al registro en el hilo que lo emite"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Conserva sólo una fracción de los registros DEBUG; el resto de niveles pasa siempre"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-")
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta en lugar de bloquear si la cola está llena"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolver el mensaje y la traza en el hilo que emite, pero dejando la traza
+        # en exc_text para que el formateador JSON la publique en su propio campo
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec: str) -> dict:
+    """'face_pipeline=DEBUG,database=WARNING' -> {'face_pipeline': 'DEBUG', 'database': 'WARNING'}"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(log_file: str = None, level: str = None, fmt: str = None, stream=None) -> logging.handlers.QueueListener:
+    """
+    Instala el QueueHandler en el logger raíz y arranca el hilo escritor.
+
+    Es idempotente: llamadas posteriores devuelven el listener ya arrancado.
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return _listener
+
+    fmt = (fmt or LOG_FORMAT).lower()
+    log_file = LOG_FILE if log_file is None else log_file
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(stream or sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_MAX)
+    _queue_handler = _DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(RequestIdFilter())
+    _queue_handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level or LOG_LEVEL)
+    for name, module_level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Vacía la cola, detiene el hilo escritor y cierra los ficheros"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def logging_stats() -> dict:
+    if _queue_handler is None:
+        return {"running": False}
+    sampler = next((f for f in _queue_handler.filters if isinstance(f, DebugSampler)), None)
+    return {
+        "running": _listener is not None,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped_queue_full": _queue_handler.dropped,
+        "dropped_debug_sampled": sampler.dropped if sampler else 0,
+        "debug_sample_rate": LOG_DEBUG_SAMPLE_RATE
+    }
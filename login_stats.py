@@ -0,0 +1,216 @@
+"""
+Rollups incrementales de logins para el panel de administración.
+
+Mantiene contadores por minuto, hora y día:
+  - login_rollups: total de logins y desglose por login_type en cada intervalo
+  - login_rollups_users: logins de cada usuario en cada intervalo
+
+Los contadores se actualizan con $inc a medida que el buffer de auditoría
+escribe cada lote de eventos, así que /api/stats responde leyendo un número
+acotado de buckets precalculados en lugar de recorrer `logs`. El backfill
+recalcula los buckets desde `logs` con un pipeline de agregación ($dateTrunc +
+$merge; requiere MongoDB 5.0+).
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger("login_stats")
+
+GRANULARITIES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+# Tiempo que se conserva cada bucket (índice TTL sobre expires_at)
+RETENTION = {
+    "minute": timedelta(days=2),
+    "hour": timedelta(days=90),
+    "day": timedelta(days=5 * 365),
+}
+MAX_BUCKETS = 1440
+
+
+def truncate(timestamp: datetime, granularity: str) -> datetime:
+    if granularity == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def backfill_start(since: datetime, granularity: str) -> datetime:
+    """
+    Inicio del primer bucket completo que contiene `since`: el backfill reemplaza
+    buckets enteros, así que no puede contar sólo una parte del primero
+    """
+    if since.tzinfo is not None:
+        # Los eventos se guardan como fechas sin zona; $dateTrunc trunca en UTC
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return truncate(since, granularity)
+
+
+class LoginRollups:
+    def __init__(self):
+        self._totals = None
+        self._users = None
+
+    def attach(self, db):
+        self._totals = db.login_rollups
+        self._users = db.login_rollups_users
+
+    async def apply(self, events: list):
+        """Suma un lote de eventos de auditoría a los buckets correspondientes"""
+        if self._totals is None or not events:
+            return
+        totals, users = Counter(), Counter()
+        for event in events:
+            timestamp = event.get("timestamp")
+            if not isinstance(timestamp, datetime):
+                continue
+            login_type = event.get("login_type", "unknown")
+            for granularity in GRANULARITIES:
+                bucket = truncate(timestamp, granularity)
+                totals[(granularity, bucket, login_type)] += 1
+                if event.get("username"):
+                    users[(granularity, bucket, event["username"])] += 1
+
+        total_ops = [
+            UpdateOne(
+                {"_id": {"g": granularity, "b": bucket}},
+                {
+                    "$inc": {"total": count, f"by_type.{login_type}": count},
+                    "$setOnInsert": {"granularity": granularity, "bucket": bucket,
+                                     "expires_at": bucket + RETENTION[granularity]}
+                },
+                upsert=True
+            )
+            for (granularity, bucket, login_type), count in totals.items()
+        ]
+        user_ops = [
+            UpdateOne(
+                {"_id": {"g": granularity, "b": bucket, "u": username}},
+                {
+                    "$inc": {"count": count},
+                    "$setOnInsert": {"granularity": granularity, "bucket": bucket, "username": username,
+                                     "expires_at": bucket + RETENTION[granularity]}
+                },
+                upsert=True
+            )
+            for (granularity, bucket, username), count in users.items()
+        ]
+        if total_ops:
+            await self._totals.bulk_write(total_ops, ordered=False)
+        if user_ops:
+            await self._users.bulk_write(user_ops, ordered=False)
+
+    @staticmethod
+    def _buckets(granularity: str, last: int, now: datetime = None) -> list:
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Granularidad no válida: {granularity}")
+        last = min(max(1, last), MAX_BUCKETS)
+        current = truncate(now or datetime.now(), granularity)
+        step = GRANULARITIES[granularity]
+        return [current - step * i for i in reversed(range(last))]
+
+    async def series(self, granularity: str = "hour", last: int = 24, now: datetime = None) -> list:
+        """Serie de los últimos `last` buckets: total y desglose por login_type"""
+        buckets = self._buckets(granularity, last, now)
+        docs = {
+            doc["bucket"]: doc
+            async for doc in self._totals.find({"_id": {"$in": [{"g": granularity, "b": b} for b in buckets]}})
+        }
+        return [
+            {
+                "bucket": bucket.isoformat(),
+                "total": docs.get(bucket, {}).get("total", 0),
+                "by_type": docs.get(bucket, {}).get("by_type", {})
+            }
+            for bucket in buckets
+        ]
+
+    async def user_series(self, username: str, granularity: str = "day", last: int = 30, now: datetime = None) -> list:
+        buckets = self._buckets(granularity, last, now)
+        docs = {
+            doc["bucket"]: doc["count"]
+            async for doc in self._users.find(
+                {"_id": {"$in": [{"g": granularity, "b": b, "u": username} for b in buckets]}}
+            )
+        }
+        return [{"bucket": bucket.isoformat(), "count": docs.get(bucket, 0)} for bucket in buckets]
+
+    async def top_users(self, granularity: str = "day", limit: int = 10, now: datetime = None) -> list:
+        """Usuarios con más logins en el bucket actual"""
+        bucket = self._buckets(granularity, 1, now)[0]
+        cursor = self._users.find(
+            {"granularity": granularity, "bucket": bucket},
+            {"_id": 0, "username": 1, "count": 1}
+        ).sort("count", -1).limit(min(max(1, limit), 100))
+        return [doc async for doc in cursor]
+
+    async def backfill(self, logs_collection, since: datetime = None) -> dict:
+        """
+        Recalcula los buckets desde `logs` (reemplaza los existentes del rango). Con
+        `since`, cada granularidad empieza en el inicio del bucket que lo contiene.
+        """
+        results = {}
+        for granularity, retention in RETENTION.items():
+            match = {"timestamp": {"$type": "date"}}
+            if since is not None:
+                match["timestamp"] = {"$gte": backfill_start(since, granularity)}
+            bucket_expr = {"$dateTrunc": {"date": "$timestamp", "unit": granularity}}
+            expires_expr = {"$dateAdd": {"startDate": "$_id.b", "unit": "second",
+                                         "amount": int(retention.total_seconds())}}
+
+            await logs_collection.aggregate([
+                {"$match": match},
+                {"$group": {"_id": {"b": bucket_expr, "t": {"$ifNull": ["$login_type", "unknown"]}},
+                            "count": {"$sum": 1}}},
+                {"$group": {"_id": {"g": granularity, "b": "$_id.b"},
+                            "total": {"$sum": "$count"},
+                            "by_type": {"$push": {"k": "$_id.t", "v": "$count"}}}},
+                {"$project": {"granularity": {"$literal": granularity}, "bucket": "$_id.b", "total": 1,
+                              "by_type": {"$arrayToObject": "$by_type"}, "expires_at": expires_expr}},
+                {"$merge": {"into": self._totals.name, "on": "_id", "whenMatched": "replace"}}
+            ]).to_list(length=None)
+
+            await logs_collection.aggregate([
+                {"$match": {**match, "username": {"$type": "string"}}},
+                {"$group": {"_id": {"g": granularity, "b": bucket_expr, "u": "$username"},
+                            "count": {"$sum": 1}}},
+                {"$project": {"granularity": {"$literal": granularity}, "bucket": "$_id.b", "username": "$_id.u",
+                              "count": 1, "expires_at": expires_expr}},
+                {"$merge": {"into": self._users.name, "on": "_id", "whenMatched": "replace"}}
+            ]).to_list(length=None)
+
+            results[granularity] = await self._totals.count_documents({"granularity": granularity})
+        logger.info(f"Backfill de rollups completado: {results}")
+        return results
+
+
+# Instancia global de los rollups
+login_rollups = LoginRollups()
+
+
+async def _main(since: str = None):
+    from database import get_database, mongo_connection
+    try:
+        db = await get_database()
+        login_rollups.attach(db)
+        await login_rollups.backfill(db.logs, datetime.fromisoformat(since) if since else None)
+    finally:
+        await mongo_connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from log_config import setup_logging
+
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Recalcula los rollups de logins desde la colección logs")
+    parser.add_argument("--since", help="Fecha ISO desde la que recalcular (por defecto, todo)")
+    asyncio.run(_main(parser.parse_args().since))
@@ -1,45 +1,53 @@
 import logging
-import sys
-
-# Configurar logging para que sea más visible
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("app.log")
-    ]
-)
+
+# Lo primero: marca el inicio del arranque para medir el tiempo hasta /health y /ready
+from readiness import readiness, RETRY_AFTER_S
+
+# Cargar variables de entorno antes de importar los módulos que leen su configuración al importarse
+from dotenv import load_dotenv
+load_dotenv()
+
+# Logging asíncrono: los handlers escriben desde un hilo de fondo (ver log_config.py)
+from log_config import setup_logging, shutdown_logging, logging_stats, request_id_var, new_request_id
+setup_logging()
 logger = logging.getLogger("main")
-logger.setLevel(logging.INFO)
 
 # Mensaje de inicio de la aplicación
 logger.info("=== INICIANDO APLICACIÓN DE LOGIN FACIAL ===")
 
-from fastapi import FastAPI, HTTPException, Depends, File, UploadFile, Form, status
+from fastapi import FastAPI, HTTPException, Depends, status, Response, Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel
-import face_recognition
 import os
-from dotenv import load_dotenv
-from passlib.context import CryptContext
+from password_service import password_service
 from jose import JWTError, jwt
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from google.oauth2.credentials import Credentials
 import asyncio
 import numpy as np
-import io
-from PIL import Image
 import aiofiles
 from bson import ObjectId
-
-# Cargar variables de entorno
-load_dotenv()
+from face_pipeline import FaceImageError, process_registration_image, process_login_image
+from face_worker import face_pool, FacePoolSaturated
+from face_batcher import FaceBatchScheduler
+from face_index import face_index, DUPLICATE_POLICY
+from face_cache import face_cache
+from upload_ingest import FaceUploadForm, face_upload, multipart_openapi, upload_budget
+from user_cache import user_cache, USER_PROJECTION
+from user_sync import user_sync, USER_SYNC_ENABLED
+from blob_store import face_image_store
+from audio_stream import music_library
+from music_catalog import album_catalog, ingest_library
+from pagination import paginated_response, ndjson_response
+from audit_buffer import audit_buffer
+from login_stats import login_rollups
+from google_tokens import google_verifier
+from metrics import registry, span, timed_runner, request_start_var, http_request_seconds, stage_seconds
+import functools
+import time
 
 # Configuración de Google OAuth
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
@@ -58,7 +66,7 @@ async def insert_test_user():
         user_dict = {
             "username": "samue123",
             "email": "samue123@gmail.com",
-            "password": get_password_hash("contraseña123"),
+            "password": await get_password_hash("contraseña123"),
             "face_encoding": [0.0] * 128  # Codificación facial simulada
         }
         
@@ -83,78 +91,198 @@ if env_origins:
     frontend_origins.extend(additional_origins)
     logger.info(f"Orígenes CORS adicionales configurados: {additional_origins}")
 
+# Rutas que se sirven aunque MongoDB todavía no esté conectada
+NO_DATABASE_PATHS = {"/health", "/ready", "/metrics", "/docs", "/redoc", "/openapi.json"}
+# Las pistas de música se leen del disco y no dependen de MongoDB
+NO_DATABASE_PREFIXES = ("/api/music/",)
+
+@app.middleware("http")
+async def database_gate(request, call_next):
+    """
+    Mientras el arranque en segundo plano no haya terminado con MongoDB (conexión,
+    migraciones, servicios enganchados y usuario administrador) responde 503 en lugar de fallar
+    """
+    if not readiness.is_ready("database") and request.method != "OPTIONS" and request.url.path not in NO_DATABASE_PATHS \
+            and not request.url.path.startswith(NO_DATABASE_PREFIXES):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "El servicio se está iniciando. Intente de nuevo en unos segundos"},
+            headers={"Retry-After": str(RETRY_AFTER_S)}
+        )
+    return await call_next(request)
+
 logger.info(f"Configurando CORS con los siguientes orígenes: {frontend_origins}")
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=frontend_origins,  # Usar la lista de orígenes configurada
     allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Métodos específicos permitidos
-    allow_headers=["Authorization", "Content-Type"],  # Headers específicos permitidos
+    allow_methods=["GET", "HEAD", "POST", "PUT", "DELETE", "OPTIONS"],  # Métodos específicos permitidos
+    allow_headers=["Authorization", "Content-Type", "Range", "If-Range", "If-None-Match", "If-Modified-Since"],  # Headers específicos permitidos
     expose_headers=["*"],  # Headers expuestos al navegador
     max_age=3600  # Tiempo de caché para preflight requests
 )
 
+@app.middleware("http")
+async def request_id_middleware(request, call_next):
+    """Asigna un request_id a cada petición y mide su duración por ruta"""
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    start_token = request_start_var.set(start)
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        request_id_var.reset(token)
+        request_start_var.reset(start_token)
+        # Plantilla de la ruta (no la URL) para no crear una serie por usuario o id
+        route = request.scope.get("route")
+        http_request_seconds.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status_code
+        )
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Importar el módulo de conexión a la base de datos
-from database import get_database, mongo_connection
+from database import get_database, mongo_connection, run_migrations, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE
+from pymongo.errors import DuplicateKeyError
 
 # Variable global para la base de datos con tipado
 db: Optional[AsyncIOMotorClient] = None
 
-# Evento de startup para inicializar la conexión a la base de datos y crear usuario de prueba
-@app.on_event("startup")
-async def startup_event():
+# Tarea de inicialización en segundo plano (fase de readiness)
+_initialization_task: Optional[asyncio.Task] = None
+MONGO_RETRY_MAX_DELAY_S = 30
+FACE_WARM_UP_RETRY_MAX_DELAY_S = 60
+
+async def connect_database():
+    """Conecta a MongoDB con reintentos y espera creciente (hasta 30 s) hasta lograrlo"""
     global db
+    attempt = 0
+    while True:
+        try:
+            db = await get_database()
+            # Verificar conexión explícitamente
+            if await mongo_connection.check_connection():
+                logger.info("Conexión a MongoDB inicializada correctamente")
+                return db
+            raise Exception("La verificación de conexión falló")
+        except Exception as retry_error:
+            attempt += 1
+            delay = min(MONGO_RETRY_MAX_DELAY_S, 2 ** attempt)
+            readiness.set_ready("database", False, error=str(retry_error))
+            logger.warning(f"Intento {attempt} de conexión a MongoDB falló: {str(retry_error)}. Reintentando en {delay}s")
+            await asyncio.sleep(delay)
+
+async def initialize_database():
+    """Conexión, migraciones, usuario administrador y servicios que dependen de la base de datos"""
+    logger.info("Inicializando conexión a MongoDB...")
+    await connect_database()
+
+    # Escritura en segundo plano de los eventos de login y de sus rollups; se
+    # enganchan antes de las migraciones, que pueden esperar al lease de otro worker
+    login_rollups.attach(db)
+    album_catalog.attach(db)
+    audit_buffer.add_listener(login_rollups.apply)
+    audit_buffer.start(db.logs)
+
+    # Crear índices y aplicar migraciones pendientes
     try:
-        # Inicializar conexión a la base de datos con reintentos
-        logger.info("Inicializando conexión a MongoDB...")
-        max_startup_retries = 5
-        retry_count = 0
-        startup_success = False
-        
-        while retry_count < max_startup_retries and not startup_success:
-            try:
-                db = await get_database()
-                # Verificar conexión explícitamente
-                if await mongo_connection.check_connection():
-                    startup_success = True
-                    logger.info("Conexión a MongoDB inicializada correctamente")
-                else:
-                    raise Exception("La verificación de conexión falló")
-            except Exception as retry_error:
-                retry_count += 1
-                logger.warning(f"Intento {retry_count}/{max_startup_retries} de conexión a MongoDB falló: {str(retry_error)}")
-                if retry_count < max_startup_retries:
-                    await asyncio.sleep(2 * retry_count)  # Espera exponencial
-                else:
-                    logger.error("Se agotaron los reintentos de conexión durante el arranque")
-                    # Continuamos a pesar del error para permitir que la aplicación inicie
-                    # y pueda reconectar más tarde
-        
-        # Verificar si existe un usuario admin
+        await run_migrations(db)
+    except Exception as migration_error:
+        logger.error(f"Error al aplicar migraciones: {str(migration_error)}")
+
+    # Verificar si existe un usuario admin
+    try:
+        admin_user = await get_user("admin123")
+        if not admin_user:
+            # Crear usuario administrador
+            admin_dict = {
+                "username": "admin123",
+                "email": "admin@example.com",
+                "password": await get_password_hash("admin123"),
+                "role": UserRole.ADMIN
+            }
+            await db.usuarios.insert_one(admin_dict)
+            logger.info("Usuario administrador creado exitosamente")
+    except Exception as user_error:
+        logger.error(f"Error al verificar/crear usuario administrador: {str(user_error)}")
+        # No interrumpimos el arranque por este error
+
+    readiness.set_ready("database")
+
+    # Cargar en memoria las codificaciones faciales para la identificación 1:N
+    try:
+        await face_index.load(db.usuarios)
+        readiness.set_ready("face_index")
+    except Exception as index_error:
+        logger.error(f"Error al cargar el índice facial: {str(index_error)}")
+        readiness.set_ready("face_index", False, error=str(index_error))
+
+    # Propagar a la caché y al índice de este worker los cambios hechos por otros
+    if USER_SYNC_ENABLED:
+        user_sync.start(db.usuarios)
+
+async def warm_up_face_models():
+    """
+    Espera a que cada proceso del pool cargue los modelos de dlib y haga una inferencia
+    de prueba; si falla, recrea el pool y reintenta con espera creciente (hasta 60 s)
+    """
+    start = time.perf_counter()
+    attempt = 0
+    while True:
         try:
-            admin_user = await get_user("admin123")
-            if not admin_user:
-                # Crear usuario administrador
-                admin_dict = {
-                    "username": "admin123",
-                    "email": "admin@example.com",
-                    "password": get_password_hash("admin123"),
-                    "role": UserRole.ADMIN
-                }
-                await db.usuarios.insert_one(admin_dict)
-                logger.info("Usuario administrador creado exitosamente")
-        except Exception as user_error:
-            logger.error(f"Error al verificar/crear usuario administrador: {str(user_error)}")
-            # No interrumpimos el arranque por este error
+            await face_pool.warm_up()
+            break
+        except Exception as warm_up_error:
+            attempt += 1
+            delay = min(FACE_WARM_UP_RETRY_MAX_DELAY_S, 2 ** attempt)
+            readiness.set_ready("face_models", False, error=str(warm_up_error))
+            logger.error(f"Intento {attempt} de precargar los modelos de reconocimiento facial falló: "
+                         f"{str(warm_up_error)}. Reintentando en {delay}s")
+            # Un fallo en el inicializador deja el pool roto: se crea uno nuevo en el siguiente intento
+            face_pool.shutdown(wait=False)
+            await asyncio.sleep(delay)
+    logger.info(f"Modelos de reconocimiento facial listos en {time.perf_counter() - start:.2f}s")
+    readiness.set_ready("face_models")
+
+async def initialize_services():
+    try:
+        await asyncio.gather(initialize_database(), warm_up_face_models())
     except Exception as e:
-        logger.error(f"Error crítico durante el arranque de la aplicación: {str(e)}")
-        # No lanzamos la excepción para permitir que la aplicación inicie de todos modos
-        # y pueda intentar reconectar más tarde
+        logger.error(f"Error crítico durante la inicialización de la aplicación: {str(e)}")
+
+# Evento de startup: sólo arranca lo imprescindible para servir /health y deja
+# la conexión a MongoDB y la carga de modelos en segundo plano (ver /ready)
+@app.on_event("startup")
+async def startup_event():
+    global _initialization_task
+    # Descargar y renovar en segundo plano las claves públicas de Google
+    google_verifier.start()
+    # Lanzar los procesos del pool; cargan los modelos de dlib sin bloquear el event loop
+    face_pool.start()
+    _initialization_task = asyncio.create_task(initialize_services())
+    readiness.mark("live")
+    logger.info(f"Aplicación aceptando peticiones en {readiness.elapsed():.2f}s; inicialización en segundo plano")
 
 # Evento de shutdown para cerrar la conexión a la base de datos
 @app.on_event("shutdown")
 async def shutdown_event():
+    if _initialization_task is not None and not _initialization_task.done():
+        _initialization_task.cancel()
+    # Vaciar el buffer de auditoría y los re-hash pendientes antes de cerrar la conexión
+    try:
+        await audit_buffer.close()
+    except Exception as e:
+        logger.error(f"Error al vaciar el buffer de auditoría: {str(e)}")
+    await user_sync.stop()
+    await google_verifier.stop()
+    await password_service.drain()
     try:
         logger.info("Cerrando conexión a MongoDB...")
         await mongo_connection.close()
@@ -162,17 +290,24 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"Error al cerrar la conexión a MongoDB: {str(e)}")
         # No lanzamos la excepción para permitir que la aplicación se cierre correctamente
+    try:
+        face_index.save()
+    except Exception as e:
+        logger.error(f"Error al guardar el índice facial: {str(e)}")
+    password_service.shutdown()
+    face_pool.shutdown()
+    # Último paso: vaciar la cola de logs y cerrar los ficheros
+    shutdown_logging()
 
 # Configuración de seguridad
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # Modelos Pydantic
-from auth import UserRole, create_access_token, get_current_user, get_current_admin
+from auth import UserRole, create_access_token, get_current_user, get_current_admin, get_stream_user
 
 class UserBase(BaseModel):
     username: str
@@ -192,23 +327,36 @@ class Token(BaseModel):
     role: UserRole
 
 
-# Funciones de autenticación
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Funciones de autenticación (bcrypt se ejecuta en el pool de hilos de password_service)
+async def verify_password(plain_password, hashed_password):
+    with span("bcrypt_verify"):
+        return await password_service.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    with span("bcrypt_hash"):
+        return await password_service.hash(password)
 
 async def get_user(username: str):
-    user = await db.usuarios.find_one({"username": username})
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    version = user_cache.version(username)
+    with span("user_lookup"):
+        user = await db.usuarios.find_one({"username": username}, USER_PROJECTION)
+    if user is not None:
+        user_cache.put(user, version=version)
     return user
 
-async def authenticate_user(username: str, password: str):
-    user = await get_user(username)
-    if not user:
-        return False
-    if not verify_password(password, user["password"]):
-        return False
+async def complete_authentication(user: dict, password: str):
+    """Tareas tras verificar la contraseña: rehash al coste actual y rol por defecto"""
+    username = user["username"]
+    # Actualizar en segundo plano los hashes generados con un coste distinto al configurado
+    if password_service.needs_update(user["password"]):
+        async def store_hash(new_hash):
+            await db.usuarios.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+            user_cache.invalidate(username)
+            logger.info(f"Hash de contraseña actualizado al coste actual para {username}")
+        password_service.schedule_rehash(password, store_hash)
     
     # Asignar rol por defecto si no existe
     if "role" not in user:
@@ -217,85 +365,109 @@ async def authenticate_user(username: str, password: str):
             {"username": username},
             {"$set": {"role": UserRole.NORMAL}}
         )
-    return user
+        user_cache.invalidate(username)
+
+# Distancia máxima entre codificaciones para aceptar el rostro en /login/face
+FACE_MATCH_TOLERANCE = 0.6
 
+# Los endpoints faciales responden 503 hasta que los modelos estén precargados en el pool
+require_face_models = readiness.require("face_models")
+
+# Los logins simultáneos se agrupan en micro-lotes antes de llegar al pool
+login_batcher = FaceBatchScheduler(process_login_image)
+
+async def release_face_image(ref: Optional[str]):
+    """Borra el blob de la imagen facial si ningún otro usuario lo referencia"""
+    if not ref:
+        return
+    try:
+        if await db.usuarios.count_documents({"face_image_ref": ref}, limit=1) == 0:
+            await face_image_store.delete(ref)
+    except Exception as e:
+        logger.warning(f"No se pudo liberar la imagen facial {ref}: {str(e)}")
+
+async def run_fail_fast(*stages):
+    """
+    Ejecuta etapas independientes a la vez y devuelve sus resultados en orden.
+    En cuanto una falla se cancelan las que siguen en curso y se propaga su error.
+    """
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        # Recoger todas las excepciones (evita avisos de "never retrieved") y lanzar la primera
+        errors = [task.exception() for task in tasks if task in done and not task.cancelled()]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def run_face_pipeline(task):
+    """Espera una tarea del pool de reconocimiento facial y traduce sus errores a HTTP"""
+    try:
+        return await task
+    except FaceImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FacePoolSaturated:
+        logger.warning(f"Pool de reconocimiento facial saturado: {face_pool.stats()}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servidor está ocupado procesando imágenes. Intente de nuevo en unos segundos"
+        )
+
+
+HEALTH_PING_TIMEOUT_S = float(os.getenv("HEALTH_PING_TIMEOUT_S", 1.0))
 
 @app.get("/health")
 async def check_database_connection():
-    try:
-        logger.info("Verificando conexión a MongoDB...")
-        start_time = datetime.now()
-        is_connected = await mongo_connection.check_connection()
-        response_time = (datetime.now() - start_time).total_seconds() * 1000
-        
-        if is_connected:
-            # Obtener información adicional del servidor MongoDB
-            server_info = None
-            try:
-                server_info = await mongo_connection._client.admin.command('serverStatus')
-            except Exception as e:
-                logger.warning(f"No se pudo obtener información del servidor MongoDB: {str(e)}")
-            
-            # Preparar respuesta con información detallada
-            response = {
-                "status": "connected",
-                "message": "Conexión exitosa a MongoDB",
-                "database": "face_login_db",
-                "response_time_ms": round(response_time, 2),
-                "connection_info": {
-                    "max_pool_size": 10,
-                    "min_pool_size": 1,
-                    "retry_enabled": True
-                }
+    """Liveness y estado de MongoDB; nunca espera a reconexiones (de eso se encarga el arranque)"""
+    if db is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={
+                "status": "connecting",
+                "message": "La conexión a MongoDB se está estableciendo",
+                "uptime_s": round(readiness.elapsed(), 3)
             }
-            
-            # Añadir información del servidor si está disponible
-            if server_info:
-                response["server_info"] = {
-                    "version": server_info.get("version", "Desconocida"),
-                    "uptime_seconds": server_info.get("uptime", 0),
-                    "connections": server_info.get("connections", {}).get("current", 0)
-                }
-            
-            logger.info(f"Verificación de conexión a MongoDB exitosa. Tiempo de respuesta: {response_time:.2f}ms")
-            return response
-        else:
-            # Intentar reconectar automáticamente
-            logger.warning("Intentando reconexión automática desde endpoint /health")
-            try:
-                await mongo_connection.connect()
-                is_reconnected = await mongo_connection.check_connection()
-                if is_reconnected:
-                    logger.info("Reconexión exitosa desde endpoint /health")
-                    return {
-                        "status": "reconnected",
-                        "message": "Reconexión exitosa a MongoDB",
-                        "response_time_ms": round(response_time, 2)
-                    }
-            except Exception as reconnect_error:
-                logger.error(f"Error en reconexión desde endpoint /health: {str(reconnect_error)}")
-            
-            error_msg = "La conexión a MongoDB no está activa"
-            logger.error(error_msg)
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail={
-                    "status": "disconnected",
-                    "message": error_msg,
-                    "error_details": "No se pudo establecer conexión con MongoDB"
-                }
-            )
-    except Exception as e:
-        error_msg = f"Error de conexión a la base de datos: {str(e)}"
+        )
+    start_time = time.perf_counter()
+    try:
+        is_connected = await asyncio.wait_for(mongo_connection.check_connection(), HEALTH_PING_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        is_connected = False
+    response_time = (time.perf_counter() - start_time) * 1000
+
+    if not is_connected:
+        error_msg = "La conexión a MongoDB no está activa"
         logger.error(error_msg)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail={
-                "status": "error",
+                "status": "disconnected",
                 "message": error_msg,
-                "error_type": type(e).__name__
+                "response_time_ms": round(response_time, 2)
             }
         )
+    return {
+        "status": "connected",
+        "message": "Conexión exitosa a MongoDB",
+        "database": "face_login_db",
+        "response_time_ms": round(response_time, 2),
+        "ready": readiness.is_ready()
+    }
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness: 200 cuando MongoDB, los modelos faciales y el índice están listos; 503 mientras tanto"""
+    report = readiness.report()
+    if not report["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        response.headers["Retry-After"] = str(RETRY_AFTER_S)
+    return report
 
 @app.get("/system/diagnostics")
 async def system_diagnostics(current_user = Depends(get_current_admin)):
@@ -306,7 +478,9 @@ async def system_diagnostics(current_user = Depends(get_current_admin)):
             "app": {
                 "timestamp": datetime.now().isoformat(),
                 "uptime": "No disponible",  # Se podría implementar con una variable global
-                "environment": os.getenv("ENVIRONMENT", "development")
+                "environment": os.getenv("ENVIRONMENT", "development"),
+                "pid": os.getpid(),
+                "worker_id": os.getenv("SERVE_WORKER_ID")
             },
             "database": {
                 "status": "checking"
@@ -328,6 +502,8 @@ async def system_diagnostics(current_user = Depends(get_current_admin)):
                 "response_time_ms": round(db_response_time, 2),
                 "connection_attempts": mongo_connection._connection_attempts,
                 "max_retries": mongo_connection._max_retries,
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "min_pool_size": MONGO_MIN_POOL_SIZE,
                 "last_check": mongo_connection._last_connection_check.isoformat() if mongo_connection._last_connection_check else None
             }
             
@@ -369,6 +545,17 @@ async def system_diagnostics(current_user = Depends(get_current_admin)):
                 "error": "No hay conexión activa a la base de datos"
             }
         
+        # Estado del pool de reconocimiento facial
+        system_info["face_workers"] = {**face_pool.stats(), "login_batching": login_batcher.stats(), "cache": face_cache.stats()}
+        system_info["face_index"] = face_index.stats()
+        system_info["passwords"] = password_service.stats()
+        system_info["user_cache"] = user_cache.stats()
+        system_info["user_sync"] = user_sync.stats()
+        system_info["audit_buffer"] = audit_buffer.stats()
+        system_info["google_keys"] = google_verifier.stats()
+        system_info["logging"] = logging_stats()
+        system_info["readiness"] = readiness.report()
+        
         # Información de logs
         try:
             log_info = {
@@ -391,11 +578,63 @@ async def system_diagnostics(current_user = Depends(get_current_admin)):
             }
         )
 
+@app.get("/system/face-workers")
+async def face_workers_stats(current_user = Depends(get_current_admin)):
+    """Profundidad de cola y utilización del pool de reconocimiento facial (solo administradores)"""
+    return {
+        **face_pool.stats(),
+        "login_batching": login_batcher.stats(),
+        "cache": face_cache.stats(),
+        "uploads": upload_budget.stats(),
+        "stage_latencies": stage_seconds.summary()
+    }
+
+# Contadores de otros módulos que se leen en el momento de exportar /metrics
+registry.callback("face_cache_hits_total", "Resultados del pipeline servidos desde la caché", "counter",
+                  lambda: face_cache.stats()["hits"])
+registry.callback("face_cache_misses_total", "Imágenes que tuvieron que pasar por el pipeline", "counter",
+                  lambda: face_cache.stats()["misses"])
+registry.callback("face_cache_shared_total", "Peticiones que esperaron a un pipeline ya en curso", "counter",
+                  lambda: face_cache.stats()["shared_in_flight"])
+registry.callback("face_pool_rejected_total", "Peticiones rechazadas (503) por saturación del pool", "counter",
+                  lambda: face_pool.stats()["rejected"])
+registry.callback("face_pool_failed_total", "Tareas fallidas en el pool de reconocimiento facial", "counter",
+                  lambda: face_pool.stats()["failed"])
+registry.callback("face_pool_in_flight", "Tareas en curso o en cola en el pool", "gauge",
+                  lambda: face_pool.stats()["in_flight"])
+registry.callback("face_pool_queue_depth", "Tareas esperando un proceso libre", "gauge",
+                  lambda: face_pool.stats()["queue_depth"])
+registry.callback("upload_bytes_in_flight", "Bytes de imágenes subidas retenidos en memoria", "gauge",
+                  lambda: upload_budget.in_use)
+registry.callback("album_catalog_rebuilds_total", "Reconstrucciones del snapshot de /api/albums", "counter",
+                  lambda: album_catalog.rebuilds)
+registry.callback("album_catalog_not_modified_total", "Respuestas 304 de /api/albums", "counter",
+                  lambda: album_catalog.not_modified)
+registry.callback("face_login_batches_total", "Micro-lotes de login enviados al pool", "counter",
+                  lambda: login_batcher.stats()["batches"])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(registry.expose(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Rutas protegidas para administradores
+# Los listados nunca devuelven la imagen ni el hash de la contraseña
+USER_LIST_PROJECTION = {**USER_PROJECTION, "password": 0}
+USER_LIST_SORT = [("_id", 1)]
+LOG_LIST_SORT = [("timestamp", -1), ("_id", -1)]
+
 @app.get("/api/users")
-async def get_users(current_user = Depends(get_current_admin)):
-    users = await db.usuarios.find().to_list(length=None)
-    return users
+async def get_users(
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    stream: bool = False,
+    current_user = Depends(get_current_admin)
+):
+    """Usuarios paginados por _id (cursor en X-Next-Cursor) o como NDJSON con stream=true"""
+    if stream:
+        return ndjson_response(db.usuarios, {}, USER_LIST_PROJECTION, USER_LIST_SORT, after, limit)
+    return await paginated_response(db.usuarios, {}, USER_LIST_PROJECTION, USER_LIST_SORT, after, limit)
 
 @app.post("/api/users")
 async def create_user(user: UserCreate, current_user = Depends(get_current_admin)):
@@ -403,10 +642,13 @@ async def create_user(user: UserCreate, current_user = Depends(get_current_admin
     if existing_user:
         raise HTTPException(status_code=400, detail="El usuario ya existe")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     user_dict = user.dict()
     user_dict["password"] = hashed_password
-    result = await db.usuarios.insert_one(user_dict)
+    try:
+        result = await db.usuarios.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="El usuario ya existe")
     return {"id": str(result.inserted_id), **user_dict}
 
 @app.put("/api/users/{user_id}")
@@ -417,26 +659,52 @@ async def update_user(user_id: str, user: UserBase, current_user = Depends(get_c
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_cache.invalidate_id(user_id)
+    user_cache.invalidate(user.username)
+    await face_index.refresh(db.usuarios, {"_id": ObjectId(user_id)})
     return {"message": "Usuario actualizado"}
 
 @app.delete("/api/users/{user_id}")
 async def delete_user(user_id: str, current_user = Depends(get_current_admin)):
-    result = await db.usuarios.delete_one({"_id": ObjectId(user_id)})
-    if result.deleted_count == 0:
+    deleted = await db.usuarios.find_one_and_delete({"_id": ObjectId(user_id)}, projection={"face_image_ref": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    user_cache.invalidate_id(user_id)
+    face_index.remove(user_id)
+    await release_face_image(deleted.get("face_image_ref"))
     return {"message": "Usuario eliminado"}
 
+@app.get("/api/users/{user_id}/face-image")
+async def get_user_face_image(user_id: str, current_user = Depends(get_current_admin)):
+    user = await db.usuarios.find_one({"_id": ObjectId(user_id)}, {"face_image_ref": 1})
+    if user is None or not user.get("face_image_ref"):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    try:
+        image = await face_image_store.get(user["face_image_ref"])
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    return Response(content=image, media_type="image/jpeg")
+
 # Rutas protegidas para álbumes
 @app.get("/api/albums")
-async def get_albums(current_user = Depends(get_current_user)):
-    albums = await db.albums.find().to_list(length=None)
-    return albums
+async def get_albums(request: Request, current_user = Depends(get_current_user)):
+    # Snapshot en proceso con sus pistas, ya serializado; 304 si el cliente tiene el mismo ETag
+    return await album_catalog.response(request)
 
 @app.post("/api/albums")
 async def create_album(album: dict, current_user = Depends(get_current_admin)):
-    result = await db.albums.insert_one(album)
+    # insert_one añade _id (ObjectId) al dict que recibe; se inserta una copia
+    result = await db.albums.insert_one(dict(album))
+    await album_catalog.refresh()
     return {"id": str(result.inserted_id), **album}
 
+@app.post("/api/albums/ingest")
+async def ingest_albums(prune: bool = False, current_user = Depends(get_current_admin)):
+    """Vuelve a leer la biblioteca de música (etiquetas y duraciones) en albums y tracks"""
+    stats = await ingest_library(db, prune=prune)
+    await album_catalog.refresh()
+    return stats
+
 @app.put("/api/albums/{album_id}")
 async def update_album(album_id: str, album: dict, current_user = Depends(get_current_admin)):
     result = await db.albums.update_one(
@@ -445,6 +713,7 @@ async def update_album(album_id: str, album: dict, current_user = Depends(get_cu
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Álbum no encontrado")
+    await album_catalog.refresh()
     return {"message": "Álbum actualizado"}
 
 @app.delete("/api/albums/{album_id}")
@@ -452,102 +721,78 @@ async def delete_album(album_id: str, current_user = Depends(get_current_admin))
     result = await db.albums.delete_one({"_id": ObjectId(album_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Álbum no encontrado")
+    await db.tracks.delete_many({"album_id": ObjectId(album_id)})
+    await album_catalog.refresh()
     return {"message": "Álbum eliminado"}
 
-from fastapi import Form
+# Pistas de la biblioteca de música con soporte de Range (saltos sin descargar la pista entera)
+@app.api_route("/api/music/{track_path:path}", methods=["GET", "HEAD"])
+async def stream_track(track_path: str, request: Request, current_user = Depends(get_stream_user)):
+    return await music_library.response(request, track_path)
 
+REGISTER_FORM = {
+    "username": {"minLength": 3, "maxLength": 50},
+    "password": {"minLength": 8},
+    "email": {},
+    "role": {"enum": [role.value for role in UserRole], "default": UserRole.NORMAL.value}
+}
 
-@app.post("/register", status_code=status.HTTP_201_CREATED, response_model=User)
-async def register_user(
-    username: str = Form(..., min_length=3, max_length=50),
-    password: str = Form(..., min_length=8),
-    email: str = Form(...),
-    role: UserRole = Form(default=UserRole.NORMAL),
-    face_image: UploadFile = File(...)
-):
+
+@app.post("/register", status_code=status.HTTP_201_CREATED, dependencies=[Depends(require_face_models)],
+          openapi_extra=multipart_openapi(REGISTER_FORM))
+async def register_user(form: FaceUploadForm = Depends(face_upload("register"))):
+    username = form.field("username", min_length=3, max_length=50)
+    password = form.field("password", min_length=8)
+    email = form.field("email")
+    try:
+        role = UserRole(form.field("role", default=UserRole.NORMAL.value))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Rol no válido")
+    face_image = form.image
     logger.info(f"Intentando registrar usuario: {username}, email: {email}, filename imagen: {face_image.filename}")
-    
-    # Validar el formato de la imagen
-    content_type = face_image.content_type
-    allowed_types = ['image/jpeg', 'image/png']
-    if not content_type or content_type not in allowed_types:
-        logger.warning(f"Tipo de contenido no válido: {content_type}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail={
-                "error": "Formato de imagen no válido",
-                "message": "El archivo debe ser una imagen en formato JPEG o PNG",
-                "allowed_types": allowed_types
-            }
-        )
-    
+
     # Verificar si el usuario ya existe
     existing_user = await get_user(username)
     if existing_user:
-        print("Usuario ya registrado")
+        logger.info(f"Registro rechazado: el usuario {username} ya existe")
         raise HTTPException(status_code=400, detail="El nombre de usuario ya está registrado")
 
     try:
-        # Leer contenido de la imagen
-        contents = await face_image.read()
-        if not contents:
-            print("Contenido de imagen vacío")
-            raise HTTPException(status_code=400, detail="La imagen está vacía o corrupta")
-        
-        print(f"Tamaño de la imagen recibida: {len(contents)} bytes")
-        
-        # Procesar y validar la imagen
+        # La imagen ya llegó validada (formato, dimensiones y tamaño) por upload_ingest;
+        # se procesa en el pool de procesos
         try:
-            # Abrir la imagen con PIL
-            image = Image.open(io.BytesIO(contents))
-            print(f"Formato de imagen: {image.format}, Modo: {image.mode}, Tamaño: {image.size}")
-            
-            # Validar formato de imagen
-            if image.format not in ['JPEG', 'PNG']:
-                raise HTTPException(status_code=400, detail="Por favor, use una imagen en formato JPEG o PNG")
-            
-            # Convertir a RGB y redimensionar si es necesario
-            image = image.convert('RGB')
-            
-            # Validar dimensiones mínimas
-            if image.size[0] < 50 or image.size[1] < 50:
-                raise HTTPException(status_code=400, detail="La imagen es demasiado pequeña. Debe ser al menos 50x50 píxeles")
-            
-            # Convertir a array numpy
-            np_image = np.array(image)
-            
-            # Detectar rostros
-            face_locations = face_recognition.face_locations(np_image)
-            if not face_locations:
-                raise HTTPException(status_code=400, detail="No se detectó ningún rostro en la imagen. Por favor, use una imagen clara de su rostro")
-            
-            if len(face_locations) > 1:
-                raise HTTPException(status_code=400, detail="Se detectó más de un rostro en la imagen. Por favor, use una imagen con un solo rostro")
-            
-            # Obtener codificación facial
-            face_encodings = face_recognition.face_encodings(np_image, face_locations)
-            face_encoding = face_encodings[0]
-            print("Rostro detectado y codificado exitosamente")
-            
-            # Guardar imagen como bytes
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format=image.format or 'JPEG')
-            img_byte_arr = img_byte_arr.getvalue()
+            with span("face_pipeline"):
+                processed = await run_face_pipeline(face_cache.get_or_run(
+                    process_registration_image, face_image.contents,
+                    timed_runner(functools.partial(face_pool.submit, process_registration_image)),
+                    content_digest=face_image.digest
+                ))
+            face_encoding = processed["face_encoding"]
+            img_byte_arr = processed["face_image"]
+            logger.debug("Rostro detectado y codificado exitosamente")
             
         except HTTPException:
             raise
         except Exception as e:
-            print(f"Error procesando la imagen: {str(e)}")
+            logger.warning(f"Error procesando la imagen: {str(e)}")
             raise HTTPException(status_code=400, detail="Error al procesar la imagen. Asegúrese de que sea una imagen válida y clara")
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error inesperado procesando la imagen: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error inesperado procesando la imagen: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno al procesar la imagen")
 
+    # Detectar si el rostro ya está registrado con otro usuario
+    with span("duplicate_check"):
+        duplicate = face_index.find_duplicate(face_encoding)
+    if duplicate:
+        duplicate_id, duplicate_username, duplicate_distance = duplicate
+        logger.warning(f"Registro de {username}: rostro casi idéntico al de {duplicate_username} (distancia {duplicate_distance:.3f})")
+        if DUPLICATE_POLICY == "reject":
+            raise HTTPException(status_code=409, detail="Este rostro ya está registrado con otro usuario")
+
+    face_image_ref = None
     try:
         # Crear usuario
         # Validar el rol
@@ -557,125 +802,115 @@ async def register_user(
         user_dict = {
             "username": username,
             "email": email,
-            "password": get_password_hash(password),
+            "password": await get_password_hash(password),
             "role": role,
-            "face_encoding": face_encoding.tolist(),
-            "face_image": img_byte_arr  # Guardar la imagen como bytes
+            "face_encoding": face_encoding
         }
+        # La imagen se guarda en el almacén de blobs; el documento sólo lleva la referencia
+        with span("blob_store"):
+            face_image_ref = await face_image_store.put(img_byte_arr)
+        user_dict["face_image_ref"] = face_image_ref
+        if duplicate:
+            user_dict["duplicate_of"] = {
+                "user_id": duplicate_id,
+                "username": duplicate_username,
+                "distance": round(duplicate_distance, 4)
+            }
         
-        print(f"Insertando usuario en la base de datos: {username}")
-        result = await db.usuarios.insert_one(user_dict)
-        print("Usuario registrado exitosamente")
+        logger.debug(f"Insertando usuario en la base de datos: {username}")
+        with span("user_insert"):
+            result = await db.usuarios.insert_one(user_dict)
+        face_index.upsert(result.inserted_id, username, face_encoding)
+        logger.info(f"Usuario registrado exitosamente: {username}")
         return {"message": "Usuario registrado exitosamente"}
         
+    except DuplicateKeyError:
+        # Otro registro con el mismo username (o email) ganó la carrera tras get_user;
+        # se libera la imagen ya guardada si ningún otro usuario la referencia
+        await release_face_image(face_image_ref)
+        raise HTTPException(status_code=400, detail="El nombre de usuario o el email ya están registrados")
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error al guardar usuario en la base de datos: {str(e)}")
+        logger.error(f"Error al guardar usuario en la base de datos: {str(e)}")
+        await release_face_image(face_image_ref)
         raise HTTPException(status_code=500, detail="Error al guardar el usuario en la base de datos")
 
 
-@app.post("/login/face")
-async def face_login(
-    username: str = Form(...),
-    password: str = Form(...),
-    face_image: UploadFile = File(...)
-):
+async def check_login_password(user: dict, password: str):
+    """Etapa de contraseña de /login/face: 401 si no coincide"""
+    if not await verify_password(password, user.get("password")):
+        raise HTTPException(status_code=401, detail="Nombre de usuario o contraseña incorrectos")
+
+
+async def encode_login_face(face_image) -> np.ndarray:
+    """Etapa de rostro de /login/face: detecta y codifica en el pool (agrupado en micro-lotes)"""
     try:
-        # Verificar credenciales del usuario
-        user = await authenticate_user(username, password)
+        with span("face_pipeline"):
+            processed = await run_face_pipeline(face_cache.get_or_run(
+                process_login_image, face_image.contents, timed_runner(login_batcher.submit),
+                content_digest=face_image.digest
+            ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Error procesando la imagen: {str(e)}")
+        raise HTTPException(status_code=400, detail="Error al procesar la imagen. Asegúrese de que sea una imagen válida y clara")
+    logger.debug("Rostro detectado y codificado exitosamente")
+    return np.array(processed["face_encoding"])
+
+
+@app.post("/login/face", dependencies=[Depends(require_face_models)],
+          openapi_extra=multipart_openapi({"username": {}, "password": {}}))
+async def face_login(form: FaceUploadForm = Depends(face_upload("login"))):
+    """
+    Login con contraseña y rostro, por etapas ordenadas de menor a mayor coste:
+
+    1. formato, dimensiones y tamaño de la imagen (dependencia face_upload, mientras se recibe)
+    2. usuario (caché en memoria o una consulta por índice)
+    3. contraseña (bcrypt) y rostro (HOG y codificación) a la vez; la primera que
+       falla cancela a la otra
+    4. comparación de las codificaciones
+    5. auditoría y emisión del token, sólo cuando todo lo anterior es correcto
+    """
+    username = form.field("username")
+    password = form.field("password")
+    face_image = form.image
+    try:
+        user = await get_user(username)
         if not user:
-            raise HTTPException(
-                status_code=401,
-                detail="Nombre de usuario o contraseña incorrectos"
-            )
-        
-        # Generar token JWT con rol
-        access_token = create_access_token(
-            data={"sub": user["username"], "role": user.get("role", UserRole.NORMAL)}
-        )
+            raise HTTPException(status_code=401, detail="Nombre de usuario o contraseña incorrectos")
 
-        # Validar el formato de la imagen
-        content_type = face_image.content_type
-        if not content_type or not content_type.startswith('image/'):
-            print(f"Tipo de contenido no válido: {content_type}")
-            raise HTTPException(status_code=400, detail="El archivo debe ser una imagen válida (JPEG, PNG)")
-
-        # Verificar que el archivo no esté vacío
-        contents = await face_image.read()
-        if not contents:
-            print("Archivo de imagen vacío")
-            raise HTTPException(status_code=400, detail="La imagen está vacía o corrupta")
-        
-        print(f"Imagen recibida: {face_image.filename}, tamaño: {len(contents)} bytes")
-        
-        try:
-            # Abrir y validar la imagen
-            image = Image.open(io.BytesIO(contents))
-            print(f"Formato de imagen: {image.format}, modo: {image.mode}, tamaño: {image.size}")
-            
-            # Validar formato de imagen
-            if image.format not in ['JPEG', 'PNG']:
-                raise HTTPException(status_code=400, detail="Por favor, use una imagen en formato JPEG o PNG")
-            
-            # Validar dimensiones mínimas
-            if image.size[0] < 50 or image.size[1] < 50:
-                raise HTTPException(status_code=400, detail="La imagen es demasiado pequeña. Debe ser al menos 50x50 píxeles")
-            
-            # Convertir a RGB y mejorar la imagen
-            image = image.convert('RGB')
-            print("Imagen convertida a RGB")
-            
-            # Ajustar brillo y contraste
-            from PIL import ImageEnhance
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(1.2)  # Aumentar brillo en 20%
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.3)  # Aumentar contraste en 30%
-            print("Brillo y contraste ajustados")
-            
-            # Convertir a array numpy
-            np_image = np.array(image)
-            print(f"Array numpy creado con forma: {np_image.shape}")
-            
-            # Detectar rostros con parámetros más flexibles
-            face_locations = face_recognition.face_locations(np_image, model='hog', number_of_times_to_upsample=2)
-            if not face_locations:
-                print("Intento adicional con diferentes parámetros...")
-                # Segundo intento con parámetros más permisivos
-                face_locations = face_recognition.face_locations(np_image, model='hog', number_of_times_to_upsample=3)
-                if not face_locations:
-                    raise HTTPException(status_code=400, detail="No se detectó ningún rostro en la imagen. Por favor, asegúrese de tener buena iluminación y que su rostro esté claramente visible")
-            
-            if len(face_locations) > 1:
-                raise HTTPException(status_code=400, detail="Se detectó más de un rostro en la imagen. Por favor, use una imagen con un solo rostro")
-            
-            # Obtener codificación facial
-            face_encodings = face_recognition.face_encodings(np_image, face_locations)
-            face_encoding = face_encodings[0]
-            print("Rostro detectado y codificado exitosamente")
-            
-        except HTTPException:
-            raise
-        except Exception as e:
-            print(f"Error procesando la imagen: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            raise HTTPException(status_code=400, detail="Error al procesar la imagen. Asegúrese de que sea una imagen válida y clara")
-        
-        # Verificar coincidencia con el rostro registrado del usuario
         if "face_encoding" not in user:
+            # Sin rostro registrado no se ejecuta el pipeline; la contraseña se comprueba
+            # igualmente para no revelar el estado de la cuenta a quien no la conoce
+            await check_login_password(user, password)
             raise HTTPException(status_code=400, detail="Usuario no tiene rostro registrado")
-            
-        if not face_recognition.compare_faces([user["face_encoding"]], face_encoding)[0]:
-            print("Rostro no coincide con el usuario")
+
+        _, face_encoding = await run_fail_fast(
+            check_login_password(user, password),
+            encode_login_face(face_image)
+        )
+
+        with span("compare"):
+            # Misma regla que face_recognition.compare_faces: distancia euclídea <= tolerancia
+            matches = np.linalg.norm(np.asarray(user["face_encoding"]) - face_encoding) <= FACE_MATCH_TOLERANCE
+        if not matches:
+            logger.info(f"Rostro no coincide con el usuario {username}")
             raise HTTPException(status_code=401, detail="El rostro no coincide con el usuario autenticado")
 
+        await complete_authentication(user, password)
+        access_token = create_access_token(
+            data={"sub": user["username"], "role": user.get("role", UserRole.NORMAL)}
+        )
+
         # Registrar el inicio de sesión exitoso
         log_entry = {
             "username": user["username"],
             "timestamp": datetime.now(),
             "login_type": "face"
         }
-        await db.logs.insert_one(log_entry)
+        audit_buffer.record(log_entry)
         return {
             "message": "Login exitoso", 
             "username": user["username"], 
@@ -688,11 +923,82 @@ async def face_login(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error inesperado: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error inesperado: {str(e)}")
         raise HTTPException(status_code=500, detail="Error interno del servidor al procesar la imagen")
 
+@app.post("/login/face/identify", dependencies=[Depends(readiness.require("face_models", "face_index"))],
+          openapi_extra=multipart_openapi({}))
+async def face_identify(form: FaceUploadForm = Depends(face_upload("identify"))):
+    """Login sin contraseña: identifica al usuario buscando su rostro entre todos los registrados"""
+    face_image = form.image
+    try:
+        with span("face_pipeline"):
+            processed = await run_face_pipeline(face_cache.get_or_run(
+                process_login_image, face_image.contents, timed_runner(login_batcher.submit),
+                content_digest=face_image.digest
+            ))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error procesando la imagen en identificación facial: {str(e)}")
+        raise HTTPException(status_code=400, detail="Error al procesar la imagen. Asegúrese de que sea una imagen válida y clara")
+
+    with span("index_search"):
+        match = face_index.identify(processed["face_encoding"])
+    if match is None:
+        raise HTTPException(status_code=401, detail="El rostro no corresponde a ningún usuario registrado")
+    user_id, username, distance = match
+    logger.info(f"Rostro identificado como {username} (distancia {distance:.3f})")
+
+    user = await db.usuarios.find_one({"_id": ObjectId(user_id)}, {"username": 1, "role": 1})
+    if user is None:
+        # El índice quedó desfasado respecto a la base de datos
+        face_index.remove(user_id)
+        raise HTTPException(status_code=401, detail="El rostro no corresponde a ningún usuario registrado")
+
+    role = user.get("role", UserRole.NORMAL)
+    access_token = create_access_token(data={"sub": user["username"], "role": role})
+
+    log_entry = {
+        "username": user["username"],
+        "timestamp": datetime.now(),
+        "login_type": "face_identify"
+    }
+    audit_buffer.record(log_entry)
+    return {
+        "message": "Login exitoso",
+        "username": user["username"],
+        "access_token": access_token,
+        "token_type": "bearer",
+        "role": role,
+        "distance": round(distance, 4),
+        "redirect": "/Frvttae/albumes.html" if role == UserRole.NORMAL else "/admin/dashboard"
+    }
+
+async def resolve_google_user(idinfo: dict) -> dict:
+    """
+    El alta de un usuario de Google chocó con un índice único: o un login simultáneo
+    ya lo creó, o el email pertenece a una cuenta registrada con /register. En ese
+    caso se vincula el google_id si Google ha verificado el email y la cuenta no
+    tiene otro; si no, 409.
+    """
+    user = await db.usuarios.find_one({"google_id": idinfo["sub"]}, USER_PROJECTION)
+    if user is not None:
+        return user
+    existing = await db.usuarios.find_one({"email": idinfo["email"]}, USER_PROJECTION)
+    if existing is None or existing.get("google_id") or idinfo.get("email_verified") is not True:
+        logger.warning(f"Login de Google rechazado: el email {idinfo['email']} ya pertenece a otra cuenta")
+        raise HTTPException(status_code=409, detail="El email ya está registrado con otra cuenta")
+    result = await db.usuarios.update_one(
+        {"_id": existing["_id"], "google_id": {"$exists": False}},
+        {"$set": {"google_id": idinfo["sub"]}}
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=409, detail="El email ya está registrado con otra cuenta")
+    user_cache.invalidate(existing["username"])
+    logger.info(f"Cuenta {existing['username']} vinculada con Google")
+    return {**existing, "google_id": idinfo["sub"]}
+
 @app.post("/login/google")
 async def google_login(token_data: dict):
     try:
@@ -701,11 +1007,8 @@ async def google_login(token_data: dict):
         if not credential:
             raise HTTPException(status_code=400, detail="Token no proporcionado")
             
-        idinfo = id_token.verify_oauth2_token(
-            credential,
-            requests.Request(),
-            GOOGLE_CLIENT_ID
-        )
+        # Verificación local con las claves de Google cacheadas (sin HTTP en cada login)
+        idinfo = await google_verifier.verify(credential)
         
         # Verificar si el usuario existe o crear uno nuevo
         user = await get_user(idinfo["email"])
@@ -715,15 +1018,19 @@ async def google_login(token_data: dict):
                 "email": idinfo["email"],
                 "google_id": idinfo["sub"]
             }
-            await db.usuarios.insert_one(user_dict)
+            try:
+                await db.usuarios.insert_one(user_dict)
+                user = user_dict
+            except DuplicateKeyError:
+                user = await resolve_google_user(idinfo)
 
         # Registrar el inicio de sesión
         log_entry = {
-            "username": idinfo["email"],
+            "username": user["username"],
             "timestamp": datetime.now(),
             "login_type": "google"
         }
-        await db.logs.insert_one(log_entry)
+        audit_buffer.record(log_entry)
         
         return {"message": "Google login successful", "email": idinfo["email"], "redirect": "/Frvttae/albumes.html"}
     except ValueError as e:
@@ -731,16 +1038,11 @@ async def google_login(token_data: dict):
 
 # CRUD operations
 @app.get("/users")
-async def get_users():
-    users = await db.usuarios.find().to_list(length=None)
-    # Convertir ObjectId a string para serialización JSON
-    for user in users:
-        if '_id' in user:
-            user['_id'] = str(user['_id'])
-        # Convertir face_encoding a lista si existe
-        if 'face_encoding' in user and user['face_encoding'] is not None:
-            user['face_encoding'] = user['face_encoding'] if isinstance(user['face_encoding'], list) else user['face_encoding'].tolist()
-    return users
+async def get_users(after: Optional[str] = None, limit: Optional[int] = None, stream: bool = False):
+    # ObjectId y fechas se convierten a string en paginated_response/ndjson_response
+    if stream:
+        return ndjson_response(db.usuarios, {}, USER_LIST_PROJECTION, USER_LIST_SORT, after, limit)
+    return await paginated_response(db.usuarios, {}, USER_LIST_PROJECTION, USER_LIST_SORT, after, limit)
 
 @app.get("/users/{username}")
 async def get_user_by_username(username: str):
@@ -759,16 +1061,58 @@ async def update_user(username: str, user: UserBase):
         {"username": username},
         {"$set": user.dict(exclude_unset=True)}
     )
+    user_cache.invalidate(username, user.username)
+    await face_index.refresh(db.usuarios, {"username": user.username})
     return {"message": "User updated successfully"}
 
 @app.delete("/users/{username}")
 async def delete_user(username: str):
-    result = await db.usuarios.delete_one({"username": username})
-    if result.deleted_count == 0:
+    deleted = await db.usuarios.find_one_and_delete({"username": username}, projection={"face_image_ref": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="User not found")
+    user_cache.invalidate(username)
+    face_index.remove(deleted["_id"])
+    await release_face_image(deleted.get("face_image_ref"))
     return {"message": "User deleted successfully"}
 
 @app.get("/logs")
-async def get_logs():
-    logs = await db.logs.find().to_list(length=None)
-    return logs
+async def get_logs(
+    after: Optional[str] = None,
+    limit: Optional[int] = None,
+    stream: bool = False,
+    username: Optional[str] = None
+):
+    """Logs del más reciente al más antiguo, paginados por (timestamp, _id) o en NDJSON"""
+    query = {"username": username} if username else {}
+    if stream:
+        return ndjson_response(db.logs, query, None, LOG_LIST_SORT, after, limit)
+    return await paginated_response(db.logs, query, None, LOG_LIST_SORT, after, limit)
+
+# Estadísticas de logins desde los rollups precalculados (solo administradores)
+async def _stats_call(fn, *args, **kwargs):
+    """Granularidad no válida -> 400"""
+    try:
+        return await fn(*args, **kwargs)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/stats/logins")
+async def login_stats_series(granularity: str = "hour", last: int = 24, current_user = Depends(get_current_admin)):
+    return await _stats_call(login_rollups.series, granularity, last)
+
+@app.get("/api/stats/users/{username}")
+async def login_stats_user(username: str, granularity: str = "day", last: int = 30,
+                           current_user = Depends(get_current_admin)):
+    return await _stats_call(login_rollups.user_series, username, granularity, last)
+
+@app.get("/api/stats/top-users")
+async def login_stats_top_users(granularity: str = "day", limit: int = 10, current_user = Depends(get_current_admin)):
+    return await _stats_call(login_rollups.top_users, granularity, limit)
+
+@app.post("/api/stats/backfill")
+async def login_stats_backfill(since: Optional[datetime] = None, current_user = Depends(get_current_admin)):
+    """Recalcula los rollups desde logs (desde `since`, o todo)"""
+    return await login_rollups.backfill(db.logs, since)
+
+# Fin del import de main.py (parte del tiempo de arranque en frío)
+readiness.mark("imported")
@@ -0,0 +1,264 @@
+"""
+Métricas en proceso con exportación en formato de texto de Prometheus.
+
+Registro mínimo sin dependencias: histogramas con buckets fijos (de los que se
+estiman p50/p95/p99 como haría histogram_quantile), contadores con etiquetas y
+métricas calculadas en el momento de exportar a partir de los stats() de otros
+módulos (caché facial, pool de procesos...). Los métodos son thread-safe porque
+los listeners de pymongo y el pool de bcrypt observan desde otros hilos.
+
+Los spans (`with span("bcrypt_verify"):`) alimentan el histograma
+face_stage_seconds{endpoint, stage}; el endpoint se toma de endpoint_var.
+"""
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+from pymongo import monitoring
+
+# Buckets en segundos: de 1 ms a 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Momento en que el middleware recibió la petición; sirve para medir el parseo del multipart
+request_start_var = contextvars.ContextVar("request_start", default=None)
+# Endpoint en curso; lo fija cada handler instrumentado y lo heredan los helpers que llama
+endpoint_var = contextvars.ContextVar("endpoint", default="other")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # etiquetas -> [contadores por bucket (no acumulados), suma, total]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _quantile(self, counts: list, total: int, q: float) -> float:
+        """Interpolación lineal dentro del bucket, como histogram_quantile de Prometheus"""
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                if upper == math.inf:
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return 0.0
+
+    def summary(self) -> list:
+        """Conteo, media y p50/p95/p99 (en milisegundos) de cada serie"""
+        with self._lock:
+            snapshot = [(key, list(counts), total_sum, total) for key, (counts, total_sum, total) in self._series.items()]
+        rows = []
+        for key, counts, total_sum, total in sorted(snapshot):
+            row = dict(key)
+            row["count"] = total
+            row["mean_ms"] = round(total_sum / total * 1000, 3) if total else 0.0
+            for q in QUANTILES:
+                row[f"p{int(q * 100)}_ms"] = round(self._quantile(counts, total, q) * 1000, 3)
+            rows.append(row)
+        return rows
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(counts), total_sum, total) for key, (counts, total_sum, total) in self._series.items()]
+        for key, counts, total_sum, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {total}")
+        return lines
+
+
+class CallbackMetric:
+    """Métrica cuyo valor se lee al exportar; fn devuelve un número o {etiquetas: valor}"""
+
+    def __init__(self, name: str, help_text: str, metric_type: str, fn, label: str = None):
+        self.name = name
+        self.help = help_text
+        self.type = metric_type
+        self.fn = fn
+        self.label = label
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            for label_value, v in sorted(value.items()):
+                lines.append(f"{self.name}{_format_labels(((self.label, label_value),))} {_format_value(v)}")
+        else:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def callback(self, name: str, help_text: str, metric_type: str, fn, label: str = None) -> CallbackMetric:
+        # Las callbacks se pueden re-registrar (p. ej. al recrear un objeto observado)
+        self._metrics[name] = CallbackMetric(name, help_text, metric_type, fn, label)
+        return self._metrics[name]
+
+    def expose(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Listener de pymongo: duración y fallos de cada comando enviado a MongoDB"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        mongo_command_seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_command_failures.inc(command=event.command_name)
+
+
+# Registro global y métricas compartidas por varios módulos
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "face_stage_seconds", "Duración de cada etapa de los endpoints faciales"
+)
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP por ruta"
+)
+mongo_command_seconds = registry.histogram(
+    "mongo_command_duration_seconds", "Duración de los comandos de MongoDB"
+)
+mongo_command_failures = registry.counter(
+    "mongo_command_failures_total", "Comandos de MongoDB fallidos"
+)
+detection_retries = registry.counter(
+    "face_detection_retries_total", "Detecciones HOG repetidas con más upsample por no encontrar rostro"
+)
+
+
+@contextlib.contextmanager
+def span(stage: str, endpoint: str = None):
+    """Mide un bloque de código como una etapa del endpoint en curso"""
+    with stage_seconds.time(endpoint=endpoint or endpoint_var.get(), stage=stage):
+        yield
+
+
+def start_endpoint(endpoint: str):
+    """
+    Marca el endpoint en curso y registra el tiempo transcurrido desde que llegó la
+    petición hasta que empieza el handler (lectura y parseo del multipart)
+    """
+    endpoint_var.set(endpoint)
+    start = request_start_var.get()
+    if start is not None:
+        stage_seconds.observe(time.perf_counter() - start, endpoint=endpoint, stage="request_parse")
+
+
+def observe_pipeline_timings(result: dict, endpoint: str = None):
+    """Registra las etapas medidas dentro del proceso del pool (decode, enhance, detect...)"""
+    endpoint = endpoint or endpoint_var.get()
+    for stage, seconds in result.get("timings", {}).items():
+        stage_seconds.observe(seconds, endpoint=endpoint, stage=stage)
+    if result.get("detect_retried"):
+        detection_retries.inc(endpoint=endpoint)
+
+
+def timed_runner(runner):
+    """
+    Envuelve el ejecutor que se pasa a face_cache.get_or_run para registrar las
+    etapas internas del pipeline sólo cuando se ejecuta de verdad (no en aciertos de caché)
+    """
+    async def run(contents):
+        result = await runner(contents)
+        observe_pipeline_timings(result)
+        return result
+    return run
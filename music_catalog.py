@@ -0,0 +1,326 @@
+"""
+Catálogo de música: ingesta de frontend/public/music y snapshot de /api/albums.
+
+La ingesta recorre la biblioteca (MUSIC_DIR), lee con mutagen las etiquetas ID3 y
+la duración de cada pista y las guarda en `albums` (una por carpeta, clave `slug`)
+y `tracks` (clave `path`, la ruta que sirve /api/music). Sin etiquetas se usan el
+nombre de la carpeta y del fichero. El título, artista y año de un álbum sólo se
+escriben al crearlo, para no pisar lo que edite un administrador.
+
+GET /api/albums no consulta MongoDB en cada petición: responde con un snapshot
+en proceso (álbumes con sus pistas ya serializados a JSON y su ETag fuerte) que
+se reconstruye cuando create/update/delete modifican los datos, tras una
+ingesta o, como mucho, cada ALBUM_CATALOG_TTL_S (cambios hechos por otros
+workers). Con If-None-Match igual al ETag se responde 304 sin cuerpo.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import NamedTuple
+
+from fastapi import Request
+from pymongo import UpdateOne
+from starlette.responses import Response
+
+from audio_stream import AUDIO_MEDIA_TYPES, MUSIC_DIR, etag_matches
+from pagination import to_json_safe
+
+logger = logging.getLogger("music_catalog")
+
+ALBUM_CATALOG_TTL_S = float(os.getenv("ALBUM_CATALOG_TTL_S", 300))
+# Pistas en la raíz de la biblioteca, fuera de cualquier carpeta de álbum
+SINGLES_SLUG = "sueltas"
+SINGLES_TITLE = "Pistas sueltas"
+
+TRACK_PROJECTION = {
+    "album_id": 1, "path": 1, "title": 1, "artist": 1,
+    "track_number": 1, "disc_number": 1, "duration_s": 1
+}
+
+
+def _tag(tags, key: str):
+    values = tags.get(key) if tags else None
+    if not values:
+        return None
+    return str(values[0]).strip() or None
+
+
+def _number(value):
+    """'3/12' -> 3; None si no es un número"""
+    match = re.match(r"\s*(\d+)", value or "")
+    return int(match.group(1)) if match else None
+
+
+def read_track(root: str, path: str) -> dict:
+    """Metadatos de una pista: etiquetas (con el nombre del fichero como respaldo), duración y tamaño"""
+    import mutagen
+
+    relative = os.path.relpath(path, root).replace(os.sep, "/")
+    stem = os.path.splitext(os.path.basename(path))[0]
+    st = os.stat(path)
+    try:
+        audio = mutagen.File(path, easy=True)
+    except mutagen.MutagenError as e:
+        logger.warning(f"No se pudieron leer las etiquetas de {relative}: {str(e)}")
+        audio = None
+    tags = audio.tags if audio is not None else None
+    info = audio.info if audio is not None else None
+    date = _tag(tags, "date")
+    return {
+        "path": relative,
+        "album_slug": relative.split("/")[0] if "/" in relative else SINGLES_SLUG,
+        "title": _tag(tags, "title") or stem,
+        "artist": _tag(tags, "artist"),
+        "album": _tag(tags, "album"),
+        "album_artist": _tag(tags, "albumartist"),
+        "year": int(date[:4]) if date and date[:4].isdigit() else None,
+        "track_number": _number(_tag(tags, "tracknumber")) or _number(stem),
+        "disc_number": _number(_tag(tags, "discnumber")) or 1,
+        "duration_s": round(info.length, 3) if info is not None and info.length else None,
+        "bitrate": getattr(info, "bitrate", None) or None,
+        "size": st.st_size,
+        "mtime": datetime.fromtimestamp(st.st_mtime),
+    }
+
+
+def scan_library(root: str = None) -> list:
+    """Pistas de la biblioteca (bloqueante: lee las cabeceras de cada fichero)"""
+    root = os.path.realpath(root or MUSIC_DIR)
+    tracks = []
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in AUDIO_MEDIA_TYPES:
+                tracks.append(read_track(root, os.path.join(directory, name)))
+    return tracks
+
+
+def _most_common(values):
+    values = [v for v in values if v]
+    return Counter(values).most_common(1)[0][0] if values else None
+
+
+def album_from_tracks(slug: str, tracks: list) -> dict:
+    """Campos del álbum deducidos de sus pistas"""
+    if slug == SINGLES_SLUG:
+        title = SINGLES_TITLE
+    else:
+        title = _most_common(t["album"] for t in tracks) or slug.replace("_", " ").capitalize()
+    return {
+        "title": title,
+        "artist": _most_common(t["album_artist"] for t in tracks) or _most_common(t["artist"] for t in tracks),
+        "year": _most_common(t["year"] for t in tracks),
+    }
+
+
+async def ingest_library(db, root: str = None, prune: bool = False) -> dict:
+    """
+    Inserta o actualiza `albums` y `tracks` con el contenido de la biblioteca.
+    Con prune=True borra las pistas cuyo fichero ya no existe y los álbumes de la
+    ingesta que se quedan sin pistas.
+    """
+    start = time.perf_counter()
+    scanned = await asyncio.to_thread(scan_library, root)
+    by_album = defaultdict(list)
+    for track in scanned:
+        by_album[track["album_slug"]].append(track)
+
+    now = datetime.now()
+    album_ops = [
+        UpdateOne(
+            {"slug": slug},
+            {
+                "$set": {
+                    "track_count": len(tracks),
+                    "duration_s": round(sum(t["duration_s"] or 0 for t in tracks), 3),
+                    "updated_at": now
+                },
+                "$setOnInsert": {"slug": slug, "source": "ingest", "created_at": now, **album_from_tracks(slug, tracks)}
+            },
+            upsert=True
+        )
+        for slug, tracks in by_album.items()
+    ]
+    if album_ops:
+        await db.albums.bulk_write(album_ops, ordered=False)
+    album_ids = {
+        doc["slug"]: doc["_id"]
+        async for doc in db.albums.find({"slug": {"$in": list(by_album)}}, {"slug": 1})
+    }
+
+    track_ops = [
+        UpdateOne(
+            {"path": track["path"]},
+            {"$set": {
+                **{k: v for k, v in track.items() if k not in ("album", "album_artist", "year")},
+                "album_id": album_ids[track["album_slug"]],
+                "updated_at": now
+            }},
+            upsert=True
+        )
+        for track in scanned
+    ]
+    if track_ops:
+        await db.tracks.bulk_write(track_ops, ordered=False)
+
+    removed_tracks = removed_albums = 0
+    if prune:
+        paths = [track["path"] for track in scanned]
+        removed_tracks = (await db.tracks.delete_many({"path": {"$nin": paths}})).deleted_count
+        removed_albums = (await db.albums.delete_many(
+            {"source": "ingest", "slug": {"$nin": list(by_album)}}
+        )).deleted_count
+
+    stats = {
+        "albums": len(by_album),
+        "tracks": len(scanned),
+        "removed_tracks": removed_tracks,
+        "removed_albums": removed_albums,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+    logger.info(f"Ingesta de la biblioteca de música: {stats}")
+    return stats
+
+
+class CatalogSnapshot(NamedTuple):
+    body: bytes
+    etag: str
+    albums: int
+    tracks: int
+    built_at: float
+
+
+def _track_json(track: dict) -> dict:
+    return {
+        "id": str(track["_id"]),
+        "title": track.get("title"),
+        "artist": track.get("artist"),
+        "track_number": track.get("track_number"),
+        "disc_number": track.get("disc_number"),
+        "duration_s": track.get("duration_s"),
+        # Rutas con espacios, '#', '?' o caracteres no ASCII sacados de las etiquetas
+        "url": f"/api/music/{urllib.parse.quote(track['path'])}"
+    }
+
+
+class AlbumCatalog:
+    def __init__(self, ttl_seconds: float = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else ALBUM_CATALOG_TTL_S
+        self._db = None
+        self._snapshot = None
+        self._expires_at = 0.0
+        # Contador de invalidaciones: un snapshot que empezó a construirse antes de
+        # una escritura no se conserva
+        self._version = 0
+        self._built_version = -1
+        self._lock = asyncio.Lock()
+        self.rebuilds = 0
+        self.not_modified = 0
+
+    def attach(self, db):
+        self._db = db
+        self.invalidate()
+
+    def invalidate(self):
+        self._version += 1
+
+    def _fresh(self) -> bool:
+        return (self._snapshot is not None and self._built_version == self._version
+                and time.monotonic() < self._expires_at)
+
+    async def _build(self) -> CatalogSnapshot:
+        albums = await self._db.albums.find({}).sort("_id", 1).to_list(length=None)
+        tracks_by_album = defaultdict(list)
+        track_count = 0
+        cursor = self._db.tracks.find({}, TRACK_PROJECTION).sort(
+            [("album_id", 1), ("disc_number", 1), ("track_number", 1), ("path", 1)]
+        )
+        async for track in cursor:
+            tracks_by_album[track.get("album_id")].append(_track_json(track))
+            track_count += 1
+        payload = [{**to_json_safe(album), "tracks": tracks_by_album.get(album["_id"], [])} for album in albums]
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return CatalogSnapshot(
+            body=body,
+            etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            albums=len(albums),
+            tracks=track_count,
+            built_at=time.time()
+        )
+
+    async def get(self) -> CatalogSnapshot:
+        if self._fresh():
+            return self._snapshot
+        async with self._lock:
+            # Otra petición puede haberlo reconstruido mientras se esperaba el lock
+            if self._fresh():
+                return self._snapshot
+            version = self._version
+            snapshot = await self._build()
+            self.rebuilds += 1
+            if version == self._version:
+                self._snapshot = snapshot
+                self._built_version = version
+                self._expires_at = time.monotonic() + self.ttl_seconds
+            return snapshot
+
+    async def refresh(self) -> CatalogSnapshot:
+        """Invalida y reconstruye ya, para que la siguiente lectura no espere"""
+        self.invalidate()
+        return await self.get()
+
+    async def response(self, request: Request) -> Response:
+        snapshot = await self.get()
+        headers = {"ETag": snapshot.etag, "Cache-Control": "private, no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, snapshot.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "albums": snapshot.albums if snapshot else None,
+            "tracks": snapshot.tracks if snapshot else None,
+            "bytes": len(snapshot.body) if snapshot else None,
+            "etag": snapshot.etag if snapshot else None,
+            "fresh": self._fresh(),
+            "rebuilds": self.rebuilds,
+            "not_modified": self.not_modified
+        }
+
+
+album_catalog = AlbumCatalog()
+
+
+async def _main(root: str, prune: bool):
+    from database import get_database, mongo_connection
+
+    try:
+        db = await get_database()
+        stats = await ingest_library(db, root, prune=prune)
+        print(json.dumps(stats, ensure_ascii=False))
+    finally:
+        await mongo_connection.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from log_config import setup_logging
+
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Ingesta de la biblioteca de música en las colecciones albums y tracks")
+    parser.add_argument("command", choices=["ingest"])
+    parser.add_argument("--dir", default=MUSIC_DIR, help="Biblioteca de música (por defecto, MUSIC_DIR)")
+    parser.add_argument("--prune", action="store_true", help="Borrar las pistas y álbumes cuyos ficheros ya no existen")
+    args = parser.parse_args()
+    asyncio.run(_main(args.dir, args.prune))
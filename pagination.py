@@ -0,0 +1,132 @@
+"""
+Paginación por cursor (keyset) y streaming NDJSON para los endpoints de listado.
+
+En lugar de `.to_list(length=None)` sobre la colección entera, cada página se
+lee con un filtro "después de la última clave vista" sobre un orden indexado,
+con un tamaño máximo de página. El cursor de la página siguiente es opaco
+(base64 de la última clave) y viaja en la cabecera X-Next-Cursor para que el
+cuerpo siga siendo un array JSON.
+
+En modo streaming los documentos se serializan uno a uno desde el cursor de
+Motor como JSON delimitado por saltos de línea, con memoria constante.
+"""
+import base64
+import json
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 200))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 1000))
+# Tamaño aproximado de cada trozo enviado en modo streaming
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def to_json_safe(value):
+    """Convierte ObjectId, datetime y bytes a tipos serializables en JSON"""
+    if isinstance(value, dict):
+        return {k: to_json_safe(v) for k, v in value.items() if not isinstance(v, (bytes, bytearray))}
+    if isinstance(value, list):
+        return [to_json_safe(v) for v in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(doc: dict, sort_fields: list) -> str:
+    key = {}
+    for field, _ in sort_fields:
+        value = doc.get(field)
+        if isinstance(value, ObjectId):
+            key[field] = {"$oid": str(value)}
+        elif isinstance(value, datetime):
+            key[field] = {"$date": value.isoformat()}
+        else:
+            key[field] = value
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_fields: list) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = {}
+        for field, _ in sort_fields:
+            value = raw[field]
+            if isinstance(value, dict) and "$oid" in value:
+                value = ObjectId(value["$oid"])
+            elif isinstance(value, dict) and "$date" in value:
+                value = datetime.fromisoformat(value["$date"])
+            elif isinstance(value, (dict, list)):
+                # Un cursor manipulado no puede colar operadores ($ne, $gt...) en el filtro
+                raise ValueError(f"Valor no escalar en el cursor: {field}")
+            key[field] = value
+        return key
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+
+def keyset_filter(key: dict, sort_fields: list) -> dict:
+    """
+    Filtro "estrictamente después de `key`" para un orden compuesto, p. ej. para
+    [(timestamp, -1), (_id, -1)]:
+        {timestamp < t} OR {timestamp == t AND _id < id}
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort_fields):
+        clause = {prev: key[prev] for prev, _ in sort_fields[:i]}
+        clause[field] = {"$gt" if direction > 0 else "$lt": key[field]}
+        clauses.append(clause)
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def build_query(query: dict, after: str, sort_fields: list) -> dict:
+    if not after:
+        return query
+    after_filter = keyset_filter(decode_cursor(after, sort_fields), sort_fields)
+    return {"$and": [query, after_filter]} if query else after_filter
+
+
+async def paginated_response(collection, query: dict, projection: dict, sort_fields: list,
+                             after: str = None, limit: int = None, transform=None) -> JSONResponse:
+    """Una página como array JSON; el cursor de la siguiente va en X-Next-Cursor"""
+    limit = min(max(1, limit or PAGE_SIZE_DEFAULT), PAGE_SIZE_MAX)
+    cursor = collection.find(build_query(query, after, sort_fields), projection).sort(sort_fields)
+    # Se lee un documento extra para saber si hay página siguiente
+    docs = await cursor.limit(limit + 1).to_list(length=limit + 1)
+
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1], sort_fields)
+
+    items = [to_json_safe(transform(doc) if transform else doc) for doc in docs]
+    return JSONResponse(content=items, headers=headers)
+
+
+def ndjson_response(collection, query: dict, projection: dict, sort_fields: list,
+                    after: str = None, limit: int = None, transform=None) -> StreamingResponse:
+    """Todos los documentos (o `limit`) como NDJSON, leídos por lotes del cursor de Motor"""
+    cursor = collection.find(build_query(query, after, sort_fields), projection).sort(sort_fields).batch_size(500)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    async def generate():
+        chunk = []
+        size = 0
+        async for doc in cursor:
+            line = json.dumps(to_json_safe(transform(doc) if transform else doc), ensure_ascii=False) + "\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= STREAM_CHUNK_BYTES:
+                yield "".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield "".join(chunk)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
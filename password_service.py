@@ -0,0 +1,92 @@
+"""
+Servicio asíncrono de contraseñas.
+
+bcrypt es deliberadamente lento (decenas a cientos de ms por hash) y la
+implementación nativa libera el GIL, así que el hash y la verificación se
+ejecutan en un ThreadPoolExecutor acotado en lugar de bloquear el event loop.
+
+El coste se configura con BCRYPT_ROUNDS. Los hashes generados con otro coste se
+marcan como desactualizados (needs_update) para re-hashearlos tras un login
+correcto.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger("password_service")
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+class PasswordService:
+    def __init__(self, rounds: int = None, max_workers: int = None):
+        self.rounds = rounds or BCRYPT_ROUNDS
+        self.max_workers = max_workers or PASSWORD_WORKERS
+        # min/max_rounds iguales al coste configurado: cualquier otro coste se considera desactualizado
+        self._context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=self.rounds,
+            bcrypt__min_rounds=self.rounds,
+            bcrypt__max_rounds=self.rounds
+        )
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        self._background_tasks = set()
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        if not hashed_password:
+            return False
+        return await self._run(self._context.verify, password, hashed_password)
+
+    def needs_update(self, hashed_password: str) -> bool:
+        """Comprobación barata (sólo parsea el hash) de si el coste está desactualizado"""
+        try:
+            return self._context.needs_update(hashed_password)
+        except ValueError:
+            return False
+
+    def schedule_rehash(self, password: str, store):
+        """
+        Re-hashea la contraseña con el coste actual en segundo plano y llama a
+        `await store(new_hash)` para guardarla, sin retrasar la respuesta del login.
+        """
+        async def rehash():
+            try:
+                new_hash = await self.hash(password)
+                await store(new_hash)
+            except Exception as e:
+                logger.error(f"Error al actualizar el hash de contraseña: {str(e)}")
+
+        task = asyncio.create_task(rehash())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def drain(self):
+        """Espera a que terminen los re-hash pendientes"""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "workers": self.max_workers,
+            "pending_rehash": len(self._background_tasks)
+        }
+
+
+# Instancia global del servicio
+password_service = PasswordService()
@@ -0,0 +1,112 @@
+"""
+Estado de arranque de la aplicación: liveness frente a readiness.
+
+El proceso está "vivo" en cuanto uvicorn acepta conexiones; está "listo" cuando
+los componentes pesados que se inicializan en segundo plano (conexión a MongoDB,
+modelos de dlib precargados en el pool y el índice facial) han terminado. Cada
+componente se marca al completarse y se guardan los tiempos desde que se importó
+este módulo, que es lo primero que hace main.py, para medir el arranque en frío.
+"""
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import HTTPException, status
+
+logger = logging.getLogger("readiness")
+
+# Segundos que se sugieren al cliente (Retry-After) mientras el servicio se inicia
+RETRY_AFTER_S = int(os.getenv("READINESS_RETRY_AFTER_S", 2))
+
+
+def _process_start_offset() -> float:
+    """Segundos entre el arranque del proceso y este import (Linux); 0 si no se puede calcular"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+class Readiness:
+    def __init__(self, components: tuple = ("database", "face_models", "face_index")):
+        self._t0 = time.perf_counter()
+        self._process_offset = _process_start_offset()
+        self.components = components
+        self._ready = {name: False for name in components}
+        self._errors = {}
+        self._marks = {}
+        self._event = asyncio.Event()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    def mark(self, phase: str):
+        """Registra (una sola vez) el instante en que se alcanza una fase del arranque"""
+        if phase not in self._marks:
+            self._marks[phase] = round(self.elapsed(), 3)
+
+    def set_ready(self, component: str, ready: bool = True, error: str = None):
+        was_ready = self.is_ready()
+        self._ready[component] = ready
+        if error:
+            self._errors[component] = error
+        else:
+            self._errors.pop(component, None)
+        if ready:
+            self.mark(f"{component}_ready")
+        if self.is_ready():
+            self.mark("ready")
+            self._event.set()
+            if not was_ready:
+                logger.info(f"Servicio listo: {self.cold_start()}")
+        else:
+            self._event.clear()
+
+    def is_ready(self, *components) -> bool:
+        return all(self._ready.get(name, False) for name in (components or self.components))
+
+    async def wait(self, timeout: float = None) -> bool:
+        """Espera a que todos los componentes estén listos; False si vence el timeout"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def require(self, *components):
+        """Dependencia de FastAPI: 503 con Retry-After mientras los componentes no estén listos"""
+        async def dependency():
+            pending = [name for name in components if not self._ready.get(name, False)]
+            if pending:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail=f"El servicio se está iniciando ({', '.join(pending)}). Intente de nuevo en unos segundos",
+                    headers={"Retry-After": str(RETRY_AFTER_S)}
+                )
+        return dependency
+
+    def cold_start(self) -> dict:
+        """Tiempos de arranque en segundos desde el import de main.py (y desde el inicio del proceso)"""
+        return {
+            "process_to_import_s": round(self._process_offset, 3),
+            **{f"{phase}_s": seconds for phase, seconds in self._marks.items()}
+        }
+
+    def report(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "pid": os.getpid(),
+            "components": dict(self._ready),
+            "errors": dict(self._errors),
+            "uptime_s": round(self.elapsed(), 3),
+            "cold_start": self.cold_start()
+        }
+
+
+# Instancia global del estado de arranque
+readiness = Readiness()
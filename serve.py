@@ -0,0 +1,306 @@
+"""
+Lanzador multiproceso (pre-fork) del servidor.
+
+uvicorn con un solo proceso usa un único núcleo para HTTP y JSON. Este lanzador:
+
+1. Carga los modelos de dlib una sola vez en el proceso maestro (antes de crear
+   ningún hilo) y abre el socket de escucha.
+2. Hace fork de N workers. Cada uno hereda los modelos ya cargados, cuyas páginas
+   se comparten copy-on-write, y crea su propio pool de reconocimiento facial con
+   el método "fork" antes de arrancar hilos, de modo que esos procesos también
+   comparten los modelos del maestro en lugar de cargar una copia cada uno.
+3. Cada worker importa main.py después del fork: su propio cliente de Motor (con
+   MONGO_MAX_POOL_SIZE conexiones), su propio hilo de logging y sus cachés.
+
+Señales del maestro:
+    SIGHUP            recarga ordenada: arranca una generación nueva de workers
+                      (que vuelve a importar main.py), espera --reload-delay
+                      segundos y envía SIGTERM a la anterior, que termina las
+                      peticiones en curso
+    SIGUSR1           escribe en el log la memoria (RSS/PSS/USS) de cada worker
+    SIGTERM / SIGINT  parada ordenada de todos los workers
+
+Uso:
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 2 --face-workers 2 --mongo-max-pool 20
+    kill -HUP <pid del maestro>
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stderr)]
+)
+logger = logging.getLogger("serve")
+
+# Un worker que muere antes de este tiempo se considera un fallo de arranque y se relanza con espera
+MIN_WORKER_LIFETIME_S = 5.0
+
+
+def process_memory(pid: int) -> dict:
+    """RSS, PSS (memoria compartida repartida entre procesos) y USS (privada) en KB; vacío si no se puede leer"""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+    return {
+        "rss_kb": fields.get("Rss", 0),
+        "pss_kb": fields.get("Pss", 0),
+        "uss_kb": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared_kb": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    }
+
+
+def child_pids(pid: int) -> list:
+    """PIDs de los hijos directos de pid (en Linux, recorriendo /proc)"""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def tree_memory(pid: int) -> dict:
+    """Memoria de un worker sumando la de sus procesos de reconocimiento facial"""
+    total = process_memory(pid)
+    face_pids = child_pids(pid)
+    for child in face_pids:
+        for key, value in process_memory(child).items():
+            total[key] = total.get(key, 0) + value
+    total["face_processes"] = len(face_pids)
+    return total
+
+
+def preload_face_models():
+    """Carga los modelos de dlib en el maestro; sin face_recognition los workers los cargan por su cuenta"""
+    start = time.perf_counter()
+    try:
+        from face_worker import _init_worker
+        _init_worker()
+    except ImportError as e:
+        logger.warning(f"No se pudieron precargar los modelos en el maestro: {e}")
+        return
+    logger.info(f"Modelos de reconocimiento facial precargados en el maestro en {time.perf_counter() - start:.2f}s")
+
+
+def create_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, worker_id: int, args):
+    """Cuerpo del proceso hijo: pool facial por fork (antes de crear hilos) y uvicorn sobre el socket compartido"""
+    for signum in (signal.SIGHUP, signal.SIGUSR1, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(signum, signal.SIG_DFL)
+    os.environ["SERVE_WORKER_ID"] = str(worker_id)
+
+    import uvicorn
+    from face_worker import face_pool
+    face_pool.start()
+
+    config = uvicorn.Config(
+        "main:app",
+        log_config=None,  # main.py configura el logging con log_config.setup_logging()
+        access_log=False,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, sock: socket.socket, args):
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> (worker_id, instante de arranque)
+        self.retiring = set()
+        self._next_id = 0
+        self._stopping = False
+        self._reload_requested = False
+        self._report_requested = False
+
+    def spawn(self) -> int:
+        self._next_id += 1
+        worker_id = self._next_id
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, worker_id, self.args)
+            except BaseException:
+                logging.getLogger("serve").exception(f"El worker {worker_id} terminó con error")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = (worker_id, time.monotonic())
+        logger.info(f"Worker {worker_id} arrancado (pid {pid})")
+        return pid
+
+    def _terminate(self, pids, signum=signal.SIGTERM):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def reload(self):
+        """Arranca la nueva generación y retira la anterior cuando ya acepta conexiones"""
+        old = [pid for pid in self.workers if pid not in self.retiring]
+        logger.info(f"Recarga: arrancando {self.args.workers} workers nuevos")
+        for _ in range(self.args.workers):
+            self.spawn()
+        deadline = time.monotonic() + self.args.reload_delay
+        while time.monotonic() < deadline and not self._stopping:
+            self.reap()
+            time.sleep(0.1)
+        logger.info(f"Recarga: retirando {len(old)} workers anteriores")
+        self.retiring.update(old)
+        self._terminate(old)
+
+    def reap(self):
+        """Recoge los workers terminados y relanza los que no se estaban retirando"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker_id, started = self.workers.pop(pid, (None, None))
+            if worker_id is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if pid in self.retiring or self._stopping:
+                self.retiring.discard(pid)
+                logger.info(f"Worker {worker_id} (pid {pid}) terminado")
+                continue
+            logger.error(f"Worker {worker_id} (pid {pid}) terminó inesperadamente con código {code}; relanzando")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_S:
+                time.sleep(1.0)
+            self.spawn()
+
+    def memory_report(self) -> list:
+        rows = [{"process": "master", "pid": os.getpid(), **process_memory(os.getpid())}]
+        for pid, (worker_id, _) in sorted(self.workers.items(), key=lambda item: item[1][0]):
+            rows.append({"process": f"worker {worker_id}", "pid": pid, **tree_memory(pid)})
+        return rows
+
+    def log_memory_report(self):
+        for row in self.memory_report():
+            logger.info(f"Memoria: {row}")
+
+    def install_signals(self):
+        def on_stop(signum, frame):
+            self._stopping = True
+
+        def on_reload(signum, frame):
+            self._reload_requested = True
+
+        def on_report(signum, frame):
+            self._report_requested = True
+
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+        signal.signal(signal.SIGHUP, on_reload)
+        signal.signal(signal.SIGUSR1, on_report)
+
+    def run(self):
+        self.install_signals()
+        for _ in range(self.args.workers):
+            self.spawn()
+        while not self._stopping:
+            if self._reload_requested:
+                self._reload_requested = False
+                self.reload()
+            if self._report_requested:
+                self._report_requested = False
+                self.log_memory_report()
+            self.reap()
+            time.sleep(0.2)
+        self.stop()
+
+    def stop(self):
+        logger.info(f"Deteniendo {len(self.workers)} workers")
+        self._terminate(list(self.workers))
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        if self.workers:
+            logger.warning(f"Forzando la parada de {len(self.workers)} workers")
+            self._terminate(list(self.workers), signal.SIGKILL)
+            while self.workers:
+                pid, _ = os.waitpid(-1, 0)
+                self.workers.pop(pid, None)
+        self.sock.close()
+
+
+def configure_environment(args):
+    """Variables que leen los módulos de la app al importarse en cada worker"""
+    cpus = os.cpu_count() or 1
+    os.environ.setdefault("FACE_WORKERS", str(args.face_workers or max(1, cpus // args.workers)))
+    os.environ["FACE_WORKER_START_METHOD"] = args.face_start_method
+    if args.workers > 1:
+        # La caché de usuarios y el índice facial son por worker (ver user_sync.py)
+        os.environ.setdefault("USER_CACHE_CHANGE_STREAM", "true")
+    if args.mongo_max_pool is not None:
+        os.environ["MONGO_MAX_POOL_SIZE"] = str(args.mongo_max_pool)
+    if args.mongo_min_pool is not None:
+        os.environ["MONGO_MIN_POOL_SIZE"] = str(args.mongo_min_pool)
+
+
+def main(args):
+    configure_environment(args)
+    if args.face_start_method == "fork":
+        preload_face_models()
+    sock = create_socket(args.host, args.port, args.backlog)
+    logger.info(
+        f"Maestro {os.getpid()} escuchando en {args.host}:{args.port} con {args.workers} workers "
+        f"(FACE_WORKERS={os.environ['FACE_WORKERS']} y MONGO_MAX_POOL_SIZE={os.getenv('MONGO_MAX_POOL_SIZE', 10)} por worker)"
+    )
+    Master(sock, args).run()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--face-workers", type=int, help="Procesos de reconocimiento facial por worker (por defecto: núcleos / workers)")
+    parser.add_argument("--face-start-method", default="fork", choices=["fork", "spawn", "forkserver"],
+                        help="'fork' comparte los modelos precargados en el maestro")
+    parser.add_argument("--mongo-max-pool", type=int, help="MONGO_MAX_POOL_SIZE de cada worker")
+    parser.add_argument("--mongo-min-pool", type=int, help="MONGO_MIN_POOL_SIZE de cada worker")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Segundos para terminar las peticiones en curso al parar")
+    parser.add_argument("--reload-delay", type=float, default=10.0, help="Segundos que convive la generación nueva con la anterior en una recarga")
+    return parser
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
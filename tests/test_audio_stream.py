@@ -0,0 +1,61 @@
+import pytest
+
+from audio_stream import RangeNotSatisfiable, etag_matches, parse_range
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-199", (100, 199)),
+    ("bytes=0-0", (0, 0)),
+    ("bytes=900-5000", (900, 999)),          # el fin se recorta al tamaño
+    ("bytes=500-", (500, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),               # sufijo mayor que el fichero: entero
+    (" Bytes = 10-19", (10, 19)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    "items=0-10",                            # otra unidad
+    "bytes=0-10,20-30",                      # varios rangos: se envía el fichero entero
+    "bytes=10",
+    "bytes=a-b",
+    "bytes=200-100",                         # fin anterior al inicio
+])
+def test_parse_range_ignored(header):
+    assert parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header,size", [
+    ("bytes=1000-", SIZE),
+    ("bytes=1000-1100", SIZE),
+    ("bytes=-0", SIZE),
+    ("bytes=0-", 0),
+    ("bytes=0-0", 0),
+    ("bytes=-10", 0),
+])
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+
+ETAG = '"3e8-17a"'
+
+
+@pytest.mark.parametrize("header,expected", [
+    (ETAG, True),
+    (f"W/{ETAG}", True),
+    (f'"otro", {ETAG}', True),
+    ("*", True),
+    ('"otro"', False),
+    ('"3e8-17b"', False),
+    ("3e8-17a", False),                      # sin comillas no es el mismo ETag
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, ETAG) is expected
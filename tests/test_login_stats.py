@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from login_stats import LoginRollups, backfill_start, truncate
+
+SINCE = datetime(2026, 5, 14, 10, 37, 42, 123456)
+
+
+@pytest.mark.parametrize("granularity,expected", [
+    ("minute", datetime(2026, 5, 14, 10, 37)),
+    ("hour", datetime(2026, 5, 14, 10, 0)),
+    ("day", datetime(2026, 5, 14)),
+])
+def test_backfill_start_is_bucket_aligned(granularity, expected):
+    assert backfill_start(SINCE, granularity) == expected
+
+
+def test_backfill_start_with_timezone():
+    since = datetime(2026, 5, 14, 12, 15, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+    assert backfill_start(since, "hour") == datetime(2026, 5, 14, 6, 0)
+
+
+class FakeLogs:
+    """Registra los pipelines de agregación en lugar de ejecutarlos"""
+
+    def __init__(self):
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return self
+
+    async def to_list(self, length=None):
+        return []
+
+
+class FakeRollups:
+    def __init__(self, name):
+        self.name = name
+
+    async def count_documents(self, query):
+        return 0
+
+
+def test_backfill_unaligned_since_matches_whole_buckets():
+    rollups = LoginRollups()
+    rollups._totals, rollups._users = FakeRollups("login_rollups"), FakeRollups("login_rollups_users")
+    logs = FakeLogs()
+    asyncio.run(rollups.backfill(logs, SINCE))
+
+    starts = [pipeline[0]["$match"]["timestamp"]["$gte"] for pipeline in logs.pipelines]
+    granularities = [g for g in ("minute", "hour", "day") for _ in range(2)]
+    assert starts == [truncate(SINCE, g) for g in granularities]
@@ -0,0 +1,13 @@
+from bson import ObjectId
+
+from music_catalog import _track_json
+
+
+def test_track_url_is_percent_encoded():
+    track = {"_id": ObjectId(), "path": "Canción #1/01 ¿Qué? 100%.mp3", "title": "¿Qué?"}
+    assert _track_json(track)["url"] == "/api/music/Canci%C3%B3n%20%231/01%20%C2%BFQu%C3%A9%3F%20100%25.mp3"
+
+
+def test_track_url_keeps_plain_paths():
+    track = {"_id": ObjectId(), "path": "rock/01_intro.mp3"}
+    assert _track_json(track)["url"] == "/api/music/rock/01_intro.mp3"
@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from pagination import build_query, decode_cursor, encode_cursor, keyset_filter
+
+LOG_SORT = [("timestamp", -1), ("_id", -1)]
+USER_SORT = [("_id", 1)]
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    doc = {"_id": ObjectId(), "timestamp": datetime(2026, 5, 1, 12, 30, 15, 250000), "username": "ana"}
+    assert decode_cursor(encode_cursor(doc, LOG_SORT), LOG_SORT) == {"timestamp": doc["timestamp"], "_id": doc["_id"]}
+
+
+def test_keyset_filter_for_compound_sort():
+    key = {"timestamp": datetime(2026, 5, 1), "_id": ObjectId()}
+    assert keyset_filter(key, LOG_SORT) == {"$or": [
+        {"timestamp": {"$lt": key["timestamp"]}},
+        {"timestamp": key["timestamp"], "_id": {"$lt": key["_id"]}},
+    ]}
+
+
+def test_build_query_without_cursor():
+    assert build_query({"username": "ana"}, None, LOG_SORT) == {"username": "ana"}
+
+
+@pytest.mark.parametrize("cursor,sort", [
+    ("no-es-base64!!", USER_SORT),
+    (base64.urlsafe_b64encode(b"no es json").decode(), USER_SORT),
+    (raw_cursor(["_id"]), USER_SORT),                                       # no es un objeto
+    (raw_cursor({"otro": 1}), USER_SORT),                                   # falta el campo del orden
+    (raw_cursor({"_id": {"$oid": "no-es-un-objectid"}}), USER_SORT),
+    (raw_cursor({"timestamp": {"$date": "ayer"}, "_id": {"$oid": str(ObjectId())}}), LOG_SORT),
+])
+def test_malformed_cursor_is_rejected(cursor, sort):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor, sort)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("payload", [
+    {"timestamp": {"$ne": None}, "_id": {"$oid": str(ObjectId())}},
+    {"timestamp": {"$date": "2026-05-01T00:00:00"}, "_id": {"$gt": ""}},
+    {"timestamp": ["2026-05-01"], "_id": {"$oid": str(ObjectId())}},
+])
+def test_cursor_cannot_inject_operators(payload):
+    with pytest.raises(HTTPException) as exc:
+        build_query({}, raw_cursor(payload), LOG_SORT)
+    assert exc.value.status_code == 400
@@ -0,0 +1,141 @@
+import asyncio
+import io
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from starlette.requests import Request
+
+from upload_ingest import (
+    CORRUPT_MSG, FORMAT_MSG, ImageHeader, ImageHeaderError, UploadBudget, read_face_upload, sniff_image_header
+)
+
+BOUNDARY = "limite-de-prueba"
+
+
+def encode(fmt: str, size=(120, 80)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (10, 20, 30)).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def multipart_body(image: bytes, filename="rostro.jpg", content_type="image/jpeg") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="username"\r\n\r\n'
+        "usuario\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="face_image"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + image + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(chunks: list, content_length: int = None) -> tuple:
+    """Request de Starlette que entrega el cuerpo por trozos; devuelve también los trozos leídos"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    pending = list(chunks)
+    received = []
+
+    async def receive():
+        chunk = pending.pop(0) if pending else b""
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    scope = {"type": "http", "method": "POST", "path": "/register", "query_string": b"", "headers": headers}
+    return Request(scope, receive), received
+
+
+def read(request: Request, max_bytes: int = 1024 * 1024, budget: UploadBudget = None):
+    return asyncio.run(read_face_upload(request, max_bytes=max_bytes, budget=budget or UploadBudget(64 * 1024 * 1024)))
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_sniff_valid_header(fmt):
+    assert sniff_image_header(encode(fmt)) == ImageHeader(fmt, 120, 80)
+
+
+@pytest.mark.parametrize("fmt,cut", [("JPEG", 1), ("JPEG", 4), ("JPEG", 20), ("PNG", 8), ("PNG", 20)])
+def test_sniff_truncated_header_waits_for_more_bytes(fmt, cut):
+    assert sniff_image_header(encode(fmt)[:cut]) is None
+
+
+@pytest.mark.parametrize("data", [
+    b"GIF89a" + b"\x00" * 32,                                    # otro formato
+    b"\xff\xd8\x00\x00" + b"\x00" * 32,                          # JPEG sin 0xFF antes del marcador
+    b"\xff\xd8\xff\xe0\x00\x01" + b"\x00" * 32,                  # longitud de segmento < 2
+    b"\xff\xd8\xff\xda\x00\x08" + b"\x00" * 32,                  # SOS antes del SOFn
+    b"\xff\xd8\xff\xd9" + b"\x00" * 32,                          # EOI antes del SOFn
+])
+def test_sniff_corrupt_jpeg(data):
+    with pytest.raises(ImageHeaderError):
+        sniff_image_header(data)
+
+
+def test_sniff_corrupt_png():
+    png = encode("PNG")
+    with pytest.raises(ImageHeaderError):
+        sniff_image_header(png[:12] + b"IDAT" + png[16:])
+
+
+def test_upload_valid_image():
+    image = encode("JPEG")
+    budget = UploadBudget(64 * 1024 * 1024)
+    request, _ = make_request([multipart_body(image)])
+    form = read(request, budget=budget)
+    assert form.field("username") == "usuario"
+    assert bytes(form.image.contents) == image
+    assert form.image.header == ImageHeader("JPEG", 120, 80)
+    form.image.release()
+    assert budget.in_use == 0
+
+
+def test_upload_truncated_image_is_corrupt():
+    # Cabecera JPEG incompleta: el formulario termina antes de las dimensiones
+    request, _ = make_request([multipart_body(encode("JPEG")[:20])])
+    with pytest.raises(HTTPException) as exc:
+        read(request)
+    assert exc.value.status_code == 400
+    assert exc.value.detail == CORRUPT_MSG
+
+
+def test_upload_corrupt_image_rejected_before_reading_the_rest():
+    body = multipart_body(b"GIF89a" + b"\x00" * 200_000, filename="rostro.gif", content_type="image/gif")
+    chunks = [body[i:i + 4096] for i in range(0, len(body), 4096)]
+    request, received = make_request(chunks)
+    with pytest.raises(HTTPException) as exc:
+        read(request)
+    assert exc.value.status_code == 400
+    assert exc.value.detail == FORMAT_MSG
+    assert len(received) < len(chunks)
+
+
+def test_upload_oversize_stream_without_content_length():
+    budget = UploadBudget(64 * 1024 * 1024)
+    image = encode("JPEG") + b"\x00" * 200_000
+    body = multipart_body(image)
+    chunks = [body[i:i + 8192] for i in range(0, len(body), 8192)]
+    request, received = make_request(chunks)
+    with pytest.raises(HTTPException) as exc:
+        read(request, max_bytes=64 * 1024, budget=budget)
+    assert exc.value.status_code == 413
+    assert len(received) < len(chunks)
+    assert budget.in_use == 0
+
+
+def test_upload_oversize_content_length_rejected_without_reading():
+    request, received = make_request([b""], content_length=100 * 1024 * 1024)
+    with pytest.raises(HTTPException) as exc:
+        read(request, max_bytes=1024 * 1024)
+    assert exc.value.status_code == 413
+    assert received == []
+
+
+def test_upload_over_global_budget():
+    budget = UploadBudget(16 * 1024)
+    request, _ = make_request([multipart_body(encode("JPEG", size=(400, 400)) + b"\x00" * 32_000)])
+    with pytest.raises(HTTPException) as exc:
+        read(request, budget=budget)
+    assert exc.value.status_code == 503
+    assert budget.in_use == 0
@@ -0,0 +1,34 @@
+from user_cache import UserCache
+
+
+def user(name: str, n: int = 0) -> dict:
+    return {"_id": f"id-{name}", "username": name, "n": n}
+
+
+def test_read_started_before_invalidation_is_not_cached():
+    cache = UserCache(max_entries=10, ttl_seconds=60)
+    version = cache.version("ana")
+    cache.invalidate("ana")
+    cache.put(user("ana"), version=version)
+    assert cache.get("ana") is None
+    cache.put(user("ana", 1), version=cache.version("ana"))
+    assert cache.get("ana")["n"] == 1
+
+
+def test_versions_are_bounded():
+    cache = UserCache(max_entries=5, ttl_seconds=60)
+    for i in range(1000):
+        cache.invalidate(f"usuario{i}")
+    assert len(cache._versions) == 5
+    assert len(cache._entries) == 0
+
+
+def test_evicted_version_never_goes_back():
+    cache = UserCache(max_entries=2, ttl_seconds=60)
+    version = cache.version("ana")
+    cache.invalidate("ana")
+    # Otras invalidaciones desalojan la versión de "ana"
+    cache.invalidate("bea", "carla", "dani")
+    assert "ana" not in cache._versions
+    cache.put(user("ana"), version=version)
+    assert cache.get("ana") is None
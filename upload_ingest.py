@@ -0,0 +1,412 @@
+"""
+Lectura en streaming de los formularios multipart con imagen facial.
+
+Con `UploadFile` FastAPI recibe el cuerpo entero (en memoria o en un fichero
+temporal) antes de que el handler pueda comprobar nada, así que una subida de
+50 MB se almacena completa para después rechazarla. Aquí el cuerpo se lee por
+trozos conforme llega:
+
+- Content-Length mayor que el límite: 413 sin leer el cuerpo.
+- Los bytes de la imagen se acumulan con un tope (UPLOAD_MAX_BYTES) y se calcula
+  su hash a la vez, que la caché de resultados reutiliza.
+- Con los primeros bytes se identifica el formato (firma de JPEG o PNG) y se
+  leen las dimensiones de la cabecera (SOFn o IHDR); una imagen con otro formato,
+  demasiado pequeña o con demasiados píxeles se rechaza con 400 sin leer el resto.
+- Además del tope por petición hay un presupuesto global de bytes en memoria
+  para todas las subidas en curso; si se agota se responde 503 con Retry-After.
+"""
+import hashlib
+import logging
+import os
+import struct
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from starlette.datastructures import Headers
+from starlette.formparsers import parse_options_header
+
+try:
+    import python_multipart as multipart
+except ImportError:  # python-multipart < 0.0.13
+    import multipart
+
+from face_pipeline import ALLOWED_FORMATS, MIN_IMAGE_SIZE
+from metrics import registry, span, start_endpoint
+from readiness import RETRY_AFTER_S
+
+logger = logging.getLogger("upload_ingest")
+
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", 8)) * 1024 * 1024)
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", 40_000_000))
+UPLOAD_INFLIGHT_MAX_BYTES = int(float(os.getenv("UPLOAD_INFLIGHT_MAX_MB", 256)) * 1024 * 1024)
+# Campos de texto del formulario (usuario, contraseña...) y bytes de la cabecera
+# en los que debe aparecer el tamaño de la imagen (los JPEG con EXIF lo llevan detrás)
+UPLOAD_MAX_FIELD_BYTES = 16 * 1024
+UPLOAD_MAX_FIELDS = 16
+SNIFF_MAX_BYTES = 256 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SOI = b"\xff\xd8"
+# Marcadores SOFn con las dimensiones (excluye DHT, JPG y DAC, que comparten rango)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Marcadores sin segmento de longitud (RSTn, TEM)
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+
+upload_rejections = registry.counter(
+    "upload_rejected_total", "Subidas rechazadas mientras se recibían, por endpoint y código de estado"
+)
+
+FORMAT_MSG = "El archivo debe ser una imagen en formato JPEG o PNG"
+CORRUPT_MSG = "La imagen está vacía o corrupta"
+
+
+class ImageHeader(NamedTuple):
+    format: str
+    width: int
+    height: int
+
+
+class ImageHeaderError(ValueError):
+    """Los primeros bytes no corresponden a un JPEG o PNG válido"""
+
+
+def _sniff_png(data: bytes) -> Optional[ImageHeader]:
+    if len(data) < 24:
+        return None
+    length, chunk_type = struct.unpack(">I4s", data[8:16])
+    if chunk_type != b"IHDR" or length != 13:
+        raise ImageHeaderError("PNG sin cabecera IHDR")
+    width, height = struct.unpack(">II", data[16:24])
+    return ImageHeader("PNG", width, height)
+
+
+def _sniff_jpeg(data: bytes) -> Optional[ImageHeader]:
+    position = 2
+    while True:
+        # Cada segmento empieza por 0xFF (con posibles bytes de relleno 0xFF) y el marcador
+        while position < len(data) and data[position] == 0xFF:
+            position += 1
+        if position >= len(data):
+            return None
+        marker = data[position]
+        if data[position - 1] != 0xFF or marker == 0x00:
+            raise ImageHeaderError("JPEG con segmentos corruptos")
+        position += 1
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker in (0xD9, 0xDA):  # EOI o SOS antes del SOFn
+            raise ImageHeaderError("JPEG sin dimensiones antes de los datos")
+        if position + 2 > len(data):
+            return None
+        (length,) = struct.unpack(">H", data[position:position + 2])
+        if length < 2:
+            raise ImageHeaderError("JPEG con un segmento de longitud inválida")
+        if marker in JPEG_SOF_MARKERS:
+            if position + 7 > len(data):
+                return None
+            height, width = struct.unpack(">HH", data[position + 3:position + 7])
+            return ImageHeader("JPEG", width, height)
+        position += length
+
+
+def sniff_image_header(data: bytes) -> Optional[ImageHeader]:
+    """
+    Formato y dimensiones a partir de los primeros bytes de la imagen.
+
+    Devuelve None si todavía no han llegado bytes suficientes y lanza
+    ImageHeaderError si no es un JPEG o PNG válido.
+    """
+    if len(data) < 8:
+        if not (PNG_SIGNATURE.startswith(data[:8]) or JPEG_SOI.startswith(data[:2])):
+            raise ImageHeaderError("Firma de imagen desconocida")
+        return None
+    if data.startswith(PNG_SIGNATURE):
+        return _sniff_png(data)
+    if data.startswith(JPEG_SOI):
+        return _sniff_jpeg(data)
+    raise ImageHeaderError("Firma de imagen desconocida")
+
+
+def validate_header(header: ImageHeader):
+    """Mismas reglas que face_pipeline.open_image, más el límite de píxeles"""
+    if header.format not in ALLOWED_FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=FORMAT_MSG)
+    if header.width < MIN_IMAGE_SIZE or header.height < MIN_IMAGE_SIZE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="La imagen es demasiado pequeña. Debe ser al menos 50x50 píxeles")
+    if header.width * header.height > UPLOAD_MAX_PIXELS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La imagen tiene demasiada resolución (máximo {UPLOAD_MAX_PIXELS // 1_000_000} megapíxeles)"
+        )
+
+
+class UploadBudget:
+    """Bytes de subidas retenidos en memoria por todo el proceso"""
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes or UPLOAD_INFLIGHT_MAX_BYTES
+        self.in_use = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def reserve(self, size: int):
+        if self.in_use + size > self.max_bytes:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Demasiadas subidas simultáneas. Intente de nuevo en unos segundos",
+                headers={"Retry-After": str(RETRY_AFTER_S)}
+            )
+        self.in_use += size
+        self.peak = max(self.peak, self.in_use)
+
+    def release(self, size: int):
+        self.in_use -= size
+
+    def stats(self) -> dict:
+        return {
+            "in_use_mb": round(self.in_use / 1024 / 1024, 3),
+            "peak_mb": round(self.peak / 1024 / 1024, 3),
+            "max_mb": round(self.max_bytes / 1024 / 1024, 3),
+            "rejected": self.rejected
+        }
+
+
+class UploadedImage:
+    """Imagen recibida: bytes (bytearray, sin copia final), hash y cabecera ya validada"""
+
+    def __init__(self, field_name: str, filename: str, content_type: str, budget: UploadBudget, max_bytes: int):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.contents = bytearray()
+        self.header = None
+        self._hasher = hashlib.blake2b(digest_size=20)
+        self._budget = budget
+        self._max_bytes = max_bytes
+
+    def write(self, data: bytes):
+        if len(self.contents) + len(data) > self._max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"La imagen supera el tamaño máximo de {self._max_bytes // (1024 * 1024)} MB"
+            )
+        self._budget.reserve(len(data))
+        self.contents.extend(data)
+        self._hasher.update(data)
+        if self.header is None:
+            self._sniff()
+
+    def _sniff(self):
+        try:
+            header = sniff_image_header(bytes(self.contents[:SNIFF_MAX_BYTES]))
+        except ImageHeaderError as e:
+            logger.warning(f"Subida rechazada ({self.filename}): {e}")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=FORMAT_MSG)
+        if header is None:
+            if len(self.contents) >= SNIFF_MAX_BYTES:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=CORRUPT_MSG)
+            return
+        validate_header(header)
+        self.header = header
+
+    def finish(self):
+        if not self.contents or self.header is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=CORRUPT_MSG)
+
+    @property
+    def digest(self) -> str:
+        return self._hasher.hexdigest()
+
+    @property
+    def size(self) -> int:
+        return len(self.contents)
+
+    def release(self):
+        self._budget.release(len(self.contents))
+        self.contents = bytearray()
+
+
+class FaceUploadForm:
+    """Campos de texto del formulario y la imagen recibida"""
+
+    def __init__(self, fields: dict, image: UploadedImage):
+        self.fields = fields
+        self.image = image
+
+    def field(self, name: str, min_length: int = None, max_length: int = None, default: str = None) -> str:
+        """Valor de un campo con las mismas reglas (y el mismo error 422) que Form(...)"""
+        value = self.fields.get(name, default)
+        loc = ("body", name)
+        if value is None:
+            raise RequestValidationError([{"type": "missing", "loc": loc, "msg": "Field required", "input": None}])
+        if min_length is not None and len(value) < min_length:
+            raise RequestValidationError([{
+                "type": "string_too_short", "loc": loc, "input": value, "ctx": {"min_length": min_length},
+                "msg": f"String should have at least {min_length} characters"
+            }])
+        if max_length is not None and len(value) > max_length:
+            raise RequestValidationError([{
+                "type": "string_too_long", "loc": loc, "input": value, "ctx": {"max_length": max_length},
+                "msg": f"String should have at most {max_length} characters"
+            }])
+        return value
+
+
+class _FormReader:
+    """Callbacks de python-multipart: los campos van a un dict acotado y la imagen a UploadedImage"""
+
+    def __init__(self, image_field: str, budget: UploadBudget, max_bytes: int):
+        self.image_field = image_field
+        self.budget = budget
+        self.max_bytes = max_bytes
+        self.fields = {}
+        self.image = None
+        self._headers = []
+        self._header_name = b""
+        self._header_value = b""
+        self._name = None
+        self._value = None
+        self._target = None
+
+    def on_part_begin(self):
+        self._headers = []
+        self._name = None
+        self._value = bytearray()
+        self._target = None
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers.append((self._header_name.lower(), self._header_value))
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        headers = Headers(raw=self._headers)
+        _, options = parse_options_header(headers.get("content-disposition", ""))
+        if b"name" not in options:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Formulario multipart mal formado")
+        self._name = options[b"name"].decode("utf-8", "replace")
+        if b"filename" not in options:
+            if len(self.fields) >= UPLOAD_MAX_FIELDS:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Demasiados campos en el formulario")
+            return
+        if self._name != self.image_field or self.image is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Sólo se admite un archivo, en el campo {self.image_field}")
+        content_type = headers.get("content-type")
+        if content_type and not content_type.startswith("image/"):
+            logger.warning(f"Tipo de contenido no válido: {content_type}")
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=FORMAT_MSG)
+        self.image = UploadedImage(
+            self._name, options[b"filename"].decode("utf-8", "replace"), content_type, self.budget, self.max_bytes
+        )
+        self._target = self.image
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._target is not None:
+            self._target.write(data[start:end])
+            return
+        if len(self._value) + end - start > UPLOAD_MAX_FIELD_BYTES:
+            raise HTTPException(status_code=413, detail=f"El campo {self._name} es demasiado largo")
+        self._value.extend(data[start:end])
+
+    def on_part_end(self):
+        if self._target is None and self._name is not None:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+
+async def read_face_upload(request: Request, image_field: str = "face_image", max_bytes: int = None, budget: UploadBudget = None) -> FaceUploadForm:
+    """Lee el formulario por trozos, rechazando en cuanto se sabe que la subida no es válida"""
+    max_bytes = max_bytes or UPLOAD_MAX_BYTES
+    budget = budget or upload_budget
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + UPLOAD_MAX_FIELDS * UPLOAD_MAX_FIELD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"La imagen supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB"
+        )
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Se esperaba un formulario multipart/form-data")
+
+    reader = _FormReader(image_field, budget, max_bytes)
+    parser = multipart.MultipartParser(params[b"boundary"], reader.callbacks())
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except HTTPException:
+        if reader.image is not None:
+            reader.image.release()
+        raise
+    except multipart.exceptions.MultipartParseError as e:
+        if reader.image is not None:
+            reader.image.release()
+        logger.warning(f"Formulario multipart mal formado: {e}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Formulario multipart mal formado")
+
+    if reader.image is None:
+        raise RequestValidationError([{"type": "missing", "loc": ("body", image_field), "msg": "Field required", "input": None}])
+    try:
+        reader.image.finish()
+    except HTTPException:
+        reader.image.release()
+        raise
+    return FaceUploadForm(reader.fields, reader.image)
+
+
+def face_upload(endpoint: str, image_field: str = "face_image"):
+    """
+    Dependencia de FastAPI que lee el formulario en streaming y libera el
+    presupuesto de memoria al terminar la petición. Marca además el endpoint para
+    las métricas (sustituye a start_endpoint en el handler).
+    """
+    async def dependency(request: Request):
+        start_endpoint(endpoint)
+        try:
+            with span("read_upload"):
+                form = await read_face_upload(request, image_field)
+        except HTTPException as e:
+            upload_rejections.inc(endpoint=endpoint, status=str(e.status_code))
+            raise
+        logger.debug(f"Imagen recibida: {form.image.filename}, {form.image.header}, {form.image.size} bytes")
+        try:
+            yield form
+        finally:
+            form.image.release()
+    return dependency
+
+
+def multipart_openapi(fields: dict, image_field: str = "face_image") -> dict:
+    """Esquema del cuerpo para /docs, ya que los campos no se declaran con Form/File"""
+    properties = {name: {"type": "string", **schema} for name, schema in fields.items()}
+    properties[image_field] = {"type": "string", "format": "binary"}
+    required = [name for name, schema in fields.items() if "default" not in schema] + [image_field]
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"multipart/form-data": {"schema": {"type": "object", "properties": properties, "required": required}}}
+        }
+    }
+
+
+# Presupuesto global de memoria de las subidas
+upload_budget = UploadBudget()
@@ -0,0 +1,109 @@
+"""
+Caché en proceso de documentos de `usuarios` para get_user.
+
+Guarda los documentos por username con TTL y desalojo LRU por tamaño, leídos con
+una proyección que excluye los campos pesados (la imagen facial). Los caminos de
+escritura invalidan la entrada correspondiente; los cambios hechos por otros
+workers los invalida user_sync.py.
+"""
+import logging
+import os
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("user_cache")
+
+# Campos que nunca se leen en get_user
+USER_PROJECTION = {"face_image": 0}
+
+
+class UserCache:
+    def __init__(self, max_entries: int = None, ttl_seconds: float = None):
+        self.max_entries = max_entries or int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("USER_CACHE_TTL_S", 60))
+        self._entries = OrderedDict()  # username -> (expira, documento)
+        self._usernames_by_id = {}
+        # Versión por username (el número de invalidación global más reciente): una
+        # lectura que empezó antes de una invalidación no debe volver a cachear el
+        # documento antiguo. Se guardan como mucho max_entries; las desalojadas
+        # suben el suelo que devuelve version(), así que nunca vuelven a un valor anterior
+        self._versions = {}
+        self._generation = 0
+        self._version_floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def version(self, username: str) -> int:
+        return self._versions.get(username, self._version_floor)
+
+    def get(self, username: str):
+        """Copia del documento cacheado o None"""
+        entry = self._entries.get(username)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(username)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(username)
+        self.hits += 1
+        return dict(entry[1])
+
+    def put(self, user: dict, version: int = None):
+        username = user.get("username")
+        if username is None:
+            return
+        if version is not None and version != self.version(username):
+            return
+        self._entries[username] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(username)
+        if "_id" in user:
+            self._usernames_by_id[str(user["_id"])] = username
+        while len(self._entries) > self.max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            if "_id" in evicted:
+                self._usernames_by_id.pop(str(evicted["_id"]), None)
+
+    def _drop(self, username: str):
+        entry = self._entries.pop(username, None)
+        if entry is not None and "_id" in entry[1]:
+            self._usernames_by_id.pop(str(entry[1]["_id"]), None)
+
+    def invalidate(self, *usernames):
+        for username in usernames:
+            if username is None:
+                continue
+            self._generation += 1
+            # Reinsertar para mantener el dict ordenado de la invalidación más antigua a la más reciente
+            self._versions.pop(username, None)
+            self._versions[username] = self._generation
+            while len(self._versions) > self.max_entries:
+                oldest = next(iter(self._versions))
+                self._version_floor = self._versions.pop(oldest)
+            self._drop(username)
+            self.invalidations += 1
+
+    def invalidate_id(self, user_id):
+        username = self._usernames_by_id.pop(str(user_id), None)
+        if username is not None:
+            self.invalidate(username)
+
+    def clear(self):
+        for username in list(self._entries):
+            self.invalidate(username)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
+# Instancia global de la caché
+user_cache = UserCache()
@@ -0,0 +1,104 @@
+"""
+Sincronización entre workers de la caché de usuarios y del índice facial.
+
+Con varios workers (serve.py) cada proceso tiene su propia user_cache y su propio
+face_index, y los caminos de escritura sólo actualizan los del worker que atiende
+la petición. Sin sincronizar, un usuario borrado o una contraseña antigua siguen
+autenticando en otro worker hasta USER_CACHE_TTL_S, y un registro o un borrado no
+se ven en /login/face/identify ni en la comprobación de rostros duplicados.
+
+- Con replica set: un change stream de `usuarios` invalida la caché y actualiza
+  el índice en cuanto cambia un documento.
+- Sin replica set (o si el stream se corta): cada USER_SYNC_INTERVAL_S se vacía la
+  caché y se reconcilia el índice con los `_id` de MongoDB. Un cambio de rostro
+  de un usuario existente hecho en otro worker sólo se ve con el change stream
+  (o tras reiniciar).
+
+Se activa con USER_CACHE_CHANGE_STREAM=true; serve.py lo activa con más de un worker.
+"""
+import asyncio
+import logging
+import os
+
+from face_index import face_index
+from user_cache import user_cache
+
+logger = logging.getLogger("user_sync")
+
+USER_SYNC_ENABLED = os.getenv("USER_CACHE_CHANGE_STREAM", "false").lower() in ("1", "true", "yes")
+USER_SYNC_INTERVAL_S = float(os.getenv("USER_SYNC_INTERVAL_S", 10))
+
+
+class UserSync:
+    def __init__(self, interval_seconds: float = None):
+        self.interval_seconds = interval_seconds if interval_seconds is not None else USER_SYNC_INTERVAL_S
+        self._task = None
+        self.mode = None
+        self.changes = 0
+        self.reconciles = 0
+
+    async def _apply(self, collection, change: dict):
+        user_id = change["documentKey"]["_id"]
+        user_cache.invalidate_id(user_id)
+        if change["operationType"] == "delete":
+            face_index.remove(user_id)
+        else:
+            await face_index.refresh(collection, {"_id": user_id})
+        self.changes += 1
+
+    async def _watch(self, collection):
+        self.mode = "change_stream"
+        async with collection.watch(
+            [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        ) as stream:
+            logger.info("Change stream de usuarios activo: caché e índice facial sincronizados entre workers")
+            async for change in stream:
+                await self._apply(collection, change)
+
+    async def _poll(self, collection):
+        self.mode = "polling"
+        logger.info(f"Sincronización de usuarios por sondeo cada {self.interval_seconds}s")
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                user_cache.clear()
+                await face_index.reconcile(collection)
+                self.reconciles += 1
+            except Exception as e:
+                logger.warning(f"Error al reconciliar usuarios: {str(e)}")
+
+    async def _run(self, collection):
+        try:
+            await self._watch(collection)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Los change streams requieren un replica set
+            logger.warning(f"Change stream de usuarios no disponible ({str(e)}); se usa el sondeo")
+        await self._poll(collection)
+
+    def start(self, collection):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(collection))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self._task is not None and not self._task.done(),
+            "mode": self.mode,
+            "changes": self.changes,
+            "reconciles": self.reconciles,
+            "interval_seconds": self.interval_seconds
+        }
+
+
+# Instancia global de la sincronización
+user_sync = UserSync()